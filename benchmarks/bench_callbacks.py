@@ -0,0 +1,155 @@
+"""Benchmarks of the callback hot paths: latency, peak memory and response payload size.
+
+Run from the repository root:
+    python benchmarks/bench_callbacks.py [--days 7] [--edges 2000] [--states 1 2 3] [--repeat 5]
+    python benchmarks/bench_callbacks.py --save baseline.json
+    python benchmarks/bench_callbacks.py --compare baseline.json [--tolerance 0.25]
+
+Everything runs offline in a temporary data folder: the bundled LGA geometry stands in for the full shapefile and
+the Google councils, and the OD flows and Google history are synthetic (see synthetic.py), so results are comparable
+between machines and commits. With --compare the exit status is 1 when a benchmark is slower or sends a larger
+payload than the baseline by more than the tolerance, so it can gate a CI job.
+
+The outbreak-centre and low-risk filters and the highest risk areas chart run in the browser (assets/facebookDisplay.js),
+so for those the cost measured here is the size of the risk store they are computed from.
+"""
+import argparse, json, os, statistics, sys, tempfile, time, tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+
+def payload_size(value):
+    """Size in bytes of a callback return value as Dash would serialise it."""
+    from plotly.io.json import to_json_plotly
+    return len(to_json_plotly(value).encode())
+
+
+def bench(name, function, repeat, setup=None, payload=payload_size):
+    """Times `function` over `repeat` runs after one warm-up run, then measures its peak memory in one more run.
+
+    Args:
+        setup (callable): Called before every run, outside the timing, e.g. to clear a cache.
+        payload (callable): Gives the size in bytes of what is sent to the browser from the result, or None if nothing is.
+
+    Returns:
+        dict: Median and worst latency (s), peak traced memory (bytes) and payload size (bytes).
+    """
+    if setup: setup()
+    result = function()
+    times = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    if setup: setup()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'name': name, 'median': statistics.median(times), 'max': max(times), 'peak_memory': peak,
+            'payload': payload(result) if payload else 0}
+
+
+def run(args):
+    synthetic.offline_environment(tempfile.mkdtemp(prefix='covid_app_bench_'), google_days=args.google_days)
+    synthetic.install_flow_source(edges_per_day=args.edges)
+    from dashApp import facebookFunctions as F, facebookLayout as FL, googleMobilityLayout as GL, googleMobilityFunctions as G
+    from dashApp import riskExport, riskPayload
+    from dashApp.resultCache import ResultCache
+
+    def export_size(store, output_format):
+        # The export is streamed, so the payload is the total of its chunks rather than one response
+        lgas = F.lga_registry()[store['state']]
+        risk_estimate = dict(zip(lgas.codes.tolist(), riskPayload.decode(store, lgas).tolist()))
+        return sum(len(chunk) for chunk in riskExport.export_chunks(risk_estimate, store['state'], output_format))
+
+    end = date(2021, 2, 1)
+    start = end - timedelta(days=args.days - 1)
+    results = []
+
+    def clear_risk_cache():
+        F.risk_cache = ResultCache(max_size=512)
+
+    for state in args.states:
+        label = '%s %dd' % (F.state_acronym_map[state], args.days)
+        codes = F.lga_registry()[state].codes.tolist()
+        locations = codes[:3]
+        F.get_fb_flows(args.time, state, start, end)  # Fills the flow cache so later runs read it like a warm server
+        flows = F.get_fb_flows(args.time, state, start, end)
+        results.append(bench('get_fb_flows %s' % label, lambda: F.get_fb_flows(args.time, state, start, end), args.repeat, payload=None))
+        results.append(bench('get_fb_risk %s' % label, lambda: F.get_fb_risk(flows, locations, state), args.repeat, payload=None))
+        results.append(bench('get_fb_risk general %s' % label, lambda: F.get_fb_risk(flows, [], state), args.repeat, payload=None))
+
+        def risk_store():
+            return FL.risk_store_data(F.get_fb_risk_estimate(args.time, state, locations, start, end), args.time, state, locations, start, end)
+        results.append(bench('risk estimate uncached %s' % label, risk_store, args.repeat, setup=clear_risk_cache))
+        store = risk_store()
+        results.append(bench('risk estimate cached %s' % label, risk_store, args.repeat))
+        results.append(bench('update_choropleth_FB %s' % label, lambda: FL.update_choropleth_FB(store, None)[0], args.repeat))
+        key = dict(FL.update_choropleth_FB(store, None)[1], etag=None)  # The map of another estimate for the same state
+        results.append(bench('update_choropleth_FB patch %s' % label, lambda: FL.update_choropleth_FB(store, key)[0], args.repeat))
+        results.append(bench('update_choropleth_detail_FB zoom 12 %s' % label, lambda: FL.update_choropleth_detail_FB({'mapbox.zoom': 12}, key)[0], args.repeat))
+        for output_format in riskExport.formats:
+            results.append(bench('export %s %s' % (output_format, label), lambda: export_size(store, output_format), args.repeat, payload=int))
+
+    variable = 'workplaces_percent_change_from_baseline'
+    for state in [F.state_fullname_map[state] for state in args.states]:
+        council = G.google_views().choropleth(state, variable, 'baseline').index[0]
+        results.append(bench('Google update_choropleth_FB %s' % state, lambda: GL.update_choropleth_FB('baseline', state, variable, None)[0], args.repeat))
+        key = GL.update_choropleth_FB('baseline', state, variable, None)[1]
+        results.append(bench('Google update_choropleth_FB patch %s' % state, lambda: GL.update_choropleth_FB('difference', state, variable, key)[0], args.repeat))
+        results.append(bench('Google update_time_plot %s' % state, lambda: GL.update_time_plot(council, state, date(2020, 2, 15), variable, [], []), args.repeat))
+        others = G.google_store().state_councils(state)[1:4].tolist()
+        results.append(bench('Google update_time_plot compare %s' % state, lambda: GL.update_time_plot(council, state, date(2020, 2, 15), variable,
+                                                                                                     others, ['median', 'average']), args.repeat))
+    return results
+
+
+def report(results, baseline=None, tolerance=0.25):
+    """Prints the results, and against a baseline marks and counts regressions beyond the tolerance."""
+    baseline = {result['name']: result for result in baseline or []}
+    regressions = 0
+    print('%-48s %10s %10s %12s %12s' % ('Benchmark', 'median ms', 'max ms', 'peak KiB', 'payload KiB'))
+    for result in results:
+        line = '%-48s %10.2f %10.2f %12.1f %12.1f' % (result['name'], result['median']*1000, result['max']*1000,
+                                                       result['peak_memory']/1024, result['payload']/1024)
+        before = baseline.get(result['name'])
+        if before:
+            # Sub-millisecond differences are timer noise rather than regressions
+            slower = result['median'] > before['median']*(1 + tolerance) and result['median'] - before['median'] > 0.001
+            larger = result['payload'] > before['payload']*(1 + tolerance)
+            line += '  %+6.0f%%' % (100*(result['median']/before['median'] - 1))
+            if slower or larger:
+                line += '  REGRESSION'
+                regressions += 1
+        print(line)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=7, help='Days of flows in each risk estimate')
+    parser.add_argument('--edges', type=int, default=2000, help='Synthetic OD edges per day and time slice')
+    parser.add_argument('--states', type=int, nargs='+', default=list(range(1, 8)), help='Facebook state ids (1-7)')
+    parser.add_argument('--time', default='*', help="Time slice: '0000', '0800', '1600' or '*'")
+    parser.add_argument('--google-days', type=int, default=500, help='Days of synthetic Google history')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown or payload growth')
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,77 @@
+"""Startup benchmark: import time per module and time to the first responses.
+
+Run from the repository root:
+    python benchmarks/startup.py [--preload]
+
+Each run uses a fresh interpreter so nothing is already imported. Without --preload the datasets are loaded by the
+first requests that need them (the cold path); with it they are warmed in the background as in production.
+"""
+import json, os, subprocess, sys, time
+
+modules = ['dashApp.params', 'dashApp.server', 'dashApp.facebookFunctions', 'dashApp.facebookLayout',
+           'dashApp.googleMobilityFunctions', 'dashApp.googleMobilityLayout', 'dashApp.allLayouts']
+
+
+def google_choropleth_request():
+    return {'output': '..choropleth_G.figure...choropleth_key_G.data..',
+            'outputs': [{'id': 'choropleth_G', 'property': 'figure'}, {'id': 'choropleth_key_G', 'property': 'data'}],
+            'inputs': [{'id': 'baseline_or_difference_G', 'property': 'value', 'value': 'baseline'},
+                       {'id': 'state_G', 'property': 'value', 'value': 'New South Wales'},
+                       {'id': 'variable_option_G', 'property': 'value', 'value': 'workplaces_percent_change_from_baseline'}],
+            'state': [{'id': 'choropleth_key_G', 'property': 'data', 'value': None}],
+            'changedPropIds': ['state_G.value']}
+
+
+def measure(preload):
+    """Runs inside the fresh interpreter and prints the timings as JSON."""
+    timings = {'imports': {}, 'requests': {}}
+    sys.path.insert(0, '.')
+    import importlib
+    import dashApp.params
+    dashApp.params.preload = preload
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings['imports'][module] = time.perf_counter() - start
+
+    from dashApp.allLayouts import server
+    from dashApp import lazyData
+    client = server.test_client()
+    requests = [('GET /', lambda: client.get('/')),
+                ('GET /_dash-layout', lambda: client.get('/_dash-layout')),
+                ('GET /_dash-dependencies', lambda: client.get('/_dash-dependencies')),
+                ('POST Google choropleth', lambda: client.post('/_dash-update-component', json=google_choropleth_request()))]
+    for name, request in requests:
+        start = time.perf_counter()
+        response = request()
+        timings['requests'][name] = (time.perf_counter() - start, response.status_code)
+    if preload:
+        start = time.perf_counter()
+        lazyData.ready.wait()
+        timings['requests']['wait for /ready'] = (time.perf_counter() - start, 200)
+    timings['datasets'] = lazyData.load_times()
+    print(json.dumps(timings))
+
+
+def report(timings):
+    print('%-45s %10s' % ('Import', 'seconds'))
+    for module, seconds in timings['imports'].items():
+        print('%-45s %10.3f' % (module, seconds))
+    print('%-45s %10.3f' % ('Total import', sum(timings['imports'].values())))
+    print()
+    print('%-45s %10s %6s' % ('First request', 'seconds', 'status'))
+    for name, (seconds, status) in timings['requests'].items():
+        print('%-45s %10.3f %6d' % (name, seconds, status))
+    print()
+    print('%-45s %10s' % ('Dataset loaded', 'seconds'))
+    for name, seconds in timings['datasets'].items():
+        print('%-45s %10.3f' % (name, seconds))
+
+
+if __name__ == '__main__':
+    if '--measure' in sys.argv:
+        measure('--preload' in sys.argv)
+    else:
+        args = [sys.executable, os.path.abspath(__file__), '--measure'] + [a for a in sys.argv[1:] if a == '--preload']
+        result = subprocess.run(args, capture_output=True, text=True, check=True)
+        report(json.loads(result.stdout.strip().splitlines()[-1]))
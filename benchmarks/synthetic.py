@@ -0,0 +1,63 @@
+"""Synthetic data so the benchmarks run offline against the bundled geometry.
+
+offline_environment() must be called before any other dashApp module is imported, as module level paths are built
+from dashApp.params.here.
+"""
+import json, os, shutil
+import numpy as np
+import pandas as pd
+
+repository_data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashApp', 'data')
+google_states = ['New South Wales', 'Northern Territory', 'Queensland', 'South Australia', 'Tasmania', 'Victoria', 'Western Australia']
+google_variables = ['retail_and_recreation_percent_change_from_baseline',
+                    'grocery_and_pharmacy_percent_change_from_baseline',
+                    'parks_percent_change_from_baseline',
+                    'transit_stations_percent_change_from_baseline',
+                    'workplaces_percent_change_from_baseline',
+                    'residential_percent_change_from_baseline']
+
+
+def offline_environment(directory, google_days=500, seed=0):
+    """Creates a data folder from the bundled files plus synthetic data, and points dashApp at it.
+
+    LGA_small_03.geojson stands in for LGA_shapefile.geojson (with synthetic Population and Median Age) and for
+    the Google council polygons; the Google mobility history is random with `google_days` days per council.
+    """
+    import geopandas
+    import dashApp.params
+
+    data = os.path.join(directory, 'data')
+    os.makedirs(data, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    shutil.copy(os.path.join(repository_data, 'lga_name_map.pickle'), data)
+    with open(os.path.join(data, 'server_credentials.json'), 'w') as f:
+        json.dump({'server': '', 'database': '', 'username': '', 'password': '', 'driver': ''}, f)
+
+    lga = geopandas.read_file(os.path.join(repository_data, 'LGA_small_03.geojson'))
+    lga['Population'] = rng.integers(1000, 300000, len(lga))
+    lga['Median Age'] = rng.integers(25, 55, len(lga))
+    lga.to_file(os.path.join(data, 'LGA_shapefile.geojson'), driver='GeoJSON')
+
+    councils = lga[lga.STE_NAME16.isin(google_states)][['STE_NAME16', 'LGA_NAME19', 'geometry']]
+    councils.rename(columns={'STE_NAME16': 'state', 'LGA_NAME19': 'area'}).to_file(os.path.join(data, 'google.gpkg'), driver='GPKG')
+    dates = pd.date_range('2020-02-15', periods=google_days)
+    frames = []
+    for state, council in zip(councils['STE_NAME16'], councils['LGA_NAME19']):
+        frame = pd.DataFrame({'country_region_code': 'AU', 'country_region': 'Australia', 'state': state, 'Council': council, 'date': dates})
+        for variable in google_variables:
+            values = rng.normal(-10, 15, google_days).round()
+            values[rng.random(google_days) < 0.1] = np.nan
+            frame[variable] = values
+        frames.append(frame)
+    pd.concat(frames).to_csv(os.path.join(data, 'google_mobility_australia.csv'), index=False)
+
+    dashApp.params.here = directory
+    dashApp.params.preload = False
+    return directory
+
+
+def install_flow_source(edges_per_day=2000, seed=0):
+    """Replaces the flow source behind the flow cache with a SyntheticSource, so get_fb_data works offline."""
+    from dashApp import facebookFunctions, flowSources
+
+    facebookFunctions.flow_source = flowSources.SyntheticSource(facebookFunctions.region_codes, edges_per_day, seed)
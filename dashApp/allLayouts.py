@@ -1,6 +1,8 @@
 from .server import app, server
 from .facebookLayout import *
 from .googleMobilityLayout import *
+from . import lazyData, riskApi  # riskApi adds the /api/risk/batch endpoint
+from .params import preload
 
 app.layout = html.Div(style={'margin':20}, children = [
     html.Div([html.H1("COVID-19 Risk Mapping")], className="row",  style={'textAlign': "center"}),
@@ -35,5 +37,19 @@ app.layout = html.Div(style={'margin':20}, children = [
     ))),
 ])
 
+# Heavy datasets are loaded lazily; warm them in the background so workers can answer requests straight away.
+# Without preloading a worker is ready at once and loads each dataset on first use.
+if preload:
+    lazyData.preload_in_background()
+else:
+    lazyData.skip_preload()
+
+@server.route('/ready')
+def ready():
+    """Readiness check: 200 once every dataset is loaded (or straight away without preloading), 503 while they are still loading."""
+    if lazyData.ready.is_set():
+        return {'ready': True, 'load_times': lazyData.load_times()}, 200
+    return {'ready': False, 'load_times': lazyData.load_times()}, 503
+
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,106 @@
+// Display-only callbacks for the Facebook tab. These run in the browser so toggling the display options does not
+// make a round trip to the server; the server only sends the risk estimate and the unfiltered map.
+
+// Plotly's sequential 'reds' scale (plotly.colors.sequential.Reds), which update_choropleth_FB in facebookLayout.py
+// sets as the map's coloraxis; the high risk bar chart uses the same colours
+const RISK_COLOURSCALE = ['rgb(255,245,240)', 'rgb(254,224,210)', 'rgb(252,187,161)', 'rgb(252,146,114)',
+    'rgb(251,106,74)', 'rgb(239,59,44)', 'rgb(203,24,29)', 'rgb(165,15,21)', 'rgb(103,0,13)'];
+
+const EMPTY_GRAPH = {
+    layout: {
+        xaxis: {visible: false},
+        yaxis: {visible: false},
+        annotations: [{
+            text: 'Waiting for risk estimate...',
+            xref: 'paper',
+            yref: 'paper',
+            showarrow: false,
+            font: {size: 20}
+        }]
+    }
+};
+
+function logRisk(value) {
+    return Math.log10(value + 1e-10);
+}
+
+// The risk values of a payload from the server (see riskPayload.py): base64 of little-endian float32 in the order of
+// the state's LGA registry
+function decodeRisk(riskStore) {
+    const binary = atob(riskStore.data);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new Float32Array(bytes.buffer);
+}
+
+// Returns a function telling whether a (code, risk) pair should be shown under the display options
+function displayFilter(riskStore, showOutbreakCentres, showLowFlow) {
+    const hideCentres = showOutbreakCentres && showOutbreakCentres.length !== 0 && riskStore.locations.length > 0;
+    const hideLow = showLowFlow && showLowFlow.length !== 0;
+    const centres = new Set(riskStore.locations);
+    return (code, risk) => !(hideCentres && centres.has(code)) && !(hideLow && risk === 0);
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    facebook: {
+        filter_choropleth: function (baseFigure, showOutbreakCentres, showLowFlow, riskStore) {
+            if (!riskStore || !baseFigure || !baseFigure.data) {
+                return EMPTY_GRAPH;
+            }
+            const keep = displayFilter(riskStore, showOutbreakCentres, showLowFlow);
+            const trace = baseFigure.data[0];
+            const rows = trace.locations.map((code, i) => i).filter(i => keep(trace.locations[i], trace.customdata[i][0]));
+
+            const z = rows.map(i => trace.z[i]);
+            const figure = {
+                data: [Object.assign({}, trace, {
+                    locations: rows.map(i => trace.locations[i]),
+                    z: z,
+                    customdata: rows.map(i => trace.customdata[i])
+                })],
+                layout: JSON.parse(JSON.stringify(baseFigure.layout))
+            };
+
+            // This fixes the log colourscale to show the original values
+            if (z.length > 0) {
+                const minVal = Math.min(...z);
+                const maxVal = Math.max(...z);
+                const ticks = [...Array(6).keys()].map(n => Math.round(10 ** (minVal + n * (maxVal - minVal) / 5) * 1e4) / 1e4);
+                const colorbar = figure.layout.coloraxis.colorbar;
+                colorbar.tickvals = ticks.map(logRisk);
+                colorbar.ticktext = ticks.map(String);
+            }
+            return figure;
+        },
+
+        high_risk_areas: function (riskStore, showOutbreakCentres, showLowFlow, registry) {
+            if (!riskStore || !registry) {
+                return EMPTY_GRAPH;
+            }
+            if (registry.state !== riskStore.state || registry.resolution !== riskStore.resolution) {
+                // The names of the new state or resolution have arrived before its estimate
+                return window.dash_clientside.no_update;
+            }
+            const risk = decodeRisk(riskStore);
+            const keep = displayFilter(riskStore, showOutbreakCentres, showLowFlow);
+            const top = registry.codes.map((code, i) => i)
+                .filter(i => keep(registry.codes[i], risk[i]))
+                .sort((a, b) => risk[a] - risk[b])
+                .slice(-10);
+            const x = top.map(i => risk[i]);
+            return {
+                data: [{
+                    type: 'bar',
+                    x: x,
+                    y: top.map(i => registry.names[i]),
+                    orientation: 'h',
+                    hoverinfo: 'skip',
+                    marker: {color: x.map(logRisk), cmin: 0, colorscale: RISK_COLOURSCALE.map((c, n) => [n / (RISK_COLOURSCALE.length - 1), c])}
+                }],
+                layout: {margin: {r: 0, t: 0, l: 0, b: 0}}
+            };
+        }
+    }
+});
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+###############################################################################################################################
+# Time series downsampling
+###############################################################################################################################
+#
+# Line plots are sent to the browser with a fixed number of points per trace, picked with Largest-Triangle-Three-Buckets
+# (Steinarsson, 2013): the series is split into equal buckets and from each the point forming the largest triangle with
+# the point kept before it and the average of the next bucket is kept. Peaks and troughs survive, so a multi-year
+# daily series looks the same at a few hundred points while the payload and render time stay flat as it grows.
+
+
+def lttb(x, y, points):
+	"""Picks the points of a series to plot with Largest-Triangle-Three-Buckets.
+
+    Args:
+        x (array-like): Increasing x values (e.g. day numbers).
+        y (array-like): The values, without NaNs.
+        points (int): Points to keep. Series with no more points than this are kept whole.
+
+    Returns:
+        numpy.ndarray: Positions of the kept points in increasing order, including the first and last.
+    """
+	n = len(x)
+	if points >= n or points < 3:
+		return np.arange(n)
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	# points - 2 buckets share the points between the first and the last, which is a bucket of its own
+	edges = np.append(np.linspace(1, n - 1, points - 1).astype(np.int64), n)
+	# The bucket averages do not depend on the points kept, so only the choice within each bucket is sequential
+	sizes = np.diff(edges)
+	mean_x = np.add.reduceat(x, edges[:-1]) / sizes
+	mean_y = np.add.reduceat(y, edges[:-1]) / sizes
+	kept = np.empty(points, dtype=np.int64)
+	kept[0], kept[-1] = 0, n - 1
+	a = 0
+	for b in range(points - 2):
+		start, end = edges[b], edges[b + 1]
+		areas = np.abs((x[a] - mean_x[b + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[b + 1] - y[a]))
+		a = start + int(areas.argmax())
+		kept[b + 1] = a
+	return kept
@@ -1,62 +1,71 @@
-import geopandas
-import pickle
-import pandas as pd, numpy as np
-from datetime import *
-from .params import here
+import os, pickle
+import pandas as pd
+from .params import here, flow_source as flow_source_setting
+from scipy import sparse
+from . import flowCache, flowCube, flowSources, geometry, metrics, precomputedRisk, riskEngine, sa2Functions, sharedData
+from .lazyData import Lazy
+from .lgaRegistry import LGARegistry
+from .resultCache import ResultCache
 
 
 ###############################################################################################################################
 # Loading in Facebook Data
 ###############################################################################################################################
 
-fake = False  # Use when debugging to avoid calling the server constantly.
-if fake:
-	fake_data = pd.read_csv(here+'/data/FB_sample_data.csv')
+use_cache = True  # Read flows through the local Parquet cache rather than asking the source for every request.
 
-import pyodbc, json
-with open(here+'/data/server_credentials.json', 'r') as f:
-	creds = json.load(f)
+def region_codes(region):
+	"""The LGA codes of a region (e.g. "SA"), in the order of its risk index."""
+	return lga_indexes()[{acronym: state for state, acronym in state_acronym_map.items()}[region]].codes
+
+# Where the OD flows come from (see flowSources). Set params.flow_source to 'synthetic' when debugging to avoid
+# calling the server constantly.
+flow_source = flowSources.create(flow_source_setting, region_codes)
 
 def get_fb_data(time, region, start_date, end_date):
-	"""Collects Origin-Destination flow dataframe from UMelb SQL server.
+	"""Collects Origin-Destination flow dataframe, reading through the local flow cache to the flow source.
 
-    Extended description of function.
+    Only days that are not already held in `data/fb_cache` are read from `flow_source` (by default the UMelb SQL
+    server), so overlapping date ranges are served from local Parquet files.
 
     Args:
-        date (str): Date string in '%Y-%M-%d' (e.g. "2021-01-01")
-        time (str): Choice of time slice between 0000, 0600, 1200 and *. 
+        time (str): Choice of time slice between 0000, 0800, 1600 and *. 
 		region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        start_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-01")
+        end_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-03")
 
     Returns:
         pandas.DataFrame: A dataframe of origin-destination flows in a long format. 
-			Columns are LGA19_source, LGA19_target and n_trips.
+			Columns are LGA19_source, LGA19_target, region and n_trips.
     """
-
-	if fake:  # Use when debugging avoid calling the server constantly.
-		print('Getting fake data')
-		import time
-		time.sleep(2)
-		# date = datetime.strptime(start_date, '%Y-%M-%d').strftime('%-d/%-M/%y')
-		grouped = fake_data.groupby(['LGA19_source', 'LGA19_target', 'region']).sum().reset_index()
-		ODflows = grouped.groupby('region').get_group(region)
-		return ODflows
+	if use_cache:
+		response_dataframe = flowCache.read_through(region, start_date, end_date, time, flow_source)
 	else:
-		time_str = '' if time == '*' else " AND time='%s'" % time
-		with pyodbc.connect('DRIVER='+creds["driver"]+';SERVER='+creds["server"]+';DATABASE='+creds["database"]+';UID='+creds["username"]+';PWD='+ creds["password"]) as conn:
-			query = "SELECT * FROM dbo.FB_LGA19_OD WHERE date>='%s' AND date<='%s' AND region = '%s'%s" % (
-				start_date, end_date, region, time_str)
-			response_dataframe = pd.read_sql_query(query, conn)
-			# print('Query from database: ', start_date, end_date,  time, region, '; Result length = ', len(response_dataframe))
-			response_dataframe = response_dataframe[~response_dataframe.duplicated()]
-			response_dataframe.LGA19_source = pd.to_numeric(response_dataframe.LGA19_source)
-			response_dataframe.LGA19_target = pd.to_numeric(response_dataframe.LGA19_target)
-			response_dataframe['time'] = pd.to_numeric(response_dataframe['time'])
-			# response_dataframe['region'] = pd.to_numeric(response_dataframe['region'])
-			response_dataframe = response_dataframe.groupby(
-				['LGA19_source', 'LGA19_target', 'region']).sum().reset_index()
+		response_dataframe = flow_source.edge_list(region, start_date, end_date, time)
+	response_dataframe['region'] = region
 
 	return response_dataframe
 
+
+def get_fb_flows(time, state, start_date, end_date):
+	"""Collects the OD flows for a state, using the prefix-sum flow cube when it covers the date range.
+
+    Args:
+        time (str): Choice of time slice between 0000, 0800, 1600 and *. 
+		state (int): A value [1,7] that can be used to specify what state is being examined.
+        start_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-01")
+        end_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-03")
+
+    Returns:
+        scipy.sparse.csr_matrix or pandas.DataFrame: Flows summed over the range, either as a matrix aligned to
+			lga_indexes()[state] or as the long dataframe from get_fb_data. Both can be passed to get_fb_risk.
+    """
+	ODmatrix = flowCube.range_matrix(state_acronym_map[state], time, lga_indexes()[state], start_date, end_date)
+	metrics.cache_status('flow_cube', 'miss' if ODmatrix is None else 'hit')
+	if ODmatrix is not None:
+		return ODmatrix
+	return get_fb_data(time, state_acronym_map[state], start_date, end_date)
+
 ##############################################################################################################################
 # Calculating Risk
 ##############################################################################################################################
@@ -64,8 +73,12 @@ def get_fb_data(time, region, start_date, end_date):
 def get_fb_risk(ODflows, locations, state):
 	"""The function used to calculate risk based on the origin destination matrix of flows.
 
+    The flows are placed in a sparse matrix that follows the fixed LGA index of the state (see riskEngine), so only
+    flows within the state are used and the result is always aligned to the same codes.
+
     Args:
         ODflows (pandas.Dataframe): An origin-destination dataframe with counts of individuals moving from one LGA region to another. 
+			A sparse matrix already aligned to lga_indexes()[state] (e.g. from the flow cube) is also accepted.
         locations (list): A list of LGA locations (as int's) that the outbreak simulation should be started from.
 		state (int): A value [0,7] that can be used to specify what state is being examined.
 
@@ -73,34 +86,76 @@ def get_fb_risk(ODflows, locations, state):
         dict: A dictionary of { LGA code : risk estimate } pairs which will be plotted.
 
     """
-	# print('Risk locations:', locations)
+	index = lga_indexes()[state]
+	ODmatrix = ODflows if sparse.issparse(ODflows) else riskEngine.od_matrix(ODflows, index)
 
-	# Keep only flows that are within state
-	ODflows = ODflows[(ODflows.LGA19_source // 10000 == state)  & (ODflows.LGA19_target // 10000 == state)]
-	
-	# Convert to wide format matrix
-	ODmatrix = ODflows.pivot(values = 'n_trips', columns = 'LGA19_target', index ='LGA19_source')
+	# Option set diagonal to 0 
+	# ODmatrix.setdiag(0)
 
-	# Make sure the index is matched
-	ODmatrix = ODmatrix.reindex(sorted(ODmatrix.columns), axis=1)
-	ODmatrix = ODmatrix.sort_index()
+	risk_vector = riskEngine.risk_vector(ODmatrix, index, locations)
+	return dict(zip(index.codes.tolist(), risk_vector.tolist()))
 
-	# Set non-flow edges to 0
-	ODmatrix = ODmatrix.fillna(0) 
 
-	# Option set diagonal to 0 
-	# np.fill_diagonal(ODmatrix.values, 0)
+def get_fb_risk_batch(ODflows, location_sets, state):
+	"""Calculates the risk estimates of many outbreak scenarios over the same flows in one vectorised call.
+
+    The prevalence vectors of all scenarios are stacked into one matrix, so every risk vector comes out of a single
+    matrix-matrix product with the OD matrix.
+
+    Args:
+        ODflows (pandas.Dataframe): Flows as accepted by get_fb_risk (a dataframe or an aligned sparse matrix).
+        location_sets (list): One list of LGA locations (as int's) per scenario. An empty list gives the generalised risk map.
+		state (int): A value [1,7] that can be used to specify what state is being examined.
+
+    Returns:
+        pandas.DataFrame: Risk estimates indexed by LGA code with one column per scenario, in the order given.
+    """
+	index = lga_indexes()[state]
+	ODmatrix = ODflows if sparse.issparse(ODflows) else riskEngine.od_matrix(ODflows, index)
+	return pd.DataFrame(riskEngine.risk_matrix(ODmatrix, index, location_sets), index=pd.Index(index.codes, name='LGA_CODE19'))
+
+
+# The dates selected when the page loads; their generalised risk maps are precomputed with the standard windows
+default_start_date = '2021-02-01'
+default_end_date = '2021-02-03'
+first_flow_date = '2020-05-01'  # The first day the Facebook flows cover
+
+# Risk estimates are memoised on their inputs so repeated scenarios skip both the SQL server and the risk engine.
+# Entries are kept on disk so they survive WSGI process restarts. Estimates that end inside flowCache.settle_days use
+# flows that may still be filling upstream, so they are only kept in memory for a few minutes.
+risk_cache = ResultCache(max_size=512, ttl=7*24*60*60, path=here+'/data/risk_cache', name='risk_estimate')
+recent_risk_cache = ResultCache(max_size=64, ttl=10*60, name='risk_estimate_recent')
 
+def get_fb_risk_estimate(time, state, locations, start_date, end_date, progress=None):
+	"""Collects the flows and calculates the risk estimate for a selection, reusing earlier results for the same inputs.
+
+    Args:
+        time (str): Choice of time slice between 0000, 0800, 1600 and *. 
+		state (int): A value [1,7] that can be used to specify what state is being examined.
+        locations (list): A list of LGA locations (as int's) that the outbreak simulation should be started from.
+        start_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-01")
+        end_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-03")
+        progress (callable): Optional, called with a message as each stage starts.
+
+    Returns:
+        dict: A dictionary of { LGA code : risk estimate } pairs which will be plotted.
+    """
+	locations = locations or []
 	if len(locations) == 0:
-		risk_vector = ODmatrix.sum(axis=0)
-		risk_vector = risk_vector / risk_vector.sum()
-		risk_vector = dict(zip(ODmatrix.index, risk_vector))
-	else:
-		p = np.array([1 if loc in locations else 0 for loc in ODmatrix.index])  # Prevalence vector
-		risk_vector = np.matmul(ODmatrix.to_numpy(), p)
-		risk_vector = risk_vector / risk_vector.sum() # Normalise risk vector
-		risk_vector = dict(zip(ODmatrix.index, risk_vector))
-	return risk_vector
+		# The generalised map is the same for everyone, so the common selections are computed ahead of time
+		precomputed = precomputedRisk.lookup(state_acronym_map[state], time, start_date, end_date)
+		metrics.cache_status('precomputed_risk', 'miss' if precomputed is None else 'hit')
+		if precomputed is not None:
+			return precomputed
+	key = (state, time, flowCache.to_day(start_date).isoformat(), flowCache.to_day(end_date).isoformat(), frozenset(locations))
+
+	def compute():
+		if progress: progress('Collecting mobility data...')
+		ODflows = get_fb_flows(time, state, start_date, end_date)
+		if progress: progress('Calculating risk...')
+		return get_fb_risk(ODflows, locations, state)
+	cache = risk_cache if flowCache.settled(end_date) else recent_risk_cache
+	return cache.get_or_compute(key, compute)
 
 
 ######################################################################################################################################################################
@@ -125,8 +180,16 @@ state_acronym_map = {4: 'SA', 7: 'NT', 3: 'QLD',
                      5: 'WA', 1: 'NSW', 2: 'VIC', 6: 'TAS'}
 
 # Loading in a dictionary of LGA Codes to Proper Names
-with open(here+"/data/lga_name_map.pickle", "rb") as f:
-	lga_name_map = pickle.load(f)
+def _load_lga_name_map():
+	with open(here+"/data/lga_name_map.pickle", "rb") as f:
+		return pickle.load(f)
+# Only needed to build the LGA registry, so not preloaded once a shared one is published
+lga_name_map = Lazy('LGA name map', _load_lga_name_map, preload=lambda: not sharedData.published('lga_registry'))
+
+# A fixed LGA code to matrix row index for each state, used by the risk engine, taken from the shared LGA registry
+# when one is published
+lga_indexes = sharedData.Shared('LGA indexes', 'lga_registry', lambda arrays, meta: LGARegistry.indexes_from_arrays(arrays),
+	lambda: riskEngine.state_indexes(lga_name_map().keys()))
 
 
 # An empty figure object to show when there is no data
@@ -154,9 +217,48 @@ empty_graph = {
 
 
 # Update Choropleth
-full_geo_df = geopandas.read_file(here+"/data/LGA_shapefile.geojson")
-full_geo_df.id = pd.to_numeric(full_geo_df.id)
-full_geo_df.LGA_CODE19 = pd.to_numeric(full_geo_df.LGA_CODE19)
-full_geo_df.AREASQKM19 = pd.to_numeric(full_geo_df.AREASQKM19)
-full_geo_df.STE_CODE16 = pd.to_numeric(full_geo_df.STE_CODE16)
-full_geo_df = full_geo_df.set_index('id')
+def _load_full_geo_df():
+	import geopandas
+	full_geo_df = geopandas.read_file(here+"/data/LGA_shapefile.geojson")
+	full_geo_df.id = pd.to_numeric(full_geo_df.id)
+	full_geo_df.LGA_CODE19 = pd.to_numeric(full_geo_df.LGA_CODE19)
+	full_geo_df.AREASQKM19 = pd.to_numeric(full_geo_df.AREASQKM19)
+	full_geo_df.STE_CODE16 = pd.to_numeric(full_geo_df.STE_CODE16)
+	return full_geo_df.set_index('id')
+# Only needed to build the attribute table and payloads, so not preloaded once they exist
+full_geo_df = Lazy('LGA geometry', _load_full_geo_df, preload=lambda: not geometry.payloads_ready('lga', state_fullname_map)
+	or (not sharedData.published('lga_registry') and not os.path.exists(geometry.attributes_path)))
+
+
+attribute_columns = ['LGA_CODE19', 'LGA_NAME19', 'STE_CODE16', 'STE_NAME16', 'AREASQKM19', 'Population', 'Median Age']
+
+def _load_lga_attributes():
+	if not os.path.exists(geometry.attributes_path):
+		geometry.write_attributes(pd.DataFrame(full_geo_df()[attribute_columns]))
+	return pd.read_csv(geometry.attributes_path, usecols=attribute_columns).set_index('LGA_CODE19', drop=False)
+# LGA attributes without geometry (see geometry.write_attributes), built from full_geo_df if not yet on disk
+lga_attributes = Lazy('LGA attributes', _load_lga_attributes, preload=lambda: not sharedData.published('lga_registry'))
+
+# Names, attributes and dropdown options of every LGA as arrays aligned to lga_indexes (see lgaRegistry), mapped from
+# the shared copy when the pipeline has published one (see sharedData)
+lga_registry = sharedData.Shared('LGA registry', 'lga_registry', lambda arrays, meta: LGARegistry.from_arrays(arrays, lga_indexes()),
+	lambda: LGARegistry.build(lga_indexes(), lga_name_map(), lga_attributes()))
+
+
+def state_geometry(state, level=geometry.default_level):
+	"""The pre-serialised LGA polygons of a state at a level of detail (see geometry), built from full_geo_df if not yet on disk."""
+	return geometry.load_payload('lga', state, lambda tolerance: geometry.build_payload(
+		full_geo_df()[full_geo_df().STE_CODE16 == state], 'LGA_CODE19', tolerance), level)
+
+
+# The LGA level covers every state; the SA2 level only South Australia, from the AddInsights sample (see sa2Functions)
+resolutions = {'lga': 'Local Government Areas', 'sa2': 'SA2 (South Australia, AddInsights sample)'}
+
+def region_registry(resolution='lga'):
+	"""The registry (lga_registry or sa2Functions.sa2_registry) for a resolution."""
+	return sa2Functions.sa2_registry() if resolution == 'sa2' else lga_registry()
+
+
+def region_geometry(resolution, state, level=geometry.default_level):
+	"""The pre-serialised polygons of a state at a resolution and level of detail."""
+	return sa2Functions.sa2_geometry(level) if resolution == 'sa2' else state_geometry(state, level)
@@ -5,17 +5,15 @@ import dash
 from dash import html, dcc
 from textwrap import dedent as d # For writing markdown text
 import plotly.graph_objs as go
-import plotly.express as px
-import json
-from dash.dependencies import Output, Input, State
+import numpy as np
+from dash.dependencies import Output, Input, State, ClientsideFunction
 from datetime import *
-
-# For downloading csv
-from dash_extensions import Download
-from dash_extensions.snippets import send_data_frame
+from urllib.parse import urlencode
 
 # Import FB UoM Data Collection
 from .facebookFunctions import *
+from .params import background_jobs
+from . import geometry, riskPayload, sa2Functions
 
 
 facebookLayout = html.Div(style={'margin':20}, children = [
@@ -49,10 +47,10 @@ facebookLayout = html.Div(style={'margin':20}, children = [
 						""")),
 					dcc.DatePickerRange(
                         id='date_picker_FB',
-                        min_date_allowed=date(2020, 5, 1),
+                        min_date_allowed=pd.to_datetime(first_flow_date),
                         max_date_allowed=date.today()-timedelta(1),
-                        start_date = pd.to_datetime('2021-02-01'),
-                        end_date= pd.to_datetime('2021-02-03'),
+                        start_date = pd.to_datetime(default_start_date),
+                        end_date= pd.to_datetime(default_end_date),
 						display_format='DD/MM/YY',
 						minimum_nights=0,
                     ),
@@ -101,6 +99,21 @@ facebookLayout = html.Div(style={'margin':20}, children = [
 			),
 		]
 	),
+	html.Div(className="row border border-secondary", style={'textAlign': "center", 'padding-right': '30px', 'padding-left': '30px'},
+		children=[
+			# Resolution picker. SA2 regions are only available for South Australia, from a single sample of AddInsights flows.
+			dcc.Markdown(d("""
+						#### Select Resolution
+						""")),
+			dcc.RadioItems(
+				id='resolution_FB',
+				options=[{'label': label, 'value': value} for value, label in resolutions.items()],
+				value='lga',
+				inline=True,
+				inputStyle={'margin-left': '20px', 'margin-right': '5px'},
+			),
+		]
+	),
 	html.Hr(),
 	html.Div(className="row border border-secondary", style={'textAlign': "center"}, children=
 			dcc.Markdown(d("""
@@ -117,7 +130,7 @@ facebookLayout = html.Div(style={'margin':20}, children = [
 						""")),
 					dcc.Dropdown(
 						id='locations_FB',
-						options= [ {'label':v, 'value':k} for k,v in lga_name_map.items() if k // 10000 == 1],
+						options= [],  # Filled by update_possible_state_locations_FB when the page loads
 						value= [],
 						multi=True,
 						placeholder="Optional -  Select Outbreak Startpoints",
@@ -150,8 +163,11 @@ facebookLayout = html.Div(style={'margin':20}, children = [
 						            'width': '250px', 'height': '60px', 'textAlign': "center", 'horizontalAlign':'center'})
 						]
 				),
-				# Hidden div inside the app that stores the risk values
-				html.Div(id='risk_estimate_variable_FB', style={'display': 'none'}),
+				# Stores inside the app that hold the risk values and the unfiltered map
+				dcc.Store(id='risk_estimate_store_FB'),
+				dcc.Store(id='lga_registry_FB'),
+				dcc.Store(id='choropleth_base_FB'),
+				dcc.Store(id='choropleth_key_FB'),
 				html.Div(id="loading-output_FB")
 			]
 	),
@@ -192,153 +208,166 @@ facebookLayout = html.Div(style={'margin':20}, children = [
 	html.Div(
 		className="row",  style={'textAlign': "center"}, 
 		children=[
-			html.Button("Download Risk Potential as CSV", id="download_button_FB")
+			# The link streams the export from the server (see riskApi), so large files are never held in the page
+			dcc.Dropdown(id='export_format_FB',
+				options=[{'label': 'CSV', 'value': 'csv'}, {'label': 'Parquet', 'value': 'parquet'}, {'label': 'GeoJSON (with boundaries)', 'value': 'geojson'}],
+				value='csv', searchable=False, clearable=False, style={'width': '250px', 'display': 'inline-block', 'verticalAlign': 'middle', 'textAlign': 'left'}),
+			html.A(html.Button("Download Risk Potential"), id="download_link_FB")
 			]
 	),
-	# Element to allow for file download
-	Download(id="download_div_FB"),
 ])
 
 ############################################################################################################################
 # These callbacks are what will make everything interactive
 ############################################################################################################################
 
-# Update location list according to state
-@app.callback(Output('locations_FB', 'options'),
-              [Input('state', 'value')])
-def update_possible_state_locations_FB(state):
-	return [{'label': v, 'value': k} for k, v in lga_name_map.items() if k // 10000 == state]
+# The SA2 level only covers South Australia, so it fixes the state
+@app.callback(Output('state', 'value'), Output('state', 'disabled'), Input('resolution_FB', 'value'))
+def fix_state_for_resolution(resolution):
+	if resolution == 'sa2':
+		return sa2Functions.sa2_state, True
+	return dash.no_update, False
+
+
+# Update location list according to state, and send the codes and names the risk payloads are aligned to once per state
+@app.callback(Output('locations_FB', 'options'), Output('lga_registry_FB', 'data'),
+              [Input('state', 'value'), Input('resolution_FB', 'value')])
+def update_possible_state_locations_FB(state, resolution='lga'):
+	registry = region_registry(resolution)
+	if state not in registry:
+		return dash.no_update, dash.no_update  # Called before the state has been fixed for the resolution
+	lgas = registry[state]
+	return list(lgas.options), {'state': state, 'resolution': resolution, 'codes': lgas.codes.tolist(), 'names': lgas.names.tolist()}
 
 
 # Get new data & run risk estimate on submit
-@app.callback(Output('risk_estimate_variable_FB', 'children'), Input('submit_button_FB', 'n_clicks'), Input('time_option', 'value'), Input('state', 'value'), Input('locations_FB', 'value'), Input('date_picker_FB', 'start_date'), Input('date_picker_FB', 'end_date'))
-def run_risk_estimate(n_clicks, time_option, state, locations_FB, start_date, end_date): 
-	ctx = dash.callback_context
-	if not ctx.triggered:
-		ODflows = get_fb_data(time_option, state_acronym_map[state], start_date, end_date)
-		risk_estimate = get_fb_risk(ODflows, locations_FB, state) 
-		return json.dumps(risk_estimate)
+def risk_estimate_job(set_progress, n_clicks, time_option, state, locations_FB, start_date, end_date, resolution='lga'):
+	if resolution == 'sa2':
+		# The AddInsights sample has no dates or time slices, so the whole sample is used
+		state = sa2Functions.sa2_state
+		risk_estimate = sa2Functions.get_sa2_risk_estimate(locations_FB)
 	else:
-		change_prop_id = ctx.triggered[0]['prop_id'].split('.')[0]
-		if change_prop_id == 'submit_button_FB':
-			ODflows = get_fb_data(time_option, state_acronym_map[state], start_date, end_date)
-			risk_estimate = get_fb_risk(ODflows, locations_FB, state)
-			return json.dumps(risk_estimate)
-		else:
-			return -1
-
-
-@app.callback(Output('choropleth_FB', 'figure'), Input('risk_estimate_variable_FB', 'children'), Input('show_outbreak_centres_FB', 'value'), Input('show_low_flow_FB', 'value'), State('state', 'value'), State('locations_FB','value'))
-def update_choropleth_FB(risk_estimate, show_outbreak_centres_FB, show_low_flow_FB, state, locations_FB):
-	if risk_estimate and (risk_estimate != -1):
-		# Load in risk estimate
-		risk_estimate = json.loads(risk_estimate)
-		risk_estimate = {int(k):v for k,v in risk_estimate.items()}# Fix keys
-
-		# Removing outbreak centres if desired
-		if len(show_outbreak_centres_FB)!=0 and len(locations_FB) > 0:
-			risk_estimate = {k:v for k,v in risk_estimate.items() if int(k) not in locations_FB}
-
-		# Removing 0 flow areas
-		if len(show_low_flow_FB) != 0:
-			risk_estimate = {k:v for k,v in risk_estimate.items() if v != 0}
-
-		# Log transform for colourscale
-		risk_estimate_log = {k:np.log10(v+10**(-10)) for k,v in risk_estimate.items()}
-
-		# Loading in state geopandas 
-		state_geo_df = full_geo_df[full_geo_df.STE_CODE16 == state]
-		state_geo_df = state_geo_df[state_geo_df.LGA_CODE19.apply(
-		    lambda x: x in risk_estimate)]
-		state_geo_df['Log10 Risk Potential'] = [risk_estimate_log[code] for code in state_geo_df.index]
-		state_geo_df['Relative Risk Potential'] = [risk_estimate[code] for code in state_geo_df.index]
+		risk_estimate = get_fb_risk_estimate(time_option, state, locations_FB, start_date, end_date, progress=set_progress)
+	return risk_store_data(risk_estimate, time_option, state, locations_FB, start_date, end_date, resolution)
+
+# Only the submit button starts an estimate (and the page load, for the default one); the scenario is read from the rest
+scenario_ids = [('time_option', 'value'), ('state', 'value'), ('locations_FB', 'value'), ('date_picker_FB', 'start_date'),
+	('date_picker_FB', 'end_date'), ('resolution_FB', 'value')]
+risk_estimate_dependencies = [Output('risk_estimate_store_FB', 'data'), Input('submit_button_FB', 'n_clicks')] + [State(*prop) for prop in scenario_ids]
+
+if background_jobs:
+	# Runs in a worker process while the page polls for progress. Changing the scenario while it runs cancels the job,
+	# since its result would no longer match the inputs.
+	@app.callback(*risk_estimate_dependencies, background=True, progress=Output('loading-output_FB', 'children'),
+		running=[(Output('submit_button_FB', 'disabled'), True, False), (Output('loading-output_FB', 'style'), {}, {'display': 'none'})],
+		cancel=[Input(*prop) for prop in scenario_ids])
+	def run_risk_estimate(set_progress, *inputs):
+		return risk_estimate_job(set_progress, *inputs)
+else:
+	@app.callback(*risk_estimate_dependencies)
+	def run_risk_estimate(*inputs):
+		return risk_estimate_job(None, *inputs)
+
+
+def risk_store_data(risk_estimate, time, state, locations, start_date, end_date, resolution='lga'):
+	"""Packs a risk estimate for the browser as a compact payload (see riskPayload) with the selection it was made for."""
+	return riskPayload.encode(risk_estimate, region_registry(resolution)[state], time=time, state=state, locations=locations or [],
+		start_date=str(start_date), end_date=str(end_date), resolution=resolution)
+
+
+# The full map for a risk estimate. Display filters are then applied in the browser (see assets/facebookDisplay.js).
+# When the state has not changed only the values are sent as a patch; the geometry and layout already in the browser are kept.
+# The key holds the state, resolution, geometry level of detail and the etag of the estimate on the map, so an unchanged
+# estimate sends nothing.
+@app.callback(Output('choropleth_base_FB', 'data'), Output('choropleth_key_FB', 'data'), Input('risk_estimate_store_FB', 'data'), State('choropleth_key_FB', 'data'))
+def update_choropleth_FB(risk_store, choropleth_key):
+	if risk_store:
+		state = risk_store['state']
+		resolution = risk_store['resolution']
+		same_map = bool(choropleth_key) and choropleth_key['state'] == state and choropleth_key['resolution'] == resolution
+		zoom = 9 if resolution == 'sa2' else 8
+		level = choropleth_key['level'] if same_map else geometry.lod_level(zoom)
+		key = {'state': state, 'resolution': resolution, 'level': level, 'etag': risk_store['etag']}
+		if choropleth_key == key:
+			return dash.no_update, dash.no_update
+		lgas = region_registry(resolution)[state]
+
+		# The risk values are in registry order; take the regions of the pre-serialised state geometry
+		state_geo = region_geometry(resolution, state, level)
+		geo_rows, in_registry = lgas.positions(state_geo['ids'])
+		geo_rows = geo_rows[in_registry]
+		codes = lgas.codes[geo_rows].tolist()
+		risk = riskPayload.decode(risk_store, lgas)[geo_rows].astype(np.float64)
+
+		# Log transform for colourscale. Regions with no flows (risk 0) are drawn at the lowest risk on the map, not at
+		# log10(1e-10), which would stretch the colour scale of every state
+		positive = risk[risk > 0]
+		risk_log = np.log10(np.maximum(risk, positive.min() if len(positive) else 0)+10**(-10))
+
+		customdata = np.column_stack((risk, lgas.names[geo_rows].astype(object), lgas.areas[geo_rows], lgas.populations[geo_rows], lgas.median_ages[geo_rows])).tolist()
+
+		if same_map:
+			patch = dash.Patch()
+			patch['data'][0]['locations'] = codes
+			patch['data'][0]['z'] = risk_log.tolist()
+			patch['data'][0]['customdata'] = customdata
+			return patch, key
 
 		# Create plot
-		fig = px.choropleth_mapbox(state_geo_df,
-							geojson=state_geo_df.geometry, 
-							locations=state_geo_df.index, 
-							hover_name='LGA_NAME19',
-                            color='Log10 Risk Potential',
-							color_continuous_scale='reds',
-							center=cbd_lat_longs[state],
-							mapbox_style="carto-positron",
-							zoom=8, opacity=0.8)
-
-		customdata  = np.stack([state_geo_df[col] for col in ["Relative Risk Potential", "LGA_NAME19", "AREASQKM19", "Population", "Median Age"]], axis=-1)
-		fig.update_traces(customdata = customdata, hovertemplate='<b>%{customdata[1]}</b> <br>'+
+		fig = go.Figure(go.Choroplethmapbox(geojson=state_geo['geojson'],
+							locations=codes,
+							z=risk_log.tolist(),
+							coloraxis='coloraxis',
+							marker_opacity=0.8,
+							customdata=customdata,
+							hovertemplate='<b>%{customdata[1]}</b> <br>'+
 										'Relative Risk Potential: %{customdata[0]} <br>'+
 										'Population: %{customdata[3]} <br>'+
 										'Median Age: %{customdata[4]} <br>'+
-										'Area (km^2): %{customdata[2]} <br>')
-
-		# This fixes the log colourscale to show the original values
-		min_vals = min(risk_estimate_log.values())
-		max_vals = max(risk_estimate_log.values())
-		tickvals = [round(n, 4) for n in np.logspace(min_vals, max_vals, num = 6)]
-		ticktext = [str(v) for v in tickvals]
-		tickvals = [np.log10(v+10**(-10)) for v in tickvals]
-
-		coloraxis = fig['layout']['coloraxis']
-		coloraxis['colorbar']['tickvals'] = tickvals
-		coloraxis['colorbar']['ticktext'] = ticktext
-		coloraxis['colorbar']['title']['text'] = "Relative Risk\nPotential"
-
-		fig.update_layout(coloraxis=coloraxis)
-
+										'Area (km^2): %{customdata[2]} <br><extra></extra>'))
+		# uirevision keeps the user's zoom and position while values or levels of detail are patched in
+		fig.update_layout(mapbox_style="carto-positron", mapbox_center=cbd_lat_longs[state], mapbox_zoom=zoom,
+						  coloraxis={'colorscale': 'reds', 'colorbar': {'title': {'text': "Relative Risk\nPotential"}}},
+						  uirevision='%s-%s' % (resolution, state))
 		fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
 
-		return fig
+		return fig.to_dict(), key
 
 	else:
-		return empty_graph
-
-
-# High risk location callback
-@app.callback(Output('high_risk_areas_FB', 'figure'), Input('risk_estimate_variable_FB', 'children'), Input('show_outbreak_centres_FB', 'value'), Input('show_low_flow_FB', 'value'),State('state', 'value'), State('locations_FB','value')) 
-def update_high_risk_areas_FB(risk_estimate, show_outbreak_centres_FB, show_low_flow_FB, state, locations_FB):
-	if risk_estimate and (risk_estimate != -1):
-		risk_estimate = json.loads(risk_estimate)
-		risk_estimate = {int(k):v for k,v in risk_estimate.items()}# Fix keys
-
-		# Removing outbreak centres if desired
-		if len(show_outbreak_centres_FB)!=0 and len(locations_FB) > 0:
-			risk_estimate = {k:v for k,v in risk_estimate.items() if k not in locations_FB}
-
-		# Removing 0 flow areas
-		if len(show_low_flow_FB) != 0:
-			risk_estimate = {k:v for k,v in risk_estimate.items() if v != 0}
-		
-		top_risk_tuples = list(sorted(risk_estimate.items(), key=lambda x: x[1]))[-10:]
-		y = [lga_name_map.get(n, 'Error') for n, r in top_risk_tuples]
-		x = np.array([r for n, r in top_risk_tuples])
-
-		top_risk_tuples_log = [np.log10(v+10**(-10)) for k,v in top_risk_tuples]# Log transform for colourscale
-		
-		fig = go.Figure(data=[go.Bar(x=x, y=y, orientation='h', hoverinfo='skip',
-                               marker=dict(color=top_risk_tuples_log, cmin=0, colorscale='reds'))])
-
-		fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
-
-		return fig
-	else:
-		return empty_graph
-
-
-# Download CSV on Button Press
-@app.callback( Output("download_div_FB", "data"), Input("download_button_FB", "n_clicks"), State('risk_estimate_variable_FB', 'children'), State('state', 'value'))
-def generate_csv(n_clicks, risk_estimate_variable_FB, state):
-	if risk_estimate_variable_FB:
-		risk_estimate = json.loads(risk_estimate_variable_FB)
-		risk_estimate = {int(k): v for k, v in risk_estimate.items()}
-
-		state_geo_df = full_geo_df[full_geo_df.STE_CODE16 == state]
-		state_geo_df = state_geo_df[state_geo_df.LGA_CODE19.apply(
-		    lambda x: x in risk_estimate)]
-		
-		state_geo_df['Risk Potential'] = [risk_estimate[code]
-                                    for code in state_geo_df.index]
-
-		state_geo_df = state_geo_df[["LGA_CODE19","LGA_NAME19",
-                    "STE_NAME16", "AREASQKM19", 'Risk Potential']]
-
-		return send_data_frame(state_geo_df.to_csv, filename="Risk_by_LGA.csv")
\ No newline at end of file
+		# Keep the last map in the browser so the next estimate can be patched onto it
+		return dash.no_update, dash.no_update
+
+
+# Zooming past a level of detail boundary (see geometry.lod_levels) only sends the polygons of the new level
+@app.callback(Output('choropleth_base_FB', 'data', allow_duplicate=True), Output('choropleth_key_FB', 'data', allow_duplicate=True),
+	Input('choropleth_FB', 'relayoutData'), State('choropleth_key_FB', 'data'), prevent_initial_call=True)
+def update_choropleth_detail_FB(relayout_data, choropleth_key):
+	zoom = geometry.zoom_of(relayout_data)
+	if zoom is None or not choropleth_key or geometry.lod_level(zoom) == choropleth_key['level']:
+		return dash.no_update, dash.no_update
+	level = geometry.lod_level(zoom)
+	patch = dash.Patch()
+	patch['data'][0]['geojson'] = region_geometry(choropleth_key['resolution'], choropleth_key['state'], level)['geojson']
+	return patch, dict(choropleth_key, level=level)
+
+
+# Removing outbreak centres and 0 flow areas and fixing the log colourscale ticks happens in the browser
+app.clientside_callback(ClientsideFunction(namespace='facebook', function_name='filter_choropleth'),
+	Output('choropleth_FB', 'figure'), Input('choropleth_base_FB', 'data'), Input('show_outbreak_centres_FB', 'value'), Input('show_low_flow_FB', 'value'), Input('risk_estimate_store_FB', 'data'))
+
+
+# High risk location callback, ranked in the browser
+app.clientside_callback(ClientsideFunction(namespace='facebook', function_name='high_risk_areas'),
+	Output('high_risk_areas_FB', 'figure'), Input('risk_estimate_store_FB', 'data'), Input('show_outbreak_centres_FB', 'value'), Input('show_low_flow_FB', 'value'),
+	Input('lga_registry_FB', 'data'))
+
+
+# Point the download link at the streaming export of the current risk estimate
+@app.callback(Output('download_link_FB', 'href'), Input('risk_estimate_store_FB', 'data'), Input('export_format_FB', 'value'))
+def update_download_link(risk_store, export_format):
+	if risk_store:
+		query = urlencode({'state': risk_store['state'], 'time': risk_store['time'], 'start_date': risk_store['start_date'],
+			'end_date': risk_store['end_date'], 'locations': ','.join(str(code) for code in risk_store['locations']), 'format': export_format,
+			'resolution': risk_store['resolution']})
+		return app.get_relative_path('/export/risk') + '?' + query
+	return None
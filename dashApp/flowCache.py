@@ -0,0 +1,151 @@
+import os, shutil, tempfile
+import pandas as pd
+from datetime import date, timedelta
+from .params import here
+from . import metrics
+
+
+###############################################################################################################################
+# Local read-through cache of daily Facebook OD flows
+###############################################################################################################################
+#
+# Flows are stored one Parquet file per (region, date, time slice):
+#     data/fb_cache/region=<region>/date=<YYYY-MM-DD>/time=<slice>.parquet
+# A `_SUCCESS` file marks a settled day as fully fetched (including days with no flows) so it is never queried again.
+# Days within settle_days of today may still be filling upstream, so they are never marked and are fetched again.
+
+cache_dir = here+'/data/fb_cache'
+flow_columns = ['LGA19_source', 'LGA19_target', 'n_trips']
+settle_days = 3  # Days this recent may still be filling upstream, so they are not marked complete.
+spill_rows = 1000000  # Rows held in memory while ingesting before they are spilled to part files
+
+
+def to_day(value):
+	"""Converts a date picker value ('2021-02-01', '2021-02-01T00:00:00', Timestamp or date) into a date."""
+	return pd.to_datetime(value).date()
+
+
+def date_range(start_date, end_date):
+	"""Lists every day between start_date and end_date inclusive."""
+	start_date, end_date = to_day(start_date), to_day(end_date)
+	return [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+
+
+def settled(day, on=None):
+	"""Whether a day is old enough that its flows will no longer change upstream, as seen on day `on` (default today)."""
+	return to_day(day) < to_day(on or date.today()) - timedelta(days=settle_days)
+
+
+def _day_dir(region, day):
+	return os.path.join(cache_dir, 'region=%s' % region, 'date=%s' % day.strftime('%Y-%m-%d'))
+
+
+def _contiguous_runs(days):
+	"""Groups a sorted list of days into (first, last) runs of consecutive days."""
+	runs = []
+	for day in days:
+		if runs and day - runs[-1][1] == timedelta(days=1):
+			runs[-1][1] = day
+		else:
+			runs.append([day, day])
+	return [tuple(run) for run in runs]
+
+
+def missing_days(region, start_date, end_date):
+	"""Returns the days in the range that are not yet held in the local cache."""
+	return [day for day in date_range(start_date, end_date) if not os.path.exists(os.path.join(_day_dir(region, day), '_SUCCESS'))]
+
+
+def write_day(region, day, flows):
+	"""Writes one day of flows (columns date, time, LGA19_source, LGA19_target, n_trips) into the cache.
+
+    Each time slice is written to its own file. Files are written to a temporary name and moved into place so
+    concurrent WSGI threads never read a half written partition. Slices left from an earlier fetch of the day that
+    are not in `flows` are removed. Only settled days are marked complete.
+    """
+	day_dir = _day_dir(region, day)
+	os.makedirs(day_dir, exist_ok=True)
+	slices = {'time=%s.parquet' % time_slice for time_slice in flows['time'].unique()}
+	for name in os.listdir(day_dir):
+		if name.endswith('.parquet') and name not in slices:
+			os.remove(os.path.join(day_dir, name))
+	for time_slice, slice_flows in flows.groupby('time'):
+		slice_flows = slice_flows.groupby(['LGA19_source', 'LGA19_target'])['n_trips'].sum().reset_index()
+		path = os.path.join(day_dir, 'time=%s.parquet' % time_slice)
+		slice_flows[flow_columns].to_parquet(path + '.tmp', index=False)
+		os.replace(path + '.tmp', path)
+	if settled(day):
+		open(os.path.join(day_dir, '_SUCCESS'), 'w').close()
+
+
+def read_days(region, days, time):
+	"""Reads the cached flows for a set of days and a time slice ('*' for all slices)."""
+	frames = []
+	for day in days:
+		day_dir = _day_dir(region, day)
+		if not os.path.isdir(day_dir):
+			continue
+		for name in os.listdir(day_dir):
+			if name.endswith('.parquet') and (time == '*' or name == 'time=%s.parquet' % time):
+				frames.append(pd.read_parquet(os.path.join(day_dir, name)))
+	if len(frames) == 0:
+		return pd.DataFrame({col: pd.Series(dtype='int64') for col in flow_columns})
+	return pd.concat(frames, ignore_index=True)
+
+
+def ingest(region, first, last, chunks):
+	"""Writes the flows of every day in [first, last] from a stream of chunks into the cache.
+
+    Each chunk (columns date, time, LGA19_source, LGA19_target and n_trips, in any order of days) is split by day
+    and held until `spill_rows` rows are waiting, when they are written out as Parquet part files. Each day is then
+    aggregated and written with write_day, so memory is bounded by spill_rows and one day of flows rather than by the
+    size of the source.
+    """
+	days = {day.strftime('%Y-%m-%d'): day for day in date_range(first, last)}
+	pending, pending_rows, parts = {}, 0, {}
+	spill_dir = None
+	try:
+		for chunk in chunks:
+			for day, day_flows in chunk[chunk['date'].isin(days)].groupby('date'):
+				pending.setdefault(day, []).append(day_flows)
+				pending_rows += len(day_flows)
+			if pending_rows > spill_rows:
+				if spill_dir is None:
+					os.makedirs(cache_dir, exist_ok=True)
+					spill_dir = tempfile.mkdtemp(prefix='ingest_', dir=cache_dir)
+				for day, frames in pending.items():
+					path = os.path.join(spill_dir, '%s_%d.parquet' % (day, len(parts.setdefault(day, []))))
+					pd.concat(frames, ignore_index=True).to_parquet(path, index=False)
+					parts[day].append(path)
+				pending, pending_rows = {}, 0
+		for name, day in days.items():
+			frames = pending.pop(name, []) + [pd.read_parquet(path) for path in parts.get(name, [])]
+			flows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['date', 'time'] + flow_columns)
+			write_day(region, day, flows)
+	finally:
+		if spill_dir is not None:
+			shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def read_through(region, start_date, end_date, time, source):
+	"""Returns the summed OD flows for a date range, only reading `source` for days not already cached.
+
+    Args:
+        region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        start_date (str): First day of the range (inclusive).
+        end_date (str): Last day of the range (inclusive).
+        time (str): Choice of time slice between 0000, 0800, 1600 and *.
+        source (flowSources.FlowSource): Where the missing days are read from, as a stream of chunks of daily
+            flows for every time slice.
+
+    Returns:
+        pandas.DataFrame: Flows summed over the range with columns LGA19_source, LGA19_target and n_trips.
+    """
+	missing = missing_days(region, start_date, end_date)
+	metrics.cache_status('flow_days', 'miss', len(missing))
+	metrics.cache_status('flow_days', 'hit', len(date_range(start_date, end_date)) - len(missing))
+	for first, last in _contiguous_runs(missing):
+		ingest(region, first, last, source.chunks(region, first, last))
+
+	flows = read_days(region, date_range(start_date, end_date), time)
+	return flows.groupby(['LGA19_source', 'LGA19_target'])['n_trips'].sum().reset_index()
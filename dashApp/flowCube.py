@@ -0,0 +1,194 @@
+import os, json
+import numpy as np
+from scipy import sparse
+from datetime import timedelta
+from .params import here
+from . import flowCache
+from .flowCache import to_day
+from .riskEngine import od_matrix
+
+
+###############################################################################################################################
+# Prefix-sum OD cube
+###############################################################################################################################
+#
+# For each region and time slice the cube holds the snapshots C[d], the sum of the OD matrices of every day before day
+# d (C[0] is all zeros). The flows for any [start_date, end_date] are then C[end + 1] - C[start], one subtraction
+# whatever the length of the range.
+#
+# OD matrices are sparse, so a snapshot only keeps the cells (i * n + j) that have had any flow so far. Snapshots are
+# stored in blocks of block_days days, each a float32 .npy file next to a small JSON manifest:
+#     data/fb_cube/<region>/<slice>/manifest.json, data/fb_cube/<region>/<slice>/<block>.npy
+# A block's rows are its cells (int32 cell positions stored bit for bit in the float32 row), the snapshot before its
+# first day split into a float32 high and low part (so their sum is the float64 value), then the flows since that base
+# after each of its days. The deltas cover at most block_days days, so whole trip counts stay exact in float32 while
+# the totals since the origin grow without limit.
+# Blocks are memory mapped, so only the two snapshots that are needed are read from disk. Extending the cube only
+# rewrites its last block, and refreshing the trailing days only rewrites the blocks they fall in.
+
+cube_dir = here+'/data/fb_cube'
+block_days = 28
+cube_format = 2  # Cubes written in another format are rebuilt
+max_cells = 2**31 - 1  # Cell positions are int32, so an index may have at most 46340 regions
+_blocks = {}  # path -> (modified time, memory mapped block)
+
+
+def _slice_name(time):
+	return 'all' if time == '*' else time
+
+
+def _directory(region, time):
+	return os.path.join(cube_dir, region, _slice_name(time))
+
+
+def _block_path(directory, block):
+	return os.path.join(directory, '%d.npy' % block)
+
+
+def load_manifest(region, time):
+	"""Returns the manifest of the cube for a region and time slice, or None if no cube has been built."""
+	try:
+		with open(os.path.join(_directory(region, time), 'manifest.json')) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return None
+
+
+def _load_block(path):
+	modified = os.path.getmtime(path)
+	if path not in _blocks or _blocks[path][0] != modified:
+		_blocks[path] = (modified, np.load(path, mmap_mode='r'))
+	return _blocks[path][1]
+
+
+def _snapshot(directory, d):
+	"""The cells and values of snapshot C[d] (d >= 1)."""
+	block = _load_block(_block_path(directory, (d - 1) // block_days))
+	base = block[1].astype(np.float64) + block[2]
+	return block[0].view(np.int32).astype(np.int64), base + block[3 + (d - 1) % block_days]
+
+
+def _current(manifest, index):
+	return (manifest is not None and manifest.get('format') == cube_format and manifest.get('block_days') == block_days
+		and manifest['codes'] == index.codes.tolist())
+
+
+def range_matrix(region, time, index, start_date, end_date):
+	"""Returns the OD flows summed over a date range from the cube.
+
+    Args:
+        region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        time (str): Choice of time slice between 0000, 0800, 1600 and *.
+        index (riskEngine.RegionIndex): The index the result should follow.
+        start_date (str): First day of the range (inclusive).
+        end_date (str): Last day of the range (inclusive).
+
+    Returns:
+        scipy.sparse.csr_matrix: Flows aligned to index, or None if the cube does not cover the range.
+    """
+	manifest = load_manifest(region, time)
+	if not _current(manifest, index):
+		return None
+	origin = to_day(manifest['origin'])
+	start = (to_day(start_date) - origin).days
+	end = (to_day(end_date) - origin).days
+	if start < 0 or end >= manifest['days'] or start > end:
+		return None
+	directory = _directory(region, time)
+	n = len(index)
+	try:
+		cells, values = _snapshot(directory, end + 1)
+		if start > 0:
+			start_cells, start_values = _snapshot(directory, start)
+			cells, values = np.concatenate([cells, start_cells]), np.concatenate([values, -start_values])
+	except (OSError, IndexError):
+		return None  # The cube is being rebuilt; the flow cache answers meanwhile
+	flows = sparse.coo_matrix((values, (cells // n, cells % n)), shape=(n, n)).tocsr()  # Sums the two snapshots
+	flows.eliminate_zeros()
+	return flows
+
+
+def _write_block(directory, block, cells, base, snapshots):
+	path = _block_path(directory, block)
+	data = np.empty((len(snapshots) + 3, len(cells)), dtype=np.float32)
+	data[0] = cells.astype(np.int32).view(np.float32)  # The bits of the int32 positions, read back with view
+	data[1] = base[cells]
+	data[2] = base[cells] - data[1]
+	data[3:] = np.asarray(snapshots)[:, cells] - base[cells]
+	np.save(path + '.tmp.npy', data)
+	os.replace(path + '.tmp.npy', path)
+
+
+def _complete_in_cache(region):
+	return lambda day: flowCache.settled(day) and not flowCache.missing_days(region, day, day)
+
+
+def build_cube(region, time, index, start_date, end_date, read_day, refresh_days=0, complete=None):
+	"""Creates or extends the cube for a region and time slice so that it covers [start_date, end_date].
+
+    Only days whose flows are final are added: the cube stops before the first day that is not complete, so a day
+    still filling upstream is never frozen into it. An existing cube with the same index that starts on or before
+    start_date is extended from its last day; otherwise it is rebuilt from start_date.
+
+    Args:
+        region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        time (str): Choice of time slice between 0000, 0800, 1600 and *.
+        index (riskEngine.RegionIndex): The index the matrices follow.
+        start_date (str): First day the cube should cover.
+        end_date (str): Last day the cube should cover.
+        read_day (callable): read_day(day) returning a dataframe of that day's flows for this slice with columns
+            LGA19_source, LGA19_target and n_trips.
+        refresh_days (int): Days at the end of an existing cube to read again, e.g. after upstream corrections.
+        complete (callable): complete(day) saying whether a day's flows are final. Defaults to the days the flow
+            cache holds in full and that are past flowCache.settle_days.
+
+    Returns:
+        int: The number of days the cube now covers.
+
+    Raises:
+        ValueError: If the index has more cells than int32 positions can address (see max_cells).
+    """
+	if len(index) ** 2 > max_cells:
+		raise ValueError('An index of %d regions has more cells than a cube can address' % len(index))
+	directory = _directory(region, time)
+	os.makedirs(directory, exist_ok=True)
+	start_date, end_date = to_day(start_date), to_day(end_date)
+	complete = complete or _complete_in_cache(region)
+	n = len(index)
+
+	manifest = load_manifest(region, time)
+	if _current(manifest, index) and to_day(manifest['origin']) <= start_date:
+		origin, kept_days = to_day(manifest['origin']), manifest['days']
+	else:
+		origin, kept_days = start_date, 0
+		for name in os.listdir(directory):
+			os.remove(os.path.join(directory, name))
+
+	# Whole blocks are rewritten, from the block holding the first day to read again
+	first_block = max(kept_days - refresh_days, 0) // block_days
+	running = np.zeros(n * n, dtype=np.float64)
+	if first_block > 0:
+		cells, values = _snapshot(directory, first_block * block_days)
+		running[cells] = values
+	seen = running != 0
+
+	days, block, base, snapshots = first_block * block_days, first_block, running.copy(), []
+	last = (end_date - origin).days
+	while days <= last and complete(origin + timedelta(days=days)):
+		flows = od_matrix(read_day(origin + timedelta(days=days)), index).toarray().ravel()
+		running += flows
+		seen |= flows != 0
+		snapshots.append(running.copy())
+		days += 1
+		if len(snapshots) == block_days:
+			_write_block(directory, block, np.flatnonzero(seen), base, snapshots)
+			block, base, snapshots = block + 1, running.copy(), []
+	if snapshots:
+		_write_block(directory, block, np.flatnonzero(seen), base, snapshots)
+	# A refresh that stops early shortens the cube, since the snapshots after it would follow from the old flows
+
+	with open(os.path.join(directory, 'manifest.json.tmp'), 'w') as f:
+		json.dump({'format': cube_format, 'origin': origin.strftime('%Y-%m-%d'), 'days': days, 'block_days': block_days,
+			'codes': index.codes.tolist()}, f)
+	os.replace(os.path.join(directory, 'manifest.json.tmp'), os.path.join(directory, 'manifest.json'))
+	return days
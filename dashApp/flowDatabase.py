@@ -0,0 +1,186 @@
+import json, os, queue, threading
+from contextlib import contextmanager
+import pandas as pd
+from .params import here
+from .lazyData import Lazy
+from . import metrics
+
+
+###############################################################################################################################
+# Pooled access to the UMelb SQL server
+###############################################################################################################################
+
+def _load_creds():
+	with open(here+'/data/server_credentials.json', 'r') as f:
+		return json.load(f)
+creds = Lazy('Server credentials', _load_creds)
+
+pool_size = 5  # Matches the number of WSGI threads in dash.conf
+batch_size = 5000  # Rows pulled per fetchmany call
+
+
+def _connect():
+	import pyodbc
+	c = creds()
+	return pyodbc.connect('DRIVER='+c["driver"]+';SERVER='+c["server"]+';DATABASE='+c["database"]+';UID='+c["username"]+';PWD='+ c["password"])
+
+
+class ConnectionPool:
+	"""A bounded pool of database connections shared between request threads.
+
+    At most `size` connections are open at once; further callers wait for one to be returned. Connections are
+    opened lazily. A connection whose block raises, or is abandoned part way (e.g. a generator closed before its
+    result set is read), is closed and dropped rather than returned to the pool.
+    """
+
+	def __init__(self, connect, size):
+		self._connect = connect
+		self._idle = queue.LifoQueue()
+		self._slots = threading.BoundedSemaphore(size)
+
+	@contextmanager
+	def connection(self):
+		self._slots.acquire()
+		try:
+			try:
+				conn = self._idle.get_nowait()
+			except queue.Empty:
+				conn = self._connect()
+			try:
+				yield conn
+			except BaseException:
+				try:
+					conn.close()
+				except Exception:
+					pass  # Already broken; the original error is the one worth raising
+				raise
+			else:
+				self._idle.put(conn)
+		finally:
+			self._slots.release()
+
+
+pool = ConnectionPool(_connect, pool_size)
+_inherited = []  # Pools a forked child took over from its parent, never used or freed
+
+
+def _reset_pool():
+	# A forked process (e.g. a background job) must not use the parent's ODBC connections, and must not free them
+	# either: freeing a pyodbc connection rolls back and disconnects the session on the socket the parent still uses.
+	# The inherited pool is kept reachable for the life of the child and it gets a new one.
+	global pool
+	_inherited.append(pool)
+	pool = ConnectionPool(_connect, pool_size)
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def iter_query(query, params, name='query'):
+	"""Runs a parameterised query on a pooled connection, yielding the result in batches of `batch_size` rows.
+
+    The connection is held until the generator is exhausted or closed. The cursor is always closed first; a
+    generator closed before the end of the result set drops its connection rather than returning it to the pool.
+
+    Args:
+        query (str): SQL with `?` placeholders.
+        params (list): Values bound to the placeholders.
+        name (str): Name the query's timing is recorded under (see metrics).
+
+    Yields:
+        pandas.DataFrame: One batch of the result set. An empty result yields one empty dataframe with the columns.
+    """
+	with metrics.timed_query(name) as timing, pool.connection() as conn:
+		cursor = conn.cursor()
+		try:
+			cursor.execute(query, params)
+			columns = [column[0] for column in cursor.description]
+			rows = cursor.fetchmany(batch_size)
+			if not rows:
+				yield pd.DataFrame(columns=columns)
+			while rows:
+				timing['rows'] = timing.get('rows', 0) + len(rows)
+				yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+				rows = cursor.fetchmany(batch_size)
+		finally:
+			cursor.close()
+
+
+def run_query(query, params, name='query'):
+	"""Runs a parameterised query on a pooled connection, fetching the result in batches.
+
+    Args:
+        query (str): SQL with `?` placeholders.
+        params (list): Values bound to the placeholders.
+        name (str): Name the query's timing is recorded under (see metrics).
+
+    Returns:
+        pandas.DataFrame: The result set.
+    """
+	return pd.concat(list(iter_query(query, params, name)), ignore_index=True)
+
+
+# Duplicate rows exist in the source table, so rows are made distinct before any aggregation.
+_distinct_flows = """
+	SELECT DISTINCT CONVERT(varchar(10), date, 23) AS date, time, CAST(LGA19_source AS int) AS LGA19_source,
+		CAST(LGA19_target AS int) AS LGA19_target, n_trips, region
+	FROM dbo.FB_LGA19_OD
+	WHERE date >= ? AND date <= ? AND region = ?"""
+
+daily_flows_query = """
+SELECT date, time, LGA19_source, LGA19_target, SUM(n_trips) AS n_trips
+FROM (%s) AS flows
+GROUP BY date, time, LGA19_source, LGA19_target""" % _distinct_flows
+
+edge_list_query = """
+SELECT LGA19_source, LGA19_target, SUM(n_trips) AS n_trips
+FROM (%s) AS flows
+WHERE time = ? OR ? = '*'
+GROUP BY LGA19_source, LGA19_target""" % _distinct_flows
+
+
+def _numeric_flows(flows):
+	flows.LGA19_source = pd.to_numeric(flows.LGA19_source)
+	flows.LGA19_target = pd.to_numeric(flows.LGA19_target)
+	flows.n_trips = pd.to_numeric(flows.n_trips)
+	return flows
+
+
+def _daily_flows(flows):
+	flows['date'] = flows['date'].astype(str)
+	flows['time'] = flows['time'].astype(str).str.zfill(4)  # Match the time_option values
+	return _numeric_flows(flows)
+
+
+def iter_daily_flows(region, start_date, end_date):
+	"""Streams daily OD flows for every time slice, aggregated on the server, in batches (see fetch_daily_flows)."""
+	for flows in iter_query(daily_flows_query, [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), region], 'daily_flows'):
+		yield _daily_flows(flows)
+
+
+def fetch_daily_flows(region, start_date, end_date):
+	"""Collects daily OD flows for every time slice, aggregated on the server.
+
+    Args:
+        region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        start_date (date): First day to collect (inclusive).
+        end_date (date): Last day to collect (inclusive).
+
+    Returns:
+        pandas.DataFrame: Flows with columns date, time, LGA19_source, LGA19_target and n_trips.
+    """
+	return pd.concat(list(iter_daily_flows(region, start_date, end_date)), ignore_index=True)
+
+
+def fetch_flows(region, start_date, end_date, time):
+	"""Collects the OD edge list summed over a date range and time slice, aggregated on the server.
+
+    Args:
+        region (str): Abbreviation of state (e.g. "SA" or "VIC")
+        start_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-01")
+        end_date (str): Date string in '%Y-%m-%d' (e.g. "2021-01-03")
+        time (str): Choice of time slice between 0000, 0800, 1600 and *.
+
+    Returns:
+        pandas.DataFrame: Flows with columns LGA19_source, LGA19_target and n_trips.
+    """
+	flows = run_query(edge_list_query, [start_date, end_date, region, time, time], 'edge_list')
+	return _numeric_flows(flows)
@@ -0,0 +1,172 @@
+import abc
+import numpy as np
+import pandas as pd
+from . import flowDatabase, riskEngine
+from .flowCache import date_range, to_day
+
+
+###############################################################################################################################
+# OD flow sources
+###############################################################################################################################
+#
+# A flow source streams OD flows as chunks of a common schema
+#     date ('YYYY-MM-DD'), time (slice), LGA19_source, LGA19_target, n_trips
+# which the flow cache ingests day by day (see flowCache.ingest) and the risk engine turns into sparse matrices, so
+# neither depends on where the flows came from. Sources without dates or time slices (such as the AddInsights
+# sample) leave those columns empty; they can be read whole with matrix() but not through the dated flow cache.
+
+flow_schema = ['date', 'time', 'LGA19_source', 'LGA19_target', 'n_trips']
+time_slices = ['0000', '0800', '1600']
+
+
+def normalise(flows):
+	"""Casts a chunk of flows to the common schema's types and column order."""
+	flows = flows.copy()
+	for column in ('date', 'time'):
+		if column not in flows:
+			flows[column] = None
+	if flows['date'].notna().any():
+		flows['date'] = pd.to_datetime(flows['date']).dt.strftime('%Y-%m-%d')
+	if flows['time'].notna().any():
+		flows['time'] = flows['time'].astype(str).str.zfill(4)
+	flows['LGA19_source'] = pd.to_numeric(flows['LGA19_source']).astype(np.int64)
+	flows['LGA19_target'] = pd.to_numeric(flows['LGA19_target']).astype(np.int64)
+	flows['n_trips'] = pd.to_numeric(flows['n_trips'])
+	return flows[flow_schema]
+
+
+class FlowSource(abc.ABC):
+	"""Base class of the flow sources. Subclasses implement chunks()."""
+
+	@abc.abstractmethod
+	def chunks(self, region, start_date, end_date):
+		"""Streams the daily flows of a region for every time slice.
+
+        Args:
+            region (str): Abbreviation of state (e.g. "SA" or "VIC")
+            start_date (date): First day (inclusive).
+            end_date (date): Last day (inclusive).
+
+        Yields:
+            pandas.DataFrame: Flows in flow_schema.
+        """
+
+	def edge_list(self, region, start_date, end_date, time):
+		"""Sums the flows over a date range and time slice ('*' for all slices), one chunk at a time.
+
+        Returns:
+            pandas.DataFrame: Flows with columns LGA19_source, LGA19_target and n_trips.
+        """
+		totals = []
+		for flows in self.chunks(region, to_day(start_date), to_day(end_date)):
+			if time != '*':
+				flows = flows[flows['time'] == time]
+			totals.append(flows.groupby(['LGA19_source', 'LGA19_target'])['n_trips'].sum())
+			if len(totals) > 1:
+				totals = [pd.concat(totals).groupby(level=[0, 1]).sum()]
+		if len(totals) == 0:
+			return pd.DataFrame({column: pd.Series(dtype='int64') for column in flow_schema[2:]})
+		return totals[0].reset_index()
+
+
+class SQLSource(FlowSource):
+	"""Facebook flows from the FB_LGA19_OD table on the UMelb SQL server (see flowDatabase)."""
+
+	def chunks(self, region, start_date, end_date):
+		return flowDatabase.iter_daily_flows(region, start_date, end_date)
+
+	def edge_list(self, region, start_date, end_date, time):
+		# The server can sum the range itself
+		return flowDatabase.fetch_flows(region, start_date, end_date, time)
+
+
+class CSVSource(FlowSource):
+	"""Flows read from a CSV file in chunks of `chunk_rows` rows, so files of any size are read in bounded memory.
+
+    Args:
+        path (str): The CSV file.
+        columns (dict): Optional, { file column : schema column } for files that name their columns differently.
+        region (str): Region of every row, for files without a region column. If neither is given rows are not
+            filtered by region.
+        date, time (str): Date and time slice of every row, for files without those columns.
+        chunk_rows (int): Rows read at a time.
+    """
+
+	def __init__(self, path, columns=None, region=None, date=None, time=None, chunk_rows=200000):
+		self.path = path
+		self.columns = columns or {}
+		self.region = region
+		self.date = date
+		self.time = time
+		self.chunk_rows = chunk_rows
+
+	def chunks(self, region=None, start_date=None, end_date=None):
+		if region is not None and self.region is not None and region != self.region:
+			return
+		days = None if start_date is None else {day.strftime('%Y-%m-%d') for day in date_range(start_date, end_date)}
+		for flows in pd.read_csv(self.path, chunksize=self.chunk_rows):
+			flows = flows.rename(columns=self.columns)
+			if region is not None and 'region' in flows:
+				flows = flows[flows['region'] == region]
+			if self.date is not None:
+				flows['date'] = self.date
+			if self.time is not None:
+				flows['time'] = self.time
+			flows = normalise(flows)
+			if days is not None:
+				flows = flows[flows['date'].isin(days)]
+			if len(flows) > 0:
+				yield flows
+
+
+def addinsights(path, **kwargs):
+	"""An AddInsights export (destGroupId, originGroupId, value) as a CSVSource, e.g. data/example_addinsights_data.csv."""
+	return CSVSource(path, {'originGroupId': 'LGA19_source', 'destGroupId': 'LGA19_target', 'value': 'n_trips'}, **kwargs)
+
+
+class SyntheticSource(FlowSource):
+	"""Random flows for development and benchmarks without the SQL server, reproducible for a given seed.
+
+    Args:
+        region_codes (callable): region_codes(region) returns the LGA codes of a region.
+        edges_per_day (int): Edges drawn per day and time slice; repeated edges are summed.
+        seed (int): Random seed. Each day is drawn from its own generator seeded with the seed and the day, so a day's
+            flows do not depend on the range they were fetched in.
+    """
+
+	def __init__(self, region_codes, edges_per_day=2000, seed=0):
+		self.region_codes = region_codes
+		self.edges_per_day = edges_per_day
+		self.seed = seed
+
+	def chunks(self, region, start_date, end_date):
+		codes = np.asarray(self.region_codes(region))
+		n = self.edges_per_day
+		for day in date_range(start_date, end_date):
+			rng = np.random.default_rng((self.seed, day.toordinal()))
+			frames = []
+			for time_slice in time_slices:
+				# Most trips stay close to home, so weight the diagonal
+				sources = rng.choice(codes, n)
+				targets = np.where(rng.random(n) < 0.3, sources, rng.choice(codes, n))
+				frames.append(pd.DataFrame({'date': day.strftime('%Y-%m-%d'), 'time': time_slice, 'LGA19_source': sources,
+					'LGA19_target': targets, 'n_trips': rng.integers(1, 200, n)}))
+			flows = pd.concat(frames, ignore_index=True)
+			yield flows.groupby(['date', 'time', 'LGA19_source', 'LGA19_target'])['n_trips'].sum().reset_index()
+
+
+def create(setting, region_codes):
+	"""Makes the source named by params.flow_source: 'sql', 'synthetic' or the path of a CSV in flow_schema."""
+	if setting == 'sql':
+		return SQLSource()
+	if setting == 'synthetic':
+		return SyntheticSource(region_codes)
+	return CSVSource(setting)
+
+
+def matrix(chunks, index):
+	"""Sums a stream of flow chunks into one CSR OD matrix aligned to an index, one chunk at a time."""
+	ODmatrix = riskEngine.od_matrix(pd.DataFrame(columns=flow_schema), index)
+	for flows in chunks:
+		ODmatrix = ODmatrix + riskEngine.od_matrix(flows, index)
+	return ODmatrix.tocsr()
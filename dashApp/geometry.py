@@ -0,0 +1,172 @@
+import os, json, sys
+import numpy as np
+from .params import here
+from . import sharedData
+from .lazyData import fork_safe_lock
+
+
+###############################################################################################################################
+# Pre-serialised per-state geometry payloads
+###############################################################################################################################
+#
+# Each state's polygons are written once (by data_updater/build_geometry.py) as a compact GeoJSON
+# FeatureCollection with quantised coordinates and the region id on every feature, at several levels of detail:
+#     data/geometry/<kind>_<state>@<level>.json  ->  {"ids": [...], "geojson": {"type": "FeatureCollection", ...}}
+# The choropleth callbacks hand this straight to go.Choroplethmapbox and only attach the colour values, picking the
+# coarsest level that still looks right at the map's zoom (see lod_level) and patching in another as the user zooms.
+# The files can also be published as the shared "geometry" dataset (see publish_payloads), one array of JSON bytes per
+# file, so every worker reads them from the same mapped pages and none of them needs the source geometry.
+
+geometry_dir = here+'/data/geometry'
+precision = 4  # Decimal places kept on coordinates (about 10m)
+
+# Levels of detail as (simplification tolerance in degrees, zoom the level is used below). Each tolerance is about a
+# pixel at the zoom it ends at, so a statewide view gets a fraction of the vertices of a street level one.
+lod_levels = [(0.01, 7), (0.002, 9), (0.0005, 11), (0.0001, None)]
+default_level = 2  # Used where there is no map zoom, e.g. the GeoJSON export
+_payloads = {}  # (kind, state, level) -> (shared version it was read from, payload)
+_lock = fork_safe_lock(sys.modules[__name__])
+
+
+def _quantise_ring(ring):
+	quantised = []
+	for x, y in ((round(point[0], precision), round(point[1], precision)) for point in ring):
+		if not quantised or quantised[-1] != [x, y]:
+			quantised.append([x, y])
+	return quantised if len(quantised) >= 4 else [[round(p[0], precision), round(p[1], precision)] for p in ring]
+
+
+def quantise_geometry(geometry):
+	"""Rounds the coordinates of a GeoJSON Polygon or MultiPolygon, dropping repeated points."""
+	if geometry['type'] == 'Polygon':
+		coordinates = [_quantise_ring(ring) for ring in geometry['coordinates']]
+	elif geometry['type'] == 'MultiPolygon':
+		coordinates = [[_quantise_ring(ring) for ring in polygon] for polygon in geometry['coordinates']]
+	else:
+		raise ValueError('Unsupported geometry type %s' % geometry['type'])
+	return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def lod_level(zoom):
+	"""The level of detail for a mapbox zoom."""
+	for level, (tolerance, below_zoom) in enumerate(lod_levels):
+		if below_zoom is None or zoom < below_zoom:
+			return level
+
+
+def zoom_of(relayout_data):
+	"""The zoom in a figure's relayoutData, or None if the update did not change it."""
+	return (relayout_data or {}).get('mapbox.zoom')
+
+
+def simplify(geometries, tolerance):
+	"""Simplifies the regions of a state as one coverage, so neighbours keep their shared borders without gaps.
+
+    Falls back to simplifying each polygon on its own (topology preserving) where shapely has no coverage_simplify.
+    """
+	import shapely
+	if hasattr(shapely, 'coverage_simplify'):
+		return shapely.coverage_simplify(geometries.to_numpy(), tolerance)
+	return geometries.simplify(tolerance, preserve_topology=True).to_numpy()
+
+
+def build_payload(geo_df, id_column, tolerance=None):
+	"""Builds the payload for one state from a geopandas dataframe.
+
+    Args:
+        geo_df (geopandas.GeoDataFrame): The state's regions.
+        id_column (str): Column holding the id each feature should carry (e.g. LGA_CODE19 or Council).
+        tolerance (float): Optional simplification tolerance in degrees, applied before quantising.
+
+    Returns:
+        dict: {"ids": [...], "geojson": FeatureCollection} with features in the same order as ids.
+    """
+	geometries = geo_df.geometry
+	if tolerance:
+		geometries = simplify(geometries, tolerance)
+	ids = geo_df[id_column].tolist()
+	features = [{'type': 'Feature', 'id': region_id, 'geometry': quantise_geometry(geometry.__geo_interface__)}
+		for region_id, geometry in zip(ids, geometries)]
+	return {'ids': ids, 'geojson': {'type': 'FeatureCollection', 'features': features}}
+
+
+def payload_path(kind, state, level=default_level):
+	return os.path.join(geometry_dir, '%s_%s@%d.json' % (kind, str(state).replace(' ', '_'), level))
+
+
+def write_payload(kind, state, payload, level=default_level):
+	os.makedirs(geometry_dir, exist_ok=True)
+	path = payload_path(kind, state, level)
+	with open(path + '.tmp', 'w') as f:
+		json.dump(payload, f, separators=(',', ':'))
+	os.replace(path + '.tmp', path)
+
+
+def write_payloads(kind, state, geo_df, id_column):
+	"""Builds and writes every level of detail for a state."""
+	for level, (tolerance, below_zoom) in enumerate(lod_levels):
+		write_payload(kind, state, build_payload(geo_df, id_column, tolerance), level)
+
+
+def _payload_name(kind, state, level):
+	return os.path.basename(payload_path(kind, state, level))[:-len('.json')]
+
+
+def publish_payloads():
+	"""Publishes every payload in geometry_dir as a new version of the shared "geometry" dataset."""
+	arrays = {}
+	for name in sorted(os.listdir(geometry_dir)):
+		if name.endswith('.json'):
+			with open(os.path.join(geometry_dir, name), 'rb') as f:
+				arrays[name[:-len('.json')]] = np.frombuffer(f.read(), dtype=np.uint8)
+	return sharedData.publish('geometry', arrays)
+
+# The published payloads as { name : mapped JSON bytes }, empty until the pipeline publishes them
+shared_payloads = sharedData.Shared('Geometry payloads', 'geometry', lambda arrays, meta: arrays, dict)
+
+
+def payloads_ready(kind, states):
+	"""Whether every level of the states' payloads is published or on disk, so the source geometry is not needed."""
+	published = shared_payloads()
+	return all(_payload_name(kind, state, level) in published or os.path.exists(payload_path(kind, state, level))
+		for state in states for level in range(len(lod_levels)))
+
+
+def load_payload(kind, state, build=None, level=default_level):
+	"""Returns the payload for a state at a level of detail, adding an id -> feature position "index".
+
+    Payloads are parsed once per process, from the shared "geometry" dataset if it has been published or else from
+    disk, and again when a new version is published. If neither has it and `build` is given, build(tolerance) is used
+    to create the file (and it is written for next time).
+    """
+	key = (kind, state, level)
+	published = shared_payloads()
+	version = shared_payloads.version
+	cached = _payloads.get(key)
+	if cached is None or cached[0] != version:
+		with _lock:
+			cached = _payloads.get(key)
+			if cached is None or cached[0] != version:
+				name = _payload_name(kind, state, level)
+				if name in published:
+					payload = json.loads(published[name].tobytes())
+				else:
+					path = payload_path(kind, state, level)
+					if not os.path.exists(path) and build is not None:
+						write_payload(kind, state, build(lod_levels[level][0]), level)
+					with open(path) as f:
+						payload = json.load(f)
+				payload['index'] = {region_id: n for n, region_id in enumerate(payload['ids'])}
+				_payloads[key] = cached = (version, payload)
+	return cached[1]
+
+
+# The same regions' attributes without any geometry, so joins and exports never load the polygons
+attributes_path = os.path.join(geometry_dir, 'lga_attributes.csv')
+
+
+def write_attributes(attributes):
+	"""Writes the LGA attribute table (one row per LGA, no geometry column)."""
+	os.makedirs(geometry_dir, exist_ok=True)
+	attributes.to_csv(attributes_path + '.tmp', index=False)
+	os.replace(attributes_path + '.tmp', attributes_path)
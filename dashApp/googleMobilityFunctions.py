@@ -1,12 +1,22 @@
 import pandas as pd
 import numpy as np
-import geopandas
 from .params import here
+from . import downsample, geometry, googleStore, sharedData
+from .lazyData import Lazy
 
 
 # Update Choropleth
-full_geo_df = geopandas.read_file(here+"/data/google.gpkg")
-full_geo_df = full_geo_df.rename({'area':'Council'}, axis='columns')
+def _load_full_geo_df():
+    import geopandas
+    full_geo_df = geopandas.read_file(here+"/data/google.gpkg")
+    return full_geo_df.rename({'area':'Council'}, axis='columns')
+# Only needed to build the payloads, so not preloaded once they exist
+full_geo_df = Lazy('Google geometry', _load_full_geo_df, preload=lambda: not geometry.payloads_ready('google', states))
+
+def state_geometry(state, level=geometry.default_level):
+    """The pre-serialised council polygons of a state at a level of detail (see geometry), built from full_geo_df if not yet on disk."""
+    return geometry.load_payload('google', state, lambda tolerance: geometry.build_payload(
+        full_geo_df()[full_geo_df().state == state], 'Council', tolerance), level)
 
 # Latitudes and longitudes of major state capitals
 cbd_lat_longs = {
@@ -49,9 +59,19 @@ explainer_variable_mapping = {
     'residential_percent_change_from_baseline':"Mobility trends for places of residence.",
 }
 
-google = pd.read_csv('https://github.com/tobinsouth/CovidMobilityApp/raw/main/dashApp/data/google_mobility_australia.csv',parse_dates=['date'])
-google = google[~google.state.isna()] # Remove Australia wide data
-latest_date = max(google.date) # Get the latest google data in the data
+# Indexed by state, council and date (see googleStore), mapped from the shared copy when the pipeline has published one
+google_store = sharedData.Shared('Google store', 'google_store', googleStore.GoogleStore.from_shared,
+                                 lambda: googleStore.load_store(variables_to_plot))
+# Map values and council histories materialised at ingest
+google_views = sharedData.Shared('Google views', 'google_views', googleStore.GoogleViews.from_shared,
+                                 lambda: googleStore.load_views(google_store()))
+
+max_plot_points = 400  # Points sent per time series trace, however long the history (see downsample)
+
+def plot_points(data, max_points=max_plot_points):
+    """Downsamples a series from google_views() to at most max_points with LTTB, keeping its peaks and troughs."""
+    days = data['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    return data.iloc[downsample.lttb(days, data.iloc[:, 1].to_numpy(), max_points)]
 
 # An empty figure object to show when there is no data
 empty_graph = {
@@ -6,11 +6,12 @@ import dash
 from dash import html, dcc
 from textwrap import dedent as d
 from numpy import empty # For writing markdown text
-import plotly.express as px
+import plotly.graph_objs as go
 from dash.dependencies import Output, Input, State
 from datetime import *
 
 from .googleMobilityFunctions import *
+from . import geometry, googleStore
 
 
 googleLayout = html.Div(style={'margin':20}, children = [
@@ -125,10 +126,26 @@ googleLayout = html.Div(style={'margin':20}, children = [
     #             html.Div(id="loading-output_FB")
     #         ]
     # ),
+    html.Div(className="row border border-secondary", style={'textAlign': "center", 'padding-right': '30px', 'padding-left': '30px', 'max-width':'800px', 'margin':'auto'},  children = [
+            # Councils to overlay on the time plot of the clicked council
+            html.Div(className="six columns",  children = [
+                dcc.Markdown(d("""
+                        #### Compare With
+                        """)),
+                dcc.Dropdown(id='compare_councils_G', multi=True, placeholder='Other councils', className="twelve columns"),
+            ]),
+            html.Div(className="six columns",  children = [
+                dcc.Markdown(d("""
+                        #### Timeline Options
+                        """)),
+                dcc.Checklist(id='time_plot_options_G',
+                            options=[{'label': ' Show the state median', 'value': 'median'},
+                                     {'label': ' Show the %d-day average' % googleStore.rolling_days, 'value': 'average'}],
+                            value=[], className="twelve columns"),
+            ]),
+    ]),
     html.Hr(),
-    html.Div(className="row border border-secondary", style={'textAlign': "center", 'padding-right': '30px', 'padding-left': '30px', 'max-width':'800px', 'margin':'auto'}, id='latest_date_google', 
-    children=dcc.Markdown(d("""##### The latest available Google Mobility Data is from %s""" % latest_date.strftime('%Y-%m-%d')))
-    ),
+    html.Div(className="row border border-secondary", style={'textAlign': "center", 'padding-right': '30px', 'padding-left': '30px', 'max-width':'800px', 'margin':'auto'}, id='latest_date_google'),
     html.Hr(),
     # Plots 
     dcc.Loading(
@@ -142,13 +159,15 @@ googleLayout = html.Div(style={'margin':20}, children = [
                         html.Div(
                             className="seven columns",
                             children=[
-                                dcc.Graph(id="choropleth_G", figure=empty_graph)
+                                dcc.Graph(id="choropleth_G", figure=empty_graph),
+                                dcc.Store(id='choropleth_key_G'),
                             ]
                         ),
                         html.Div(
                             className="five columns",
                             children=[
-                                dcc.Graph(id='change_over_time_G', figure=instruction_graph)
+                                dcc.Graph(id='change_over_time_G', figure=instruction_graph),
+                                dcc.Store(id='selected_council_G'),
                             ]
 
                         ),
@@ -172,52 +191,107 @@ googleLayout = html.Div(style={'margin':20}, children = [
 def updated_description(variable_option_G):
     return "Mobility variable description: " + explainer_variable_mapping[variable_option_G]
 
-@app.callback(Output('choropleth_G', 'figure'), Input('baseline_or_difference_G', 'value'), Input('state_G', 'value'), Input('variable_option_G', 'value'))
-def update_choropleth_FB(baseline_or_difference_G, state_G, variable_option_G,):
+# Filled in when the page loads, so the data does not have to be loaded before the layout is built
+@app.callback(Output('latest_date_google', 'children'), Input('state_G', 'value'))
+def update_latest_date(state_G):
+    latest_date = google_store().latest_date # Get the latest google data in the data
+    return dcc.Markdown(d("""##### The latest available Google Mobility Data is from %s""" % latest_date.strftime('%Y-%m-%d')))
 
-    googleState = google[google['state'] == state_G]
-    current_data = googleState[googleState.date == latest_date][['Council',variable_option_G]].dropna().set_index('Council')[variable_option_G]
+# When the state has not changed only the values, hover text and titles are sent as a patch to the current figure
+@app.callback(Output('choropleth_G', 'figure'), Output('choropleth_key_G', 'data'), Input('baseline_or_difference_G', 'value'), Input('state_G', 'value'), Input('variable_option_G', 'value'), State('choropleth_key_G', 'data'))
+def update_choropleth_FB(baseline_or_difference_G, state_G, variable_option_G, choropleth_key_G):
+
+    data = google_views().choropleth(state_G, variable_option_G, baseline_or_difference_G)
     if baseline_or_difference_G == 'difference':
-        one_week_data = googleState[googleState.date == latest_date - pd.Timedelta(days=7)][['Council',variable_option_G]].dropna().set_index('Council')[variable_option_G]
-        difference_data = current_data - one_week_data
-        data = difference_data
         color_name = 'Change from last week'
         title =  "Current difference in %s mobility compared to last week" % nice_variable_names[variable_option_G]
     else:
-        data = current_data
         color_name = 'Change from baseline'
         title =  "Current difference in %s mobility compared to baseline" % nice_variable_names[variable_option_G]
    
-    state_geo_df = full_geo_df[full_geo_df.state == state_G]
-    state_geo_df = state_geo_df[state_geo_df.Council.apply(lambda x: x in data.index)]
-    state_geo_df[color_name] = state_geo_df.Council.map(data.to_dict())
-
-    fig = px.choropleth_mapbox(state_geo_df,
-                                geojson=state_geo_df.geometry, 
-                                locations=state_geo_df.index, 
-                                hover_name='Council',
-                                color=color_name,
-                                color_continuous_scale='RdBu_r',
-                                center=cbd_lat_longs[state_G], 
-                                mapbox_style="carto-positron",
-                                zoom=9, opacity=0.8,
-                                title=title)
+    same_map = bool(choropleth_key_G) and choropleth_key_G['state'] == state_G
+    level = choropleth_key_G['level'] if same_map else geometry.lod_level(9)
+    key = {'state': state_G, 'level': level}
+    state_geo = state_geometry(state_G, level)
+    councils = [council for council in state_geo['ids'] if council in data.index]
+    hovertemplate = '<b>%{hovertext}</b><br><br>' + color_name + '=%{z}<extra></extra>'
+
+    if same_map:
+        patch = dash.Patch()
+        patch['data'][0]['locations'] = councils
+        patch['data'][0]['z'] = data[councils].tolist()
+        patch['data'][0]['hovertext'] = councils
+        patch['data'][0]['hovertemplate'] = hovertemplate
+        patch['layout']['coloraxis']['colorbar']['title']['text'] = color_name
+        patch['layout']['title']['text'] = title
+        return patch, key
+
+    fig = go.Figure(go.Choroplethmapbox(geojson=state_geo['geojson'],
+                                locations=councils,
+                                z=data[councils].to_numpy(),
+                                hovertext=councils,
+                                coloraxis='coloraxis',
+                                marker_opacity=0.8,
+                                hovertemplate=hovertemplate))
+    fig.update_layout(mapbox_style="carto-positron", mapbox_center=cbd_lat_longs[state_G], mapbox_zoom=9,
+                      coloraxis={'colorscale': 'RdBu_r', 'colorbar': {'title': {'text': color_name}}},
+                      title=title, uirevision=state_G)  # Keeps the user's zoom while patches are applied
     fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-    return fig
+    return fig, key
 
 
-@app.callback(Output('change_over_time_G', 'figure'), Input('choropleth_G', 'clickData'), Input('state_G','value'), Input('start_date_G','date'), Input('variable_option_G','value'))
-def update_time_plot(clickData, state_G, start_date_G, variable_option_G):
-    if clickData is not None:
-        this_Council = clickData['points'][0]['hovertext']
-        googleState = google[google['state'] == state_G]
-        if start_date_G != date(2020,2,15):
-            googleState = googleState[googleState.date > start_date_G]
-        data = googleState[googleState.Council == this_Council][['date', variable_option_G]].dropna().sort_values('date')
-        fig = px.line(data, x = 'date', y=variable_option_G, title="Change in %s over time in %s" % (nice_variable_names[variable_option_G], this_Council))
-        fig.add_hline(y=0, line_dash="dash", name="Baseline")
-        fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
-        fig.update_layout(xaxis_title="Date",yaxis_title=nice_variable_names[variable_option_G])
-        return fig
-    else:
+# Zooming past a level of detail boundary (see geometry.lod_levels) only sends the polygons of the new level
+@app.callback(Output('choropleth_G', 'figure', allow_duplicate=True), Output('choropleth_key_G', 'data', allow_duplicate=True),
+              Input('choropleth_G', 'relayoutData'), State('choropleth_key_G', 'data'), prevent_initial_call=True)
+def update_choropleth_detail_G(relayout_data, choropleth_key_G):
+    zoom = geometry.zoom_of(relayout_data)
+    if zoom is None or not choropleth_key_G or geometry.lod_level(zoom) == choropleth_key_G['level']:
+        return dash.no_update, dash.no_update
+    level = geometry.lod_level(zoom)
+    patch = dash.Patch()
+    patch['data'][0]['geojson'] = state_geometry(choropleth_key_G['state'], level)['geojson']
+    return patch, dict(choropleth_key_G, level=level)
+
+
+# Only a click on another council redraws the time plot
+@app.callback(Output('selected_council_G', 'data'), Input('choropleth_G', 'clickData'), State('selected_council_G', 'data'))
+def select_council(clickData, selected_council_G):
+    council = clickData['points'][0]['hovertext'] if clickData is not None else None
+    return council if council is not None and council != selected_council_G else dash.no_update
+
+
+@app.callback(Output('compare_councils_G', 'options'), Output('compare_councils_G', 'value'), Input('state_G', 'value'))
+def update_compare_options(state_G):
+    return [{'label': council, 'value': council} for council in google_store().state_councils(state_G).tolist()], []
+
+
+# Each trace is downsampled to at most max_plot_points, so the figure stays the same size as the history grows
+@app.callback(Output('change_over_time_G', 'figure'), Input('selected_council_G', 'data'), Input('state_G','value'), Input('start_date_G','date'),
+              Input('variable_option_G','value'), Input('compare_councils_G', 'value'), Input('time_plot_options_G', 'value'))
+def update_time_plot(selected_council_G, state_G, start_date_G, variable_option_G, compare_councils_G, time_plot_options_G):
+    state_councils = set(google_store().state_councils(state_G).tolist())
+    councils = [council for council in dict.fromkeys([selected_council_G] + (compare_councils_G or [])) if council in state_councils]
+    show_median = 'median' in (time_plot_options_G or [])
+    if not councils and not show_median:
         return instruction_graph
+    average = 'average' in (time_plot_options_G or [])
+    start_date = start_date_G if start_date_G != date(2020,2,15) else None
+
+    series = [(council, google_views().council_series(state_G, council, variable_option_G, start_date, average), None)
+              for council in councils]
+    if show_median:
+        series.append(('%s median' % state_G, google_views().state_median(state_G, variable_option_G, start_date, average),
+                       {'dash': 'dot', 'color': 'grey'}))
+    fig = go.Figure()
+    for name, data, line in series:
+        data = plot_points(data)
+        fig.add_trace(go.Scatter(x=data['date'], y=data[variable_option_G], mode='lines', name=name, line=line))
+    where = councils[0] if len(councils) == 1 and not show_median else 'selected areas'
+    title = "Change in %s over time in %s" % (nice_variable_names[variable_option_G], where)
+    if average:
+        title += " (%d-day average)" % googleStore.rolling_days
+    fig.add_hline(y=0, line_dash="dash", name="Baseline")
+    fig.update_layout(title=title, showlegend=len(series) > 1, legend={'orientation': 'h', 'y': -0.2})
+    fig.update_layout(margin={"r":0,"t":40,"l":0,"b":0})
+    fig.update_layout(xaxis_title="Date",yaxis_title=nice_variable_names[variable_option_G])
+    return fig
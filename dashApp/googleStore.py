@@ -0,0 +1,327 @@
+import os, json, warnings
+import numpy as np
+import pandas as pd
+from .params import here
+from . import sharedData
+
+
+###############################################################################################################################
+# Indexed local store of the Australian Google mobility data
+###############################################################################################################################
+#
+# States and councils are dictionary encoded and the values are held as one float32 array of shape
+# (council, day, variable), with councils sorted by state so each state is a contiguous block. Looking up a state's
+# values on a date or a council's history is then a direct slice rather than a scan of the whole frame.
+# The store is saved as a versioned .npz file so workers can start without network access, and published as a shared
+# dataset (see sharedData) so every worker process maps the same copy.
+
+store_version = 1
+views_version = 2  # 2 added the rolling averages and state medians
+store_path = here+'/data/google_store_v%d.npz' % store_version
+views_path = here+'/data/google_views_v%d.npz' % views_version
+rolling_days = 7  # Window of the precomputed rolling averages
+csv_path = here+'/data/google_mobility_australia.csv'
+
+
+class GoogleStore:
+    """Google mobility values indexed by (state, council, date).
+
+    Args:
+        states (numpy.ndarray): State names; a state's code is its position.
+        councils (numpy.ndarray): Council names, sorted by state.
+        state_offsets (numpy.ndarray): Councils of state s are councils[state_offsets[s]:state_offsets[s+1]].
+        first_day (numpy.datetime64): The date of the first day column.
+        variables (numpy.ndarray): Names of the mobility variables.
+        values (numpy.ndarray): float32 array of shape (council, day, variable), NaN where there is no data.
+    """
+
+    def __init__(self, states, councils, state_offsets, first_day, variables, values):
+        self.states = states
+        self.councils = councils
+        self.state_offsets = state_offsets
+        self.first_day = pd.Timestamp(first_day)
+        self.variables = variables
+        self.values = values
+        self.state_codes = {state: n for n, state in enumerate(states)}
+        self.variable_codes = {variable: n for n, variable in enumerate(variables)}
+        self.council_codes = {}
+        for s, state in enumerate(states):
+            for c in range(state_offsets[s], state_offsets[s + 1]):
+                self.council_codes[(state, councils[c])] = c
+        self.latest_date = self.first_day + pd.Timedelta(days=values.shape[1] - 1)
+
+    @classmethod
+    def from_frame(cls, google, variables):
+        """Builds a store from the long Google dataframe (columns state, Council, date and the variables)."""
+        google = google[~google.state.isna() & ~google.Council.isna()]
+        councils = google[['state', 'Council']].drop_duplicates().sort_values(['state', 'Council'])
+        states = np.array(sorted(councils.state.unique()), dtype=str)
+        state_offsets = np.searchsorted(councils.state.to_numpy(dtype=str), states).tolist() + [len(councils)]
+
+        council_position = {key: n for n, key in enumerate(zip(councils.state, councils.Council))}
+        first_day = google.date.min()
+        rows = np.array([council_position[key] for key in zip(google.state, google.Council)], dtype=np.int64)
+        days = ((google.date - first_day).dt.days).to_numpy()
+
+        values = np.full((len(councils), days.max() + 1, len(variables)), np.nan, dtype=np.float32)
+        values[rows, days] = google[variables].to_numpy(dtype=np.float32)
+        return cls(states, councils.Council.to_numpy(dtype=str), np.array(state_offsets), np.datetime64(first_day, 'D'),
+                   np.array(variables, dtype=str), values)
+
+    def save(self, path):
+        np.savez(path + '.tmp.npz', version=store_version, states=self.states, councils=self.councils,
+                 state_offsets=self.state_offsets, first_day=np.datetime64(self.first_day, 'D'),
+                 variables=self.variables, values=self.values)
+        os.replace(path + '.tmp.npz', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            if int(f['version']) != store_version:
+                raise ValueError('Google store %s has version %d, expected %d' % (path, f['version'], store_version))
+            return cls(f['states'], f['councils'], f['state_offsets'], f['first_day'][()], f['variables'], f['values'])
+
+    def publish(self):
+        sharedData.publish('google_store', {'states': self.states, 'councils': self.councils, 'state_offsets': self.state_offsets,
+                           'variables': self.variables, 'values': self.values},
+                           {'version': store_version, 'first_day': self.first_day.strftime('%Y-%m-%d')})
+
+    @classmethod
+    def from_shared(cls, arrays, meta):
+        """Wraps the mapped arrays of the shared google_store dataset; the values are not copied."""
+        if meta['version'] != store_version:
+            raise ValueError('Shared Google store has version %d, expected %d' % (meta['version'], store_version))
+        return cls(arrays['states'], arrays['councils'], np.asarray(arrays['state_offsets']), np.datetime64(meta['first_day'], 'D'),
+                   arrays['variables'], arrays['values'])
+
+    def _column(self, date):
+        return (pd.Timestamp(date) - self.first_day).days
+
+    def state_values_on(self, state, variable, date):
+        """The value of a variable for every council in a state on one date, without missing councils.
+
+        Returns:
+            pandas.Series: Values indexed by council name.
+        """
+        s = self.state_codes[state]
+        start, end = self.state_offsets[s], self.state_offsets[s + 1]
+        column = self._column(date)
+        if not 0 <= column < self.values.shape[1]:
+            return pd.Series(dtype=np.float32, index=pd.Index([], name='Council'), name=variable)
+        values = pd.Series(self.values[start:end, column, self.variable_codes[variable]],
+                           index=pd.Index(self.councils[start:end], name='Council'), name=variable)
+        return values.dropna()
+
+    def state_councils(self, state):
+        """The names of a state's councils."""
+        s = self.state_codes[state]
+        return self.councils[self.state_offsets[s]:self.state_offsets[s + 1]]
+
+    def council_series(self, state, council, variable, start_date=None):
+        """The daily history of a variable for one council, in date order and without missing days.
+
+        Args:
+            start_date (str): If given, only dates after this are returned.
+
+        Returns:
+            pandas.DataFrame: Columns date and the variable.
+        """
+        values = self.values[self.council_codes[(state, council)], :, self.variable_codes[variable]]
+        dates = self.first_day + pd.to_timedelta(np.arange(len(values)), unit='D')
+        keep = ~np.isnan(values)
+        if start_date is not None:
+            keep &= dates > pd.Timestamp(start_date)
+        return pd.DataFrame({'date': dates[keep], variable: values[keep]})
+
+
+def rolling_mean(values, days=rolling_days):
+    """Trailing mean over the last `days` days along axis 1 of a (series, day, ...) array, skipping missing days.
+
+    Returns:
+        numpy.ndarray: float32 array of the same shape, NaN where the whole window is missing.
+    """
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0), axis=1, dtype=np.float64)
+    counts = np.cumsum(present, axis=1)
+    sums[:, days:] = sums[:, days:] - sums[:, :-days]
+    counts[:, days:] = counts[:, days:] - counts[:, :-days]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).astype(np.float32)
+
+
+class GoogleViews:
+    """Callback-ready views of a GoogleStore, materialised once at ingest.
+
+    Holds, for every (state, variable, mode), the councils and values the choropleth shows on the latest date
+    ('baseline') or their change over the last week ('difference'), and every council's history and its rolling
+    average with missing days removed, packed end to end so each series is a single slice. Each state's daily median
+    over its councils and its rolling average are held as (state, day, variable) arrays.
+
+    Args:
+        first_day (numpy.datetime64): The date of day 0 of the series.
+        choropleth (dict): '<state>|<variable>|<mode>' -> {'councils': [...], 'values': [...]}.
+        series_keys (dict): '<state>|<council>|<variable>' -> (start, end) slice of series_days/series_values.
+        series_days (numpy.ndarray): Day number (since first_day) of every point.
+        series_values (numpy.ndarray): Value of every point.
+        series_averages (numpy.ndarray): Rolling average (see rolling_mean) at every point.
+        states, variables (list): The states and variables in the order of the median arrays.
+        medians, median_averages (numpy.ndarray): float32 arrays of shape (state, day, variable), NaN where no council
+            has data.
+    """
+
+    def __init__(self, first_day, choropleth, series_keys, series_days, series_values, series_averages, states, variables,
+                 medians, median_averages):
+        self.first_day = pd.Timestamp(first_day)
+        self._choropleth = {key: pd.Series(view['values'], index=pd.Index(view['councils'], name='Council'), dtype=np.float32)
+                            for key, view in choropleth.items()}
+        self._choropleth_json = choropleth
+        self.series_keys = series_keys
+        self.series_days = series_days
+        self.series_values = series_values
+        self.series_averages = series_averages
+        self.state_codes = {state: n for n, state in enumerate(states)}
+        self.variable_codes = {variable: n for n, variable in enumerate(variables)}
+        self.medians = medians
+        self.median_averages = median_averages
+
+    @classmethod
+    def build(cls, store):
+        choropleth, series_keys, days, values, averages = {}, {}, [], [], []
+        week_ago = store.latest_date - pd.Timedelta(days=7)
+        position = 0
+        for state in store.states:
+            for variable in store.variables:
+                current = store.state_values_on(state, variable, store.latest_date)
+                difference = (current - store.state_values_on(state, variable, week_ago)).dropna()
+                for mode, data in (('baseline', current), ('difference', difference)):
+                    choropleth['%s|%s|%s' % (state, variable, mode)] = {'councils': data.index.tolist(), 'values': data.tolist()}
+        rolling = rolling_mean(store.values)
+        for (state, council), c in store.council_codes.items():
+            for v, variable in enumerate(store.variables):
+                series = store.values[c, :, v]
+                present = np.flatnonzero(~np.isnan(series))
+                series_keys['%s|%s|%s' % (state, council, variable)] = (position, position + len(present))
+                days.append(present.astype(np.int32))
+                values.append(series[present])
+                averages.append(rolling[c, present, v])
+                position += len(present)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # Days on which no council of a state has data
+            medians = np.stack([np.nanmedian(store.values[store.state_offsets[s]:store.state_offsets[s + 1]], axis=0)
+                                for s in range(len(store.states))]).astype(np.float32)
+        return cls(np.datetime64(store.first_day, 'D'), choropleth, series_keys, np.concatenate(days),
+                   np.concatenate(values).astype(np.float32), np.concatenate(averages), store.states.tolist(),
+                   store.variables.tolist(), medians, rolling_mean(medians))
+
+    def _arrays(self):
+        return {'series_days': self.series_days, 'series_values': self.series_values, 'series_averages': self.series_averages,
+                'medians': self.medians, 'median_averages': self.median_averages}
+
+    def _meta(self):
+        return {'version': views_version, 'first_day': self.first_day.strftime('%Y-%m-%d'), 'choropleth': self._choropleth_json,
+                'series_keys': self.series_keys, 'states': list(self.state_codes), 'variables': list(self.variable_codes)}
+
+    @classmethod
+    def _from_parts(cls, arrays, meta):
+        if meta['version'] != views_version:
+            raise ValueError('Google views have version %d, expected %d' % (meta['version'], views_version))
+        return cls(np.datetime64(meta['first_day'], 'D'), meta['choropleth'], meta['series_keys'], arrays['series_days'],
+                   arrays['series_values'], arrays['series_averages'], meta['states'], meta['variables'], arrays['medians'],
+                   arrays['median_averages'])
+
+    def save(self, path):
+        np.savez(path + '.tmp.npz', meta=np.array(json.dumps(self._meta())), **self._arrays())
+        os.replace(path + '.tmp.npz', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls._from_parts({name: f[name] for name in f.files if name != 'meta'}, json.loads(str(f['meta'])))
+
+    def publish(self):
+        sharedData.publish('google_views', self._arrays(), self._meta())
+
+    @classmethod
+    def from_shared(cls, arrays, meta):
+        """Wraps the mapped arrays of the shared google_views dataset."""
+        return cls._from_parts(arrays, meta)
+
+    def choropleth(self, state, variable, mode):
+        """The values shown on the map, indexed by council. Mode is 'baseline' or 'difference'."""
+        return self._choropleth['%s|%s|%s' % (state, variable, mode)]
+
+    def council_series(self, state, council, variable, start_date=None, average=False):
+        """The daily history of a variable for one council, in date order and without missing days.
+
+        Args:
+            start_date (str): If given, only dates after this are returned.
+            average (bool): Return the rolling average (see rolling_mean) instead of the daily values.
+
+        Returns:
+            pandas.DataFrame: Columns date and the variable.
+        """
+        start, end = self.series_keys['%s|%s|%s' % (state, council, variable)]
+        days = self.series_days[start:end]
+        if start_date is not None:
+            days = days[days > (pd.Timestamp(start_date) - self.first_day).days]
+            start = end - len(days)
+        values = self.series_averages if average else self.series_values
+        return pd.DataFrame({'date': self.first_day + pd.to_timedelta(days, unit='D'), variable: values[start:end]})
+
+    def state_median(self, state, variable, start_date=None, average=False):
+        """The daily median of a variable over a state's councils, in the form of council_series."""
+        values = (self.median_averages if average else self.medians)[self.state_codes[state], :, self.variable_codes[variable]]
+        days = np.flatnonzero(~np.isnan(values))
+        if start_date is not None:
+            days = days[days > (pd.Timestamp(start_date) - self.first_day).days]
+        return pd.DataFrame({'date': self.first_day + pd.to_timedelta(days, unit='D'), variable: values[days]})
+
+
+def _is_stale(path, source):
+    return not os.path.exists(path) or (os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path))
+
+
+def load_views(store):
+    """Loads the materialised views, rebuilding them when the store is newer than them."""
+    if not _is_stale(views_path, store_path):
+        try:
+            return GoogleViews.load(views_path)
+        except (ValueError, KeyError):
+            pass  # Older views version, rebuilt below
+    views = GoogleViews.build(store)
+    views.save(views_path)
+    return views
+
+
+def materialise(variables):
+    """The ingest step: rebuilds the store from the local CSV, materialises its views and publishes both to the workers."""
+    store = GoogleStore.from_frame(pd.read_csv(csv_path, parse_dates=['date']), variables)
+    store.save(store_path)
+    views = GoogleViews.build(store)
+    views.save(views_path)
+    store.publish()
+    views.publish()
+    return store
+
+
+def load_store(variables):
+    """Loads the local Google store, building it from the local CSV when needed.
+
+    The store is rebuilt when the local CSV is newer than it, so a data update is picked up on the next start.
+    Nothing is fetched over the network.
+
+    Raises:
+        FileNotFoundError: If there is neither a usable store nor the CSV to build it from.
+    """
+    if not _is_stale(store_path, csv_path):
+        try:
+            return GoogleStore.load(store_path)
+        except (ValueError, KeyError):
+            pass  # Older store version, rebuilt below
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError('No Google mobility data in %s: run python data_updater/download_google.py and then '
+                                'python data_updater/materialise_google.py from the repository root' % os.path.dirname(csv_path))
+    google = pd.read_csv(csv_path, parse_dates=['date'])
+    store = GoogleStore.from_frame(google, variables)
+    store.save(store_path)
+    return store
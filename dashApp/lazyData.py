@@ -0,0 +1,105 @@
+import logging, os, threading, time, weakref
+
+
+###############################################################################################################################
+# Lazily loaded datasets
+###############################################################################################################################
+#
+# Heavy datasets are wrapped in a Lazy and loaded on first use, so importing the app (and every WSGI worker restart)
+# only pays for what a request actually needs. preload() warms them all in a background thread and sets `ready`
+# when done, which the /ready endpoint reports. Without preloading `ready` is set straight away (see skip_preload).
+
+resources = []  # Every Lazy, in the order they were declared
+ready = threading.Event()
+logger = logging.getLogger(__name__)
+_lock_owners = weakref.WeakSet()
+
+
+def fork_safe_lock(owner):
+	"""Returns a new lock for `owner._lock` that is replaced with a fresh one in a forked child (e.g. a background job).
+
+    A lock held by another thread when the process forks would never be released in the child. A module-level lock
+    is registered with the module as owner.
+    """
+	_lock_owners.add(owner)
+	return threading.Lock()
+
+
+def _reset_locks():
+	for owner in list(_lock_owners):
+		owner._lock = threading.Lock()
+os.register_at_fork(after_in_child=_reset_locks)
+
+
+class Lazy:
+	"""A value that is loaded by calling `load` the first time it is needed.
+
+    Call the object to get the value. Loading happens once, even with concurrent requests.
+
+    Args:
+        name (str): Name used when reporting load times.
+        load (callable): Function returning the value.
+        preload (bool or callable): Whether preload() loads it. A callable is asked at preload time, so data that is
+            only needed to rebuild a missing artefact (e.g. geometry behind pre-serialised payloads) is skipped when
+            the artefact exists; it is still loaded on first use if it turns out to be needed.
+    """
+
+	def __init__(self, name, load, preload=True):
+		self.name = name
+		self._load = load
+		self._preload = preload
+		self._lock = fork_safe_lock(self)  # A resource that was loading when the process forked is loaded again
+		self._loaded = False
+		self._value = None
+		self.load_time = None
+		resources.append(self)
+
+	def __call__(self):
+		if not self._loaded:
+			with self._lock:
+				if not self._loaded:
+					start = time.perf_counter()
+					self._value = self._load()
+					self.load_time = time.perf_counter() - start
+					self._loaded = True
+		return self._value
+
+	@property
+	def loaded(self):
+		return self._loaded
+
+	def wanted(self):
+		"""Whether preload() should load this resource."""
+		return self._preload() if callable(self._preload) else self._preload
+
+
+def preload():
+	"""Loads every resource in the current thread, then sets `ready`.
+
+    Resources that are not wanted (see Lazy.wanted) are skipped. A resource that fails to load is reported and
+    skipped; it will raise again when a request uses it.
+    """
+	for resource in resources:
+		try:
+			if resource.wanted():
+				resource()
+		except Exception as e:
+			logger.warning('Could not preload %s: %r', resource.name, e)
+	ready.set()
+
+
+def preload_in_background():
+	"""Starts loading every resource in a daemon thread so the first requests do not wait for all of them."""
+	thread = threading.Thread(target=preload, name='preload', daemon=True)
+	thread.start()
+	return thread
+
+
+def skip_preload():
+	"""Marks the process ready without loading anything, for when datasets are only loaded on first use."""
+	ready.set()
+
+
+def load_times():
+	"""Returns {name: seconds} for every resource loaded so far."""
+	return {resource.name: resource.load_time for resource in resources if resource.loaded}
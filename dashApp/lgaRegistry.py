@@ -0,0 +1,124 @@
+import numpy as np
+from .riskEngine import RegionIndex
+
+
+###############################################################################################################################
+# State-partitioned LGA registry
+###############################################################################################################################
+#
+# Everything the app knows about an LGA (name, area, population and median age) is held in read-only NumPy arrays per
+# state, in the order of that state's risk index (see riskEngine.RegionIndex). Risk vectors come out of the engine in
+# the same order, so joining them to names or attributes is array indexing rather than a dictionary lookup per LGA.
+# Names are fixed-width unicode arrays rather than arrays of Python strings, so a registry mapped from sharedData stays
+# in the shared pages; Python strings are only made for the rows a response needs.
+
+class StateLGAs:
+	"""The LGAs of one state.
+
+    Args:
+        index (riskEngine.RegionIndex): The state's risk index; its codes define the order of every array.
+        names (array-like): Name of each LGA. A fixed-width string array (e.g. a mapped one) is kept as is.
+        areas, populations, median_ages (array-like): Attributes of each LGA, NaN where unknown.
+    """
+
+	def __init__(self, index, names, areas, populations, median_ages):
+		self.index = index
+		self.codes = index.codes
+		self.names = np.asarray(names)
+		if self.names.dtype.kind != 'U':
+			self.names = self.names.astype(str)
+		self.areas = np.asarray(areas, dtype=np.float64)
+		self.populations = np.asarray(populations, dtype=np.float64)
+		self.median_ages = np.asarray(median_ages, dtype=np.float64)
+		for array in (self.names, self.areas, self.populations, self.median_ages):
+			array.flags.writeable = False
+		self._options = None
+
+	@property
+	def options(self):
+		"""Dropdown options for the outbreak centre picker, built on first use."""
+		if self._options is None:
+			self._options = tuple({'label': name, 'value': code} for code, name in zip(self.codes.tolist(), self.names.tolist()))
+		return self._options
+
+	def __len__(self):
+		return len(self.codes)
+
+	def positions(self, codes):
+		"""Looks up the positions of a set of codes; see RegionIndex.positions."""
+		return self.index.positions(codes)
+
+
+class LGARegistry:
+	"""Immutable registry of the LGAs of every state, built once per process.
+
+    Args:
+        states (dict): { state : StateLGAs }.
+    """
+
+	def __init__(self, states):
+		self._states = dict(states)
+
+	def __getitem__(self, state):
+		return self._states[state]
+
+	def __contains__(self, state):
+		return state in self._states
+
+	def states(self):
+		return list(self._states)
+
+	@classmethod
+	def build(cls, indexes, name_map, attributes):
+		"""Builds the registry.
+
+        Args:
+            indexes (dict): { state : RegionIndex } as used by the risk engine.
+            name_map (dict): { LGA code : name }.
+            attributes (pandas.DataFrame): Indexed by LGA code with columns AREASQKM19, Population and Median Age.
+        """
+		states = {}
+		for state, index in indexes.items():
+			found = attributes.reindex(index.codes)
+			states[state] = StateLGAs(index, [name_map.get(code, 'Error') for code in index.codes.tolist()],
+				found.AREASQKM19.to_numpy(dtype=np.float64), found.Population.to_numpy(dtype=np.float64),
+				found['Median Age'].to_numpy(dtype=np.float64))
+		return cls(states)
+
+	def arrays(self):
+		"""Flattens the registry into plain arrays, the states' LGAs one after another, for sharedData.publish."""
+		states = self.states()
+		entries = [self._states[state] for state in states]
+		return {'states': np.array(states, dtype=np.int64), 'offsets': np.cumsum([0] + [len(lgas) for lgas in entries]),
+			'codes': np.concatenate([lgas.codes for lgas in entries]),
+			'names': np.concatenate([lgas.names for lgas in entries]),
+			'areas': np.concatenate([lgas.areas for lgas in entries]),
+			'populations': np.concatenate([lgas.populations for lgas in entries]),
+			'median_ages': np.concatenate([lgas.median_ages for lgas in entries])}
+
+	@staticmethod
+	def indexes_from_arrays(arrays):
+		"""The { state : RegionIndex } the arrays() of a registry were published for, so workers need not build it."""
+		offsets = np.asarray(arrays['offsets'])
+		return {state: RegionIndex(arrays['codes'][offsets[n]:offsets[n + 1]])
+			for n, state in enumerate(np.asarray(arrays['states']).tolist())}
+
+	@classmethod
+	def from_arrays(cls, arrays, indexes):
+		"""Rebuilds a registry from arrays(), reusing the risk engine's indexes.
+
+        Raises:
+            ValueError: If the arrays were published for other LGA codes than `indexes` holds.
+        """
+		states = {}
+		offsets = np.asarray(arrays['offsets'])
+		for n, state in enumerate(np.asarray(arrays['states']).tolist()):
+			part = slice(offsets[n], offsets[n + 1])
+			index = indexes.get(state)
+			if index is None or not np.array_equal(index.codes, arrays['codes'][part]):
+				raise ValueError('Shared LGA registry does not match the LGA index of state %d' % state)
+			states[state] = StateLGAs(index, arrays['names'][part], arrays['areas'][part], arrays['populations'][part],
+				arrays['median_ages'][part])
+		if set(states) != set(indexes):
+			raise ValueError('Shared LGA registry covers states %s, expected %s' % (sorted(states), sorted(indexes)))
+		return cls(states)
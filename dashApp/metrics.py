@@ -0,0 +1,189 @@
+import json, logging, time
+from contextlib import contextmanager
+from functools import wraps
+from . import params
+from .lazyData import fork_safe_lock
+
+
+###############################################################################################################################
+# Callback and query instrumentation
+###############################################################################################################################
+#
+# Every Dash callback and SQL query records its wall time, and callbacks their serialised response size, in
+# Prometheus style histograms served at /metrics. Caches count their hits and misses. With `timing_logs` each
+# measurement is also logged as a JSON line. When both are off in params nothing is wrapped and the recording
+# functions return straight away.
+
+enabled = params.metrics or params.timing_logs
+logger = logging.getLogger(__name__)
+
+seconds_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+bytes_buckets = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+rows_buckets = (10, 100, 1e3, 1e4, 1e5, 1e6)
+
+
+def _labels(names, values):
+	escaped = [str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values]
+	return ','.join('%s="%s"' % pair for pair in zip(names, escaped))
+
+
+class Histogram:
+	"""A thread safe Prometheus histogram with a fixed set of label names.
+
+    Args:
+        name (str): Metric name.
+        help (str): Description shown in the exposition.
+        buckets (tuple): Upper bounds of the buckets, in increasing order; +Inf is added.
+        labels (tuple): Names of the labels every observation is given.
+    """
+
+	def __init__(self, name, help, buckets, labels):
+		self.name = name
+		self.help = help
+		self.buckets = buckets
+		self.labels = labels
+		self._series = {}  # label values -> [count per bucket..., count, sum]
+		self._lock = fork_safe_lock(self)
+		registry.append(self)
+
+	def observe(self, value, *label_values):
+		with self._lock:
+			series = self._series.setdefault(label_values, [0]*(len(self.buckets) + 2))
+			for n, bound in enumerate(self.buckets):
+				if value <= bound:
+					series[n] += 1
+			series[-2] += 1
+			series[-1] += value
+
+	def render(self):
+		lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+		with self._lock:
+			for label_values, series in sorted(self._series.items()):
+				labels = _labels(self.labels, label_values)
+				for bound, count in zip(self.buckets + ('+Inf',), series[:-2] + [series[-2]]):
+					lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, labels, bound if bound == '+Inf' else '%g' % bound, count))
+				lines.append('%s_sum{%s} %r' % (self.name, labels, series[-1]))
+				lines.append('%s_count{%s} %d' % (self.name, labels, series[-2]))
+		return lines
+
+
+class Counter:
+	"""A thread safe Prometheus counter with a fixed set of label names."""
+
+	def __init__(self, name, help, labels):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self._series = {}
+		self._lock = fork_safe_lock(self)
+		registry.append(self)
+
+	def inc(self, amount, *label_values):
+		with self._lock:
+			self._series[label_values] = self._series.get(label_values, 0) + amount
+
+	def render(self):
+		lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+		with self._lock:
+			for label_values, count in sorted(self._series.items()):
+				lines.append('%s{%s} %r' % (self.name, _labels(self.labels, label_values), count))
+		return lines
+
+
+registry = []
+callback_seconds = Histogram('dash_callback_duration_seconds', 'Wall time of Dash callbacks.', seconds_buckets, ('callback', 'outcome'))
+callback_bytes = Histogram('dash_callback_response_bytes', 'Serialised size of Dash callback responses.', bytes_buckets, ('callback',))
+query_seconds = Histogram('sql_query_duration_seconds', 'Wall time of SQL queries, including fetching the rows.', seconds_buckets, ('query', 'outcome'))
+query_rows = Histogram('sql_query_rows', 'Rows returned by SQL queries.', rows_buckets, ('query',))
+cache_lookups = Counter('cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'status'))
+
+
+def log_timing(kind, name, seconds, **fields):
+	if params.timing_logs:
+		logger.info(json.dumps(dict({'kind': kind, 'name': name, 'seconds': round(seconds, 6)}, **fields)))
+
+
+def cache_status(cache, status, amount=1):
+	"""Counts `amount` lookups of a cache with status 'hit' or 'miss'. Unnamed caches (None) are not counted."""
+	if enabled and cache is not None and amount:
+		cache_lookups.inc(amount, cache, status)
+
+
+@contextmanager
+def timed_query(name):
+	"""Times the enclosed query. Set result['rows'] to the number of rows fetched."""
+	if not enabled:
+		yield {}
+		return
+	result = {'rows': 0}
+	outcome = 'error'
+	start = time.perf_counter()
+	try:
+		yield result
+		outcome = 'ok'
+	finally:
+		seconds = time.perf_counter() - start
+		query_seconds.observe(seconds, name, outcome)
+		query_rows.observe(result['rows'], name)
+		log_timing('query', name, seconds, rows=result['rows'], outcome=outcome)
+
+
+def instrument_callback(function):
+	"""Wraps a callback so its wall time is recorded under '<module>.<function>'."""
+	import flask
+	from dash.exceptions import PreventUpdate
+	name = '%s.%s' % (function.__module__.rsplit('.', 1)[-1], function.__name__)
+
+	@wraps(function)
+	def instrumented(*args, **kwargs):
+		if flask.has_request_context():
+			flask.g.metrics_callback = name  # The response size is recorded by the after_request hook
+		outcome = 'error'
+		start = time.perf_counter()
+		try:
+			result = function(*args, **kwargs)
+			outcome = 'ok'
+			return result
+		except PreventUpdate:
+			outcome = 'prevented'
+			raise
+		finally:
+			seconds = time.perf_counter() - start
+			callback_seconds.observe(seconds, name, outcome)
+			log_timing('callback', name, seconds, outcome=outcome)
+	return instrumented
+
+
+def render():
+	"""The Prometheus text exposition of every metric."""
+	return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+def instrument_app(app):
+	"""Instruments every callback registered on `app` from now on and adds the /metrics route.
+
+    Does nothing when metrics and timing logs are both disabled in params.
+    """
+	if not enabled:
+		return
+	import flask
+	register_callback = app.callback
+
+	@wraps(register_callback)
+	def callback(*args, **kwargs):
+		register = register_callback(*args, **kwargs)
+		return lambda function: register(instrument_callback(function))
+	app.callback = callback
+
+	@app.server.after_request
+	def record_response_size(response):
+		name = flask.g.pop('metrics_callback', None)
+		if name is not None:
+			size = response.calculate_content_length()
+			callback_bytes.observe(size if size is not None else len(response.get_data()), name)
+		return response
+
+	if params.metrics:
+		@app.server.route('/metrics')
+		def metrics():
+			return flask.Response(render(), mimetype='text/plain; version=0.0.4')
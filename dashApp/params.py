@@ -7,4 +7,20 @@
 # For testing/local development purposes
 here = './dashApp' 
 requests_pathname_prefix='/'
-debug=True
\ No newline at end of file
+debug=True
+
+# Where the Facebook OD flows come from: 'sql' (the UMelb server), 'synthetic' (random flows, for development without
+# the server) or the path of a CSV with columns date, time, LGA19_source, LGA19_target, n_trips and optionally region
+flow_source = 'sql'
+
+# Load the heavy datasets in a background thread at startup rather than on first use
+preload = True
+
+# Run risk estimates as background jobs in worker processes rather than on the WSGI request threads (needs dash[diskcache]).
+# Job processes keep their own metrics, so risk estimate timings are missing from /metrics while this is on.
+background_jobs = False
+
+# Record callback and SQL query timings, response sizes and cache hits, served as Prometheus metrics at /metrics
+metrics = False
+# Also log each of those timings as a JSON line (logger dashApp.metrics)
+timing_logs = False
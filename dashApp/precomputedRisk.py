@@ -0,0 +1,56 @@
+import os
+import numpy as np
+from datetime import date
+from .params import here
+from .flowCache import settled, to_day
+
+
+###############################################################################################################################
+# Precomputed generalised risk maps
+###############################################################################################################################
+#
+# The risk map with no outbreak centres only depends on the state, time slice and dates, so the most requested ones
+# are computed ahead of time by data_updater/precompute_risk.py and stored one file per selection
+#     data/precomputed_risk/<region>/<slice>/<start>_<end>.npz
+# holding the LGA codes and their risk, in the order of the state's LGA index, with the format version and the day it
+# was computed. A map whose dates were not all settled (see flowCache.settle_days) on that day was computed from flows
+# that may still have been filling, so it is never served.
+
+risk_dir = here+'/data/precomputed_risk'
+format_version = 2
+
+
+def risk_path(region, time, start_date, end_date):
+	return os.path.join(risk_dir, region, 'all' if time == '*' else time,
+		'%s_%s.npz' % (to_day(start_date).isoformat(), to_day(end_date).isoformat()))
+
+
+def save(region, time, start_date, end_date, codes, risk):
+	"""Stores a generalised risk map. Written to a temporary file first so readers never see half a file.
+
+    Raises:
+        ValueError: If end_date is not settled yet, since the map would be computed from partial flows.
+    """
+	if not settled(end_date):
+		raise ValueError('%s is within flowCache.settle_days of today and may still change' % end_date)
+	path = risk_path(region, time, start_date, end_date)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temporary = '%s.%d.tmp.npz' % (path[:-4], os.getpid())
+	np.savez(temporary, codes=np.asarray(codes, dtype=np.int64), risk=np.asarray(risk, dtype=np.float64),
+		version=format_version, created=date.today().isoformat())
+	os.replace(temporary, path)
+
+
+def lookup(region, time, start_date, end_date):
+	"""Returns the precomputed { LGA code : risk estimate } for a selection.
+
+    Returns None if it was not precomputed, was written in another format, or covers days that were not settled when
+    it was computed.
+    """
+	path = risk_path(region, time, start_date, end_date)
+	if not os.path.exists(path):
+		return None
+	with np.load(path) as f:
+		if 'version' not in f or int(f['version']) != format_version or not settled(end_date, on=str(f['created'])):
+			return None
+		return dict(zip(f['codes'].tolist(), f['risk'].tolist()))
@@ -0,0 +1,138 @@
+import os, time, pickle, hashlib, threading
+from collections import OrderedDict
+from . import metrics
+from .lazyData import fork_safe_lock
+
+
+###############################################################################################################################
+# Bounded LRU/TTL cache of computed results
+###############################################################################################################################
+
+class ResultCache:
+	"""A thread safe, size bounded LRU cache with optional expiry and on-disk persistence.
+
+    Entries older than `ttl` seconds are treated as missing. When `path` is given every entry is also pickled to its
+    own file there, so results survive WSGI process restarts; evicted entries are removed from disk as well. Processes
+    sharing the directory each evict only what they hold, so the directory itself is pruned to the `max_size` most
+    recently written unexpired files when the cache is created and again after every `max_size` writes.
+
+    Args:
+        max_size (int): The most entries held before the least recently used is evicted.
+        ttl (float): Seconds an entry stays valid, or None to keep entries until evicted.
+        path (str): Directory used for persistence, or None to keep the cache in memory only.
+        name (str): Name hits and misses are reported under (see metrics), or None not to report them.
+    """
+
+	def __init__(self, max_size=256, ttl=None, path=None, name=None):
+		self.name = name
+		self.max_size = max_size
+		self.ttl = ttl
+		self.path = path
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries = OrderedDict()  # key -> (time stored, value)
+		self._lock = fork_safe_lock(self)
+		self._writes = 0
+		if path is not None:
+			os.makedirs(path, exist_ok=True)
+			self.prune()
+
+	def prune(self):
+		"""Removes expired files, leftover temporary files and all but the `max_size` newest files from the directory."""
+		now = time.time()
+		files = []
+		for name in os.listdir(self.path):
+			file = os.path.join(self.path, name)
+			try:
+				modified = os.path.getmtime(file)
+			except OSError:
+				continue  # Removed by another process meanwhile
+			if name.endswith('.tmp'):
+				if now - modified > 3600:  # Left by a process that died while writing
+					files.append((float('-inf'), file))
+			elif name.endswith('.pickle'):
+				files.append((float('-inf') if self.ttl is not None and now - modified > self.ttl else modified, file))
+		files.sort(reverse=True)
+		for n, (modified, file) in enumerate(files):
+			if n >= self.max_size or modified == float('-inf'):
+				try:
+					os.remove(file)
+				except OSError:
+					pass
+
+	def _file(self, key):
+		# Sets are sorted so the file name does not depend on their iteration order
+		stable = tuple(sorted(part) if isinstance(part, (set, frozenset)) else part for part in key)
+		return os.path.join(self.path, hashlib.sha1(repr(stable).encode()).hexdigest() + '.pickle')
+
+	def _expired(self, stored):
+		return self.ttl is not None and time.time() - stored > self.ttl
+
+	def _load(self, key):
+		try:
+			with open(self._file(key), 'rb') as f:
+				stored_key, stored, value = pickle.load(f)
+		except (OSError, EOFError, pickle.UnpicklingError):
+			return None
+		return (stored, value) if stored_key == key else None
+
+	def _trim(self):
+		while len(self._entries) > self.max_size:
+			evicted_key, _ = self._entries.popitem(last=False)
+			self.evictions += 1
+			if self.path is not None and os.path.exists(self._file(evicted_key)):
+				os.remove(self._file(evicted_key))
+
+	def get(self, key, default=None):
+		"""Returns the value stored for key, or default on a miss."""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None and self.path is not None:
+				entry = self._load(key)
+				if entry is not None:
+					self._entries[key] = entry
+					self._trim()
+			if entry is None or self._expired(entry[0]):
+				self.misses += 1
+				metrics.cache_status(self.name, 'miss')
+				return default
+			self._entries.move_to_end(key)
+			self.hits += 1
+			metrics.cache_status(self.name, 'hit')
+			return entry[1]
+
+	def set(self, key, value):
+		"""Stores value under key, evicting the least recently used entries beyond max_size."""
+		entry = (time.time(), value)
+		with self._lock:
+			self._entries[key] = entry
+			self._entries.move_to_end(key)
+			self._trim()
+		if self.path is not None:
+			file = self._file(key)
+			temporary = '%s.%d.%d.tmp' % (file, os.getpid(), threading.get_ident())
+			with open(temporary, 'wb') as f:
+				pickle.dump((key, entry[0], value), f)
+			os.replace(temporary, file)
+			with self._lock:
+				self._writes += 1
+				prune = self._writes % self.max_size == 0
+			if prune:
+				self.prune()
+
+	def get_or_compute(self, key, compute):
+		"""Returns the cached value for key, calling compute() and storing its result on a miss."""
+		value = self.get(key, _missing)
+		if value is _missing:
+			value = compute()
+			self.set(key, value)
+		return value
+
+	def stats(self):
+		"""Returns the hit, miss and eviction counters and the current number of entries."""
+		with self._lock:
+			return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._entries)}
+
+
+_missing = object()
@@ -0,0 +1,167 @@
+import flask
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from .server import server
+from . import sa2Functions
+from .facebookFunctions import (first_flow_date, get_fb_flows, get_fb_risk_batch, get_fb_risk_estimate, lga_registry, resolutions,
+	state_acronym_map)
+from .flowCache import to_day
+from .riskExport import csv_chunks, export_chunks, formats, parquet_chunks
+
+
+###############################################################################################################################
+# HTTP API: batch scenarios and exports
+###############################################################################################################################
+#
+# POST /api/risk/batch with a JSON body such as
+#     {"format": "csv", "state": 1, "time": "*", "start_date": "2021-02-01", "end_date": "2021-02-03",
+#      "scenarios": [{"id": "Sydney", "locations": [17200]}, {"locations": [10050, 10130]}, {"state": 2, "locations": []}]}
+# Top level state, time, start_date and end_date are defaults that each scenario may override; the id defaults to the
+# scenario's position. Scenarios sharing a selection are computed together from one OD matrix (see get_fb_risk_batch)
+# and the results are streamed back one selection at a time as CSV or Parquet, with columns
+#     scenario, state, LGA_CODE19, LGA_NAME19, risk
+# Every distinct selection may query the SQL server, so a request may hold at most max_selections of them, each at
+# most max_days long. Dates are clamped to the days the flows cover.
+#
+# GET /export/risk?state=1&time=*&start_date=2021-02-01&end_date=2021-02-03&locations=10050,10130&format=geojson
+# streams one risk estimate with the LGA attributes as CSV, Parquet or GeoJSON (see riskExport). It is what the
+# download link on the Facebook tab points to. With resolution=sa2 the South Australian SA2 estimate from the
+# AddInsights sample is exported instead; it has no dates or time slices, so those are ignored.
+
+max_scenarios = 10000
+max_selections = 50  # Distinct (state, time, start_date, end_date) per request
+max_days = 366  # Longest date range of a selection
+time_options = ['0000', '0800', '1600', '*']
+
+
+def _integer(value, what):
+	# Codes arrive as JSON numbers from the batch API and as strings from the export query string
+	if isinstance(value, bool) or not isinstance(value, (int, str)):
+		raise ValueError('%s must be an integer, got %r' % (what, value))
+	try:
+		return int(value)
+	except ValueError:
+		raise ValueError('%s must be an integer, got %r' % (what, value)) from None
+
+
+def _day(value, what):
+	if not isinstance(value, str):
+		raise ValueError('%s must be a date string, got %r' % (what, value))
+	try:
+		return to_day(value)
+	except (ValueError, OverflowError):
+		raise ValueError('%s is not a date: %r' % (what, value)) from None
+
+
+def parse_scenarios(body):
+	"""Validates the request body and returns the scenarios with the defaults filled in.
+
+    Dates are clamped to the days the flows cover (first_flow_date to yesterday).
+
+    Raises:
+        ValueError: If a scenario is missing a field or has an invalid value, a selection is longer than max_days or
+            there are more than max_selections distinct selections.
+    """
+	scenarios = body.get('scenarios')
+	if not isinstance(scenarios, list) or len(scenarios) == 0:
+		raise ValueError('scenarios must be a non-empty list')
+	if len(scenarios) > max_scenarios:
+		raise ValueError('at most %d scenarios can be run in one request' % max_scenarios)
+	defaults = {key: body[key] for key in ('state', 'time', 'start_date', 'end_date') if key in body}
+	first_day, last_day = to_day(first_flow_date), date.today() - timedelta(days=1)
+	parsed = []
+	selections = set()
+	for n, scenario in enumerate(scenarios):
+		if not isinstance(scenario, dict):
+			raise ValueError('scenario %d must be an object' % n)
+		scenario = {'time': '*', 'locations': [], **defaults, **scenario}
+		for key in ('state', 'start_date', 'end_date'):
+			if key not in scenario:
+				raise ValueError('scenario %d has no %s' % (n, key))
+		state = _integer(scenario['state'], 'scenario %d state' % n)
+		if state not in state_acronym_map:
+			raise ValueError('scenario %d has unknown state %r' % (n, scenario['state']))
+		if scenario['time'] not in time_options:
+			raise ValueError('scenario %d has time %r, expected one of %s' % (n, scenario['time'], ', '.join(time_options)))
+		if not isinstance(scenario['locations'], list):
+			raise ValueError('scenario %d locations must be a list' % n)
+		start_date, end_date = _day(scenario['start_date'], 'scenario %d start_date' % n), _day(scenario['end_date'], 'scenario %d end_date' % n)
+		if end_date < start_date:
+			raise ValueError('scenario %d ends before it starts' % n)
+		start_date, end_date = max(start_date, first_day), min(end_date, last_day)
+		if end_date < start_date:
+			raise ValueError('scenario %d has no days between %s and %s' % (n, first_day, last_day))
+		if (end_date - start_date).days >= max_days:
+			raise ValueError('scenario %d covers more than %d days' % (n, max_days))
+		selections.add((state, scenario['time'], start_date, end_date))
+		if len(selections) > max_selections:
+			raise ValueError('at most %d distinct state, time and date selections can be run in one request' % max_selections)
+		parsed.append({'id': str(scenario.get('id', n)), 'state': state, 'time': scenario['time'], 'start_date': start_date,
+			'end_date': end_date, 'locations': [_integer(code, 'scenario %d location' % n) for code in scenario['locations']]})
+	return parsed
+
+
+def risk_batches(scenarios):
+	"""Computes the scenarios one selection (state, time and dates) at a time.
+
+    Yields:
+        pandas.DataFrame: The long results of every scenario sharing a selection.
+    """
+	selections = {}
+	for scenario in scenarios:
+		selections.setdefault((scenario['state'], scenario['time'], scenario['start_date'], scenario['end_date']), []).append(scenario)
+	for (state, time, start_date, end_date), group in selections.items():
+		risk = get_fb_risk_batch(get_fb_flows(time, state, start_date, end_date), [scenario['locations'] for scenario in group], state)
+		lgas = lga_registry()[state]  # Rows of the risk frame follow the registry order
+		yield pd.DataFrame({'scenario': np.repeat([scenario['id'] for scenario in group], len(lgas)), 'state': state,
+			'LGA_CODE19': np.tile(lgas.codes, len(group)), 'LGA_NAME19': np.tile(lgas.names, len(group)), 'risk': risk.to_numpy().T.ravel()})
+
+
+@server.route('/api/risk/batch', methods=['POST'])
+def risk_batch():
+	"""Runs a batch of outbreak scenarios and streams the risk estimates back as CSV or Parquet."""
+	body = flask.request.get_json(silent=True)
+	if not isinstance(body, dict):
+		return {'error': 'expected a JSON object'}, 400
+	output_format = body.get('format', 'csv')
+	if output_format not in ('csv', 'parquet'):
+		return {'error': 'format must be csv or parquet'}, 400
+	try:
+		scenarios = parse_scenarios(body)
+	except (TypeError, ValueError) as e:
+		return {'error': str(e)}, 400
+	chunks = (csv_chunks if output_format == 'csv' else parquet_chunks)(risk_batches(scenarios))
+	return flask.Response(flask.stream_with_context(chunks), mimetype=formats[output_format][0],
+		headers={'Content-Disposition': 'attachment; filename=risk_batch.%s' % formats[output_format][1]})
+
+
+@server.route('/export/risk')
+def export_risk():
+	"""Streams the risk estimate of one selection with the LGA attributes as CSV, Parquet or GeoJSON."""
+	args = flask.request.args
+	output_format = args.get('format', 'csv')
+	if output_format not in formats:
+		return {'error': 'format must be one of %s' % ', '.join(formats)}, 400
+	resolution = args.get('resolution', 'lga')
+	if resolution not in resolutions:
+		return {'error': 'resolution must be one of %s' % ', '.join(resolutions)}, 400
+	if resolution == 'sa2':
+		try:
+			locations = [int(code) for code in args.get('locations', '').split(',') if code]
+		except ValueError as e:
+			return {'error': str(e)}, 400
+		risk_estimate = sa2Functions.get_sa2_risk_estimate(locations)
+		chunks = export_chunks(risk_estimate, sa2Functions.sa2_state, output_format, resolution)
+		return flask.Response(flask.stream_with_context(chunks), mimetype=formats[output_format][0],
+			headers={'Content-Disposition': 'attachment; filename=Risk_by_SA2.%s' % formats[output_format][1]})
+	try:
+		locations = [code for code in args.get('locations', '').split(',') if code]
+		fields = {key: args[key] for key in ('state', 'time', 'start_date', 'end_date') if key in args}
+		scenario, = parse_scenarios({'scenarios': [dict(fields, locations=locations)]})
+	except (TypeError, ValueError) as e:
+		return {'error': str(e)}, 400
+	risk_estimate = get_fb_risk_estimate(scenario['time'], scenario['state'], scenario['locations'], scenario['start_date'], scenario['end_date'])
+	chunks = export_chunks(risk_estimate, scenario['state'], output_format)
+	return flask.Response(flask.stream_with_context(chunks), mimetype=formats[output_format][0],
+		headers={'Content-Disposition': 'attachment; filename=Risk_by_LGA.%s' % formats[output_format][1]})
@@ -0,0 +1,123 @@
+import numpy as np
+from scipy import sparse
+
+
+###############################################################################################################################
+# Sparse risk engine
+###############################################################################################################################
+#
+# Each state has a fixed, sorted index of region codes. Flows are turned straight from the long edge list into a
+# CSR matrix whose rows (sources) and columns (targets) follow that index, so nothing is pivoted or re-sorted per
+# request and risk vectors always line up with the same codes.
+
+class RegionIndex:
+	"""A stable mapping between region codes and matrix rows.
+
+    Args:
+        codes (array-like): The region codes (as int's) in this index. They are stored sorted.
+    """
+
+	def __init__(self, codes):
+		self.codes = np.unique(np.asarray(codes, dtype=np.int64))
+		self.codes.flags.writeable = False
+
+	def __len__(self):
+		return len(self.codes)
+
+	def positions(self, codes):
+		"""Looks up the rows of a set of codes.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): The row of every code and a mask of which codes are in the index.
+        """
+		codes = np.asarray(codes, dtype=np.int64)
+		if len(self.codes) == 0:
+			return np.zeros(len(codes), dtype=np.int64), np.zeros(len(codes), dtype=bool)
+		rows = np.searchsorted(self.codes, codes).clip(max=len(self.codes) - 1)
+		return rows, self.codes[rows] == codes
+
+
+def state_indexes(codes, state_of=lambda code: code // 10000):
+	"""Splits a collection of region codes into one RegionIndex per state."""
+	codes = np.asarray(list(codes), dtype=np.int64)
+	states = state_of(codes)
+	return {int(state): RegionIndex(codes[states == state]) for state in np.unique(states)}
+
+
+def od_matrix(ODflows, index, source='LGA19_source', target='LGA19_target', count='n_trips'):
+	"""Builds a CSR origin-destination matrix aligned to an index from a long edge list.
+
+    Flows with an origin or destination outside the index are dropped and repeated edges are summed.
+
+    Args:
+        ODflows (pandas.Dataframe): An origin-destination dataframe in long format.
+        index (RegionIndex): The index that rows and columns should follow.
+
+    Returns:
+        scipy.sparse.csr_matrix: A len(index) x len(index) matrix of flows from row to column.
+    """
+	rows, valid_rows = index.positions(ODflows[source].to_numpy())
+	cols, valid_cols = index.positions(ODflows[target].to_numpy())
+	keep = valid_rows & valid_cols
+	values = ODflows[count].to_numpy(dtype=np.float64)[keep]
+	return sparse.csr_matrix((values, (rows[keep], cols[keep])), shape=(len(index), len(index)))
+
+
+def prevalence_vector(index, locations):
+	"""Builds the 0/1 prevalence vector of outbreak locations aligned to an index."""
+	p = np.zeros(len(index))
+	rows, valid = index.positions(list(locations))
+	p[rows[valid]] = 1
+	return p
+
+
+def risk_vector(ODmatrix, index, locations):
+	"""Calculates the normalised risk of every region in an index.
+
+    Args:
+        ODmatrix (scipy.sparse.csr_matrix): Flows aligned to `index` (see od_matrix).
+        index (RegionIndex): The index the matrix follows.
+        locations (list): Region codes the outbreak is started from. If empty, a generalised risk map is made
+            from the total flow into each region.
+
+    Returns:
+        numpy.ndarray: Risk estimates aligned to index.codes, summing to 1 (or all 0 when there are no flows).
+    """
+	if len(locations) == 0:
+		risk = np.asarray(ODmatrix.sum(axis=0)).ravel()
+	else:
+		risk = ODmatrix @ prevalence_vector(index, locations)
+	total = risk.sum()
+	return risk / total if total > 0 else risk
+
+
+def prevalence_matrix(index, location_sets):
+	"""Stacks the prevalence vectors of several sets of outbreak locations as the columns of a sparse matrix."""
+	rows, columns = [], []
+	for column, locations in enumerate(location_sets):
+		positions, valid = index.positions(list(locations))
+		positions = np.unique(positions[valid])
+		rows.append(positions)
+		columns.append(np.full(len(positions), column))
+	rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+	columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+	return sparse.csc_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(index), len(location_sets)))
+
+
+def risk_matrix(ODmatrix, index, location_sets):
+	"""Calculates the risk vectors of many outbreak scenarios over the same flows with one matrix product.
+
+    Args:
+        ODmatrix (scipy.sparse.csr_matrix): Flows aligned to `index` (see od_matrix).
+        index (RegionIndex): The index the matrix follows.
+        location_sets (list): One list of region codes per scenario. An empty list gives the generalised risk map.
+
+    Returns:
+        numpy.ndarray: A len(index) x len(location_sets) array whose columns match risk_vector for each scenario.
+    """
+	risk = np.asarray((ODmatrix @ prevalence_matrix(index, location_sets)).todense())
+	general = np.array([len(locations) == 0 for locations in location_sets], dtype=bool)
+	if general.any():
+		risk[:, general] = np.asarray(ODmatrix.sum(axis=0)).reshape(-1, 1)
+	totals = risk.sum(axis=0)
+	return np.divide(risk, totals, out=np.zeros_like(risk), where=totals > 0)
@@ -0,0 +1,126 @@
+import io, json
+import numpy as np
+import pandas as pd
+from .facebookFunctions import region_geometry, region_registry, state_fullname_map
+
+
+###############################################################################################################################
+# Streaming risk exports
+###############################################################################################################################
+#
+# Risk values are joined against the geometry-free arrays of the LGA registry and written out in chunks as CSV,
+# Parquet or GeoJSON, so an export never holds more than a chunk of encoded output, and the polygons are only read
+# for GeoJSON (from the pre-simplified payload the map already uses).
+
+chunk_rows = 5000
+formats = {'csv': ('text/csv', 'csv'), 'parquet': ('application/vnd.apache.parquet', 'parquet'),
+	'geojson': ('application/geo+json', 'geojson')}
+export_columns = ['LGA_CODE19', 'LGA_NAME19', 'STE_NAME16', 'AREASQKM19', 'Population', 'Median Age']
+id_columns = {'lga': ('LGA_CODE19', 'LGA_NAME19'), 'sa2': ('SA2_ID', 'SA2_NAME')}  # The first two columns at each resolution
+
+
+def _counts(values):
+	# Whole numbers are written without a decimal point, with empty cells where unknown
+	values = pd.array(values, dtype='Float64')
+	return values.astype('Int64') if (values.dropna() % 1 == 0).all() else values
+
+
+def risk_table(risk_estimate, state, resolution='lga'):
+	"""Joins a risk estimate ({ region code : risk }) to the attributes of the state's regions that have a boundary.
+
+    Returns:
+        pandas.DataFrame: export_columns and 'Risk Potential', with the id columns named for the resolution (see id_columns).
+    """
+	lgas = region_registry(resolution)[state]
+	rows, valid = lgas.positions(list(risk_estimate.keys()))
+	risk = np.fromiter(risk_estimate.values(), dtype=np.float64, count=len(risk_estimate))[valid]
+	rows = rows[valid]
+	known = ~np.isnan(lgas.areas[rows])  # LGAs outside the boundary file (e.g. no usual address) are left out
+	rows, risk = rows[known], risk[known]
+	code_column, name_column = id_columns[resolution]
+	return pd.DataFrame({code_column: lgas.codes[rows], name_column: lgas.names[rows], 'STE_NAME16': state_fullname_map[state],
+		'AREASQKM19': lgas.areas[rows], 'Population': _counts(lgas.populations[rows]),
+		'Median Age': _counts(lgas.median_ages[rows]), 'Risk Potential': risk}, columns=[code_column, name_column] + export_columns[2:] + ['Risk Potential'])
+
+
+def chunks(frame):
+	for start in range(0, len(frame), chunk_rows):
+		yield frame.iloc[start:start + chunk_rows]
+
+
+def csv_chunks(frames):
+	"""Encodes a sequence of frames as one CSV, with the header on the first."""
+	header = True
+	for frame in frames:
+		yield frame.to_csv(index=False, header=header)
+		header = False
+
+
+class StreamSink(io.RawIOBase):
+	"""A write-only file that keeps what is written until it is taken, while reporting the true position to pyarrow."""
+
+	def __init__(self):
+		self._chunks = []
+		self._position = 0
+
+	def writable(self):
+		return True
+
+	def write(self, data):
+		self._chunks.append(bytes(data))
+		self._position += len(data)
+		return len(data)
+
+	def tell(self):
+		return self._position
+
+	def take(self):
+		data = b''.join(self._chunks)
+		self._chunks = []
+		return data
+
+
+def parquet_chunks(frames):
+	"""Writes each frame as a Parquet row group, yielding the bytes as soon as they are written."""
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+	sink = StreamSink()
+	writer = None
+	for frame in frames:
+		table = pa.Table.from_pandas(frame, preserve_index=False)
+		if writer is None:
+			writer = pq.ParquetWriter(sink, table.schema)
+		writer.write_table(table)
+		yield sink.take()
+	if writer is not None:
+		writer.close()
+	yield sink.take()
+
+
+def geojson_chunks(table, state, resolution='lga'):
+	"""Encodes the risk table as a GeoJSON FeatureCollection using the state's pre-simplified polygons."""
+	payload = region_geometry(resolution, state)
+	code_column = table.columns[0]
+	features = payload['geojson']['features']
+	yield '{"type":"FeatureCollection","features":['
+	separator = ''
+	for frame in chunks(table):
+		encoded = []
+		frame = frame.astype(object).where(frame.notna(), None)  # Unknown values (NA or NaN) are written as null
+		for row in frame.to_dict('records'):
+			position = payload['index'].get(row[code_column])
+			if position is not None:
+				encoded.append(json.dumps({'type': 'Feature', 'id': row[code_column], 'properties': row,
+					'geometry': features[position]['geometry']}, separators=(',', ':')))
+		if encoded:
+			yield separator + ','.join(encoded)
+			separator = ','
+	yield ']}'
+
+
+def export_chunks(risk_estimate, state, output_format, resolution='lga'):
+	"""Streams a risk estimate with its region attributes in 'csv', 'parquet' or 'geojson'."""
+	table = risk_table(risk_estimate, state, resolution)
+	if output_format == 'geojson':
+		return geojson_chunks(table, state, resolution)
+	return (csv_chunks if output_format == 'csv' else parquet_chunks)(chunks(table))
@@ -0,0 +1,51 @@
+import base64, hashlib
+import numpy as np
+
+
+###############################################################################################################################
+# Compact risk payload
+###############################################################################################################################
+#
+# A risk estimate is sent to the browser as the base64 of a little-endian float32 array in the order of the state's LGA
+# registry (see lgaRegistry), with the selection it was made for and an etag of its values:
+#     {"v": 1, "state": 1, "resolution": "lga", "time": "*", "start_date": ..., "end_date": ..., "locations": [...],
+#      "etag": "...", "dtype": "float32", "data": "<base64>"}
+# The codes and names are not repeated in every estimate; the page holds them once per state. The server decodes it
+# with np.frombuffer and the browser with a Float32Array, both views of the decoded bytes.
+
+payload_version = 1
+dtype = np.dtype('<f4')
+
+
+def encode(risk_estimate, lgas, **selection):
+	"""Packs a risk estimate ({ LGA code : risk }) aligned to a state's registry entry.
+
+    Args:
+        lgas (lgaRegistry.StateLGAs): The registry entry the values are aligned to.
+        **selection: state, resolution, time, start_date, end_date and locations, carried along with the values.
+
+    Returns:
+        dict: The payload; LGAs missing from the estimate get 0.
+    """
+	values = np.zeros(len(lgas), dtype=dtype)
+	rows, valid = lgas.positions(list(risk_estimate.keys()))
+	values[rows[valid]] = np.fromiter(risk_estimate.values(), dtype=np.float64, count=len(risk_estimate))[valid]
+	data = values.tobytes()
+	# The same state's LGA and SA2 estimates can have identical bytes, so the resolution is part of the etag too
+	scope = '%d:%s:%s:' % (payload_version, selection.get('state'), selection.get('resolution', 'lga'))
+	etag = hashlib.sha1(scope.encode() + data).hexdigest()[:16]
+	return dict(selection, v=payload_version, etag=etag, dtype='float32', data=base64.b64encode(data).decode('ascii'))
+
+
+def decode(payload, lgas):
+	"""Returns the risk values of a payload as a read-only float32 array aligned to `lgas`.
+
+    Raises:
+        ValueError: If the payload has another version or does not match the registry entry.
+    """
+	if payload.get('v') != payload_version or payload.get('dtype') != 'float32':
+		raise ValueError('Unsupported risk payload version %r' % payload.get('v'))
+	values = np.frombuffer(base64.b64decode(payload['data']), dtype=dtype)
+	if len(values) != len(lgas):
+		raise ValueError('Risk payload has %d values for %d LGAs' % (len(values), len(lgas)))
+	return values
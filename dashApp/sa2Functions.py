@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from .params import here
+from . import flowSources, geometry, riskEngine, sharedData
+from .lazyData import Lazy
+from .lgaRegistry import LGARegistry, StateLGAs
+
+
+###############################################################################################################################
+# SA2 resolution
+###############################################################################################################################
+#
+# The bundled SA2 data covers South Australia only: SA2GeoJson.gjson holds 106 SA2 regions (mostly metropolitan
+# Adelaide) whose "id" is the group id used by the AddInsights flows in example_addinsights_data.csv, and
+# SA2_population.csv holds the ABS age profile of every SA2, joined to the regions by name. The flows are a single
+# sample without dates or time slices, so SA2 risk estimates are made over the whole sample.
+#
+# The regions use the same machinery as the LGA level: a fixed RegionIndex, a sparse OD matrix built once, a registry
+# entry of names and attributes in index order and a pre-serialised geometry payload.
+
+sa2_state = 4  # South Australia
+
+
+def _load_sa2_geo_df():
+	import geopandas
+	sa2_geo_df = geopandas.read_file(here+"/data/SA2GeoJson.gjson")
+	sa2_geo_df['SA2_NAME'] = sa2_geo_df.name.str.split('-', n=3).str[3]  # e.g. SA2-8-1575-Aldgate - Stirling
+	sa2_geo_df['AREASQKM'] = sa2_geo_df.geometry.to_crs(3577).area / 1e6  # Australian Albers equal area
+	return sa2_geo_df.sort_values('id')
+# Only needed to build the SA2 registry and payloads, so not preloaded once they are published or on disk
+sa2_geo_df = Lazy('SA2 geometry', _load_sa2_geo_df,
+	preload=lambda: not sharedData.published('sa2_registry') or not geometry.payloads_ready('sa2', [sa2_state]))
+
+
+def _normalise(names):
+	return names.str.lower().str.replace(r'[^a-z0-9]+', '', regex=True)
+
+
+def median_age(age_counts, band_starts, band_width=5):
+	"""Estimates the median age of each row of 5-year age band counts, interpolating within the median band."""
+	counts = np.asarray(age_counts, dtype=np.float64)
+	cumulative = counts.cumsum(axis=1)
+	half = cumulative[:, -1:] / 2
+	band = (cumulative < half).sum(axis=1).clip(max=counts.shape[1] - 1)
+	rows = np.arange(len(counts))
+	below = np.where(band > 0, cumulative[rows, band - 1], 0)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		fraction = (half[:, 0] - below) / counts[rows, band]
+	return np.asarray(band_starts, dtype=np.float64)[band] + band_width * fraction
+
+
+def _load_sa2_attributes():
+	population = pd.read_csv(here+"/data/SA2_population.csv", thousands=',')
+	population = population[population.Code.astype(str).str.startswith(str(sa2_state))]
+	bands = [column for column in population.columns if column.startswith('Persons - ') and column.endswith('(no.)')]
+	band_starts = [int(column.split(' ')[2].split('-')[0]) for column in bands]
+	attributes = pd.DataFrame({'key': _normalise(population.Label), 'Population': population[bands].sum(axis=1).to_numpy(),
+		'Median Age': median_age(population[bands].to_numpy(), band_starts).round()})
+	regions = sa2_geo_df()
+	regions = pd.DataFrame({'id': regions.id.to_numpy(), 'key': _normalise(regions.normalname), 'AREASQKM19': regions.AREASQKM.to_numpy()})
+	# Industrial and airport SA2s have no row in the population table and are left as unknown
+	return regions.merge(attributes.drop_duplicates('key'), on='key', how='left').set_index('id')
+sa2_attributes = Lazy('SA2 attributes', _load_sa2_attributes, preload=lambda: not sharedData.published('sa2_registry'))
+
+
+# The fixed SA2 index the flows and risk vectors follow, taken from the shared SA2 registry when one is published
+sa2_index = sharedData.Shared('SA2 index', 'sa2_registry', lambda arrays, meta: LGARegistry.indexes_from_arrays(arrays)[sa2_state],
+	lambda: riskEngine.RegionIndex(sa2_geo_df().id))
+
+
+def build_sa2_registry():
+	"""Builds the SA2 registry from the SA2 geometry and population table (see data_updater/publish_shared.py)."""
+	index = riskEngine.RegionIndex(sa2_geo_df().id)
+	attributes = sa2_attributes().reindex(index.codes)
+	names = sa2_geo_df().set_index('id').SA2_NAME.reindex(index.codes).fillna('Error')
+	return LGARegistry({sa2_state: StateLGAs(index, names.to_numpy(), attributes.AREASQKM19.to_numpy(dtype=np.float64),
+		attributes.Population.to_numpy(dtype=np.float64), attributes['Median Age'].to_numpy(dtype=np.float64))})
+# Names, attributes and dropdown options of the SA2s in the same form as lga_registry, under the state they are in,
+# mapped from the shared copy when the pipeline has published one
+sa2_registry = sharedData.Shared('SA2 registry', 'sa2_registry',
+	lambda arrays, meta: LGARegistry.from_arrays(arrays, {sa2_state: sa2_index()}), build_sa2_registry)
+
+
+# Where the SA2 flows come from (see flowSources); a larger AddInsights export can be swapped in and is read in chunks
+sa2_source = flowSources.addinsights(here+"/data/example_addinsights_data.csv")
+
+# The AddInsights flows as a CSR matrix aligned to sa2_index, built once
+sa2_flows = Lazy('SA2 flows', lambda: flowSources.matrix(sa2_source.chunks(), sa2_index()))
+
+
+def get_sa2_risk_estimate(locations):
+	"""Calculates the risk estimate of every SA2 from the AddInsights sample.
+
+    Args:
+        locations (list): A list of SA2 ids (as int's) that the outbreak simulation should be started from.
+
+    Returns:
+        dict: A dictionary of { SA2 id : risk estimate } pairs which will be plotted.
+    """
+	index = sa2_index()
+	risk_vector = riskEngine.risk_vector(sa2_flows(), index, locations or [])
+	return dict(zip(index.codes.tolist(), risk_vector.tolist()))
+
+
+def sa2_geometry(level=geometry.default_level):
+	"""The pre-serialised SA2 polygons at a level of detail (see geometry), built from sa2_geo_df if not yet on disk."""
+	return geometry.load_payload('sa2', sa2_state, lambda tolerance: geometry.build_payload(sa2_geo_df(), 'id', tolerance), level)
@@ -1,11 +1,22 @@
 import dash
-from .params import requests_pathname_prefix
+from .params import requests_pathname_prefix, here, background_jobs
+from . import metrics
+
+# Background callbacks run in worker processes with their progress and results passed through a disk cache, so
+# long risk estimates do not hold the few WSGI threads the whole site shares
+background_callback_manager = None
+if background_jobs:
+    import diskcache
+    background_callback_manager = dash.DiskcacheManager(diskcache.Cache(here+'/data/job_cache'), expire=60*60)
 
 app = dash.Dash(__name__, external_stylesheets=['https://codepen.io/chriddyp/pen/bWLwgP.css'],
-                requests_pathname_prefix=requests_pathname_prefix) 
+                requests_pathname_prefix=requests_pathname_prefix, background_callback_manager=background_callback_manager) 
 
 app.title = "COVID-19 Spatial Risk Map"
 
+# Time every callback registered below and serve the measurements at /metrics (when enabled in params)
+metrics.instrument_app(app)
+
 # styles: for right side hover/click component
 styles = {
     'pre': {
@@ -0,0 +1,131 @@
+import os, json, logging, shutil, time
+import numpy as np
+from .params import here
+from .lazyData import Lazy
+
+
+###############################################################################################################################
+# Shared read-only datasets
+###############################################################################################################################
+#
+# Datasets the data pipeline produces once (see data_updater/publish_shared.py) are written as a directory of .npy
+# arrays and a meta.json per version, with a `current` file naming the version in use:
+#     data/shared/<dataset>/<version>/<array>.npy, data/shared/<dataset>/<version>/meta.json, data/shared/<dataset>/current
+# Every worker process memory maps the arrays read-only, so the operating system keeps one copy of them in the page
+# cache however many workers are running. A refresh writes a new version beside the old one and swaps `current` in a
+# single rename; workers notice within check_interval seconds and map the new version.
+
+shared_dir = here+'/data/shared'
+check_interval = 30  # Seconds between checks of a dataset's `current` file
+keep_versions = 2  # The current and previous versions are kept, so workers still mapping the previous one can finish
+logger = logging.getLogger(__name__)
+
+
+def _dataset_dir(dataset):
+	return os.path.join(shared_dir, dataset)
+
+
+def current_version(dataset):
+	"""The version of a dataset in use, or None if it has never been published."""
+	try:
+		with open(os.path.join(_dataset_dir(dataset), 'current')) as f:
+			return f.read().strip() or None
+	except FileNotFoundError:
+		return None
+
+
+def published(dataset):
+	"""Whether a version of a dataset has been published, e.g. to skip preloading what it replaces."""
+	return current_version(dataset) is not None
+
+
+def publish(dataset, arrays, meta=None):
+	"""Writes a new version of a dataset and makes it current.
+
+    Args:
+        dataset (str): Name of the dataset (e.g. "google_store").
+        arrays (dict): { name : numpy.ndarray }. Arrays must not hold Python objects, so strings are stored as
+            fixed width unicode.
+        meta (dict): Optional JSON-serialisable values stored with the arrays.
+
+    Returns:
+        str: The new version.
+    """
+	now = time.time()
+	version = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + '.%06d-%d' % (now % 1 * 1e6, os.getpid())  # Sorts by time
+	directory = os.path.join(_dataset_dir(dataset), version)
+	os.makedirs(directory + '.tmp')
+	for name, array in arrays.items():
+		array = np.ascontiguousarray(array)
+		if array.dtype == object:
+			raise ValueError('%s.%s holds Python objects and cannot be memory mapped' % (dataset, name))
+		np.save(os.path.join(directory + '.tmp', name + '.npy'), array, allow_pickle=False)
+	with open(os.path.join(directory + '.tmp', 'meta.json'), 'w') as f:
+		json.dump(meta or {}, f)
+	os.replace(directory + '.tmp', directory)
+
+	pointer = os.path.join(_dataset_dir(dataset), 'current')
+	with open(pointer + '.tmp', 'w') as f:
+		f.write(version)
+	os.replace(pointer + '.tmp', pointer)
+
+	versions = sorted(name for name in os.listdir(_dataset_dir(dataset)) if os.path.isdir(os.path.join(_dataset_dir(dataset), name))
+		and not name.endswith('.tmp'))
+	for old in versions[:-keep_versions]:
+		shutil.rmtree(os.path.join(_dataset_dir(dataset), old), ignore_errors=True)
+	return version
+
+
+def open_dataset(dataset, version):
+	"""Memory maps the arrays of a version of a dataset.
+
+    Returns:
+        (dict, dict): { name : read-only numpy.memmap } and the meta values.
+    """
+	directory = os.path.join(_dataset_dir(dataset), version)
+	with open(os.path.join(directory, 'meta.json')) as f:
+		meta = json.load(f)
+	arrays = {name[:-4]: np.load(os.path.join(directory, name), mmap_mode='r', allow_pickle=False)
+		for name in os.listdir(directory) if name.endswith('.npy')}
+	return arrays, meta
+
+
+class Shared(Lazy):
+	"""A Lazy that is built from the mapped arrays of a shared dataset when one has been published.
+
+    The value is rebuilt when a new version of the dataset is made current.
+
+    Args:
+        name (str): Name used when reporting load times.
+        dataset (str): The shared dataset.
+        wrap (callable): wrap(arrays, meta) builds the value from the mapped arrays. It may raise ValueError or
+            KeyError if they do not fit (e.g. an older format), and `fallback` is used instead.
+        fallback (callable): Builds the value when no usable version has been published.
+    """
+
+	def __init__(self, name, dataset, wrap, fallback):
+		self.dataset = dataset
+		self.version = None
+		self._wrap = wrap
+		self._fallback = fallback
+		self._next_check = 0
+		super().__init__(name, self._open)
+
+	def _open(self):
+		# The version is recorded even if it cannot be used, so it is not retried until another is published
+		self.version = current_version(self.dataset)
+		if self.version is not None:
+			try:
+				return self._wrap(*open_dataset(self.dataset, self.version))
+			except (OSError, ValueError, KeyError) as e:
+				logger.warning('Could not use shared %s version %s: %r', self.dataset, self.version, e)
+		return self._fallback()
+
+	def __call__(self):
+		if self._loaded and time.monotonic() >= self._next_check:
+			self._next_check = time.monotonic() + check_interval
+			if current_version(self.dataset) not in (self.version, None):
+				with self._lock:
+					if current_version(self.dataset) not in (self.version, None):
+						self._loaded = False
+		return super().__call__()
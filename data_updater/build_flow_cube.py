@@ -0,0 +1,27 @@
+print('Building Facebook flow cubes')
+# Run from the repository root: python data_updater/build_flow_cube.py [--start DATE] [--end DATE] [--days N] [--refresh-days N]
+# Only days the flow cache holds in full and that are past flowCache.settle_days go into the cubes, so the cubes end
+# a few days before today and catch up on the next run.
+import argparse, sys
+from datetime import date, timedelta
+sys.path.insert(0, '.')
+from dashApp.facebookFunctions import get_fb_data, lga_indexes, state_acronym_map
+from dashApp import flowCache, flowCube
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--end', default=(date.today() - timedelta(flowCache.settle_days + 1)).strftime('%Y-%m-%d'),
+                    help='Last day (default: the last settled day)')
+parser.add_argument('--days', type=int, default=365, help='Days covered up to --end when --start is not given')
+parser.add_argument('--start', help='First day (default: --days before --end)')
+parser.add_argument('--refresh-days', type=int, default=0, help='Trailing days of existing cubes to read again')
+args = parser.parse_args()
+end_date = args.end
+start_date = args.start or (flowCache.to_day(end_date) - timedelta(args.days - 1)).strftime('%Y-%m-%d')
+time_options = ['0000', '0800', '1600', '*']
+
+for state, region in state_acronym_map.items():
+    get_fb_data('*', region, start_date, end_date) # Fills the local flow cache, only querying days it does not hold
+    for time in time_options:
+        days = flowCube.build_cube(region, time, lga_indexes()[state], start_date, end_date,
+                                   lambda day: flowCache.read_days(region, [day], time), args.refresh_days)
+    print('Built', region, days, 'days')
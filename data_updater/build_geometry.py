@@ -0,0 +1,21 @@
+print('Building geometry payloads')
+# Run from the repository root: python data_updater/build_geometry.py
+import sys
+sys.path.insert(0, '.')
+import geopandas
+import pandas as pd
+from dashApp import geometry
+
+lga_df = geopandas.read_file('dashApp/data/LGA_shapefile.geojson')
+lga_df.LGA_CODE19 = pd.to_numeric(lga_df.LGA_CODE19)
+lga_df.STE_CODE16 = pd.to_numeric(lga_df.STE_CODE16)
+for state, state_df in lga_df.groupby('STE_CODE16'):
+    geometry.write_payloads('lga', state, state_df, 'LGA_CODE19') # Every level of detail (see geometry.lod_levels)
+geometry.write_attributes(pd.DataFrame(lga_df.drop(columns='geometry')))
+
+google_df = geopandas.read_file('dashApp/data/google.gpkg').rename({'area':'Council'}, axis='columns')
+for state, state_df in google_df.groupby('state'):
+    geometry.write_payloads('google', state, state_df, 'Council')
+
+from dashApp import sa2Functions
+geometry.write_payloads('sa2', sa2Functions.sa2_state, sa2Functions.sa2_geo_df(), 'id')
@@ -1,18 +1,83 @@
 print('Downloading Google data')
+# Streams the global report and appends only the Australian rows newer than the latest date in the stored CSV.
+# Nothing is written when there is no new data, so there is nothing to commit. google_data.txt records the latest date
+# appended; it is not read back, so a stale copy cannot cause duplicate rows.
+# This step only needs pandas, so it also runs in the GitHub Action. The store and views the app serves are built
+# from the CSV on the serving host by data_updater/materialise_google.py (see download_google.sh).
+import io, os, sys
+import urllib.request
 import pandas as pd
 
+source = 'https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv'
+output = 'dashApp/data/google_mobility_australia.csv'
+high_water_file = 'dashApp/data/google_data.txt'
+batch_lines = 50000 # Australian lines parsed at a time, which bounds memory use
+
 variables_to_plot = ['retail_and_recreation_percent_change_from_baseline',
        'grocery_and_pharmacy_percent_change_from_baseline',
        'parks_percent_change_from_baseline',
        'transit_stations_percent_change_from_baseline',
        'workplaces_percent_change_from_baseline',
        'residential_percent_change_from_baseline']
-       
+columns = ['country_region_code', 'country_region', 'state', 'Council', 'date']+variables_to_plot
+
+key_columns = ['state', 'Council', 'date']
+
+
+def latest_stored_date():
+    """The latest date in the stored CSV, read a batch at a time, or None without a stored CSV."""
+    if not os.path.exists(output):
+        return None
+    latest = None
+    for batch in pd.read_csv(output, usecols=['date'], parse_dates=['date'], chunksize=batch_lines * 4):
+        if len(batch) > 0 and (latest is None or batch.date.max() > latest):
+            latest = batch.date.max()
+    return latest
+
+
+# The latest date already stored. Without a stored CSV everything is downloaded.
+high_water = latest_stored_date()
+print('Stored data runs to', high_water)
+
+
+def australian_batches(response):
+    """Yields the header line and batches of raw Australian lines, filtering before any parsing.
+
+    The report is ordered by country code, so reading stops once the Australian block has been passed.
+    """
+    header = response.readline().decode('utf-8')
+    lines, seen_australia = [], False
+    for line in response:
+        if line.startswith(b'AU,'):
+            seen_australia = True
+            lines.append(line.decode('utf-8'))
+            if len(lines) >= batch_lines:
+                yield header, lines
+                lines = []
+        elif seen_australia:
+            break
+    if lines:
+        yield header, lines
+
+
+new_rows = []
+with urllib.request.urlopen(source) as response:
+    for header, lines in australian_batches(response):
+        google = pd.read_csv(io.StringIO(header + ''.join(lines)), parse_dates=['date'],
+                             usecols=['country_region_code', 'country_region', 'sub_region_1', 'sub_region_2', 'date']+variables_to_plot)
+        if high_water is not None:
+            google = google[google.date > high_water]
+        google.rename({'sub_region_1':'state', 'sub_region_2':'Council'}, axis=1, inplace=True) # For clarity
+        new_rows.append(google[columns])
 
-google = pd.read_csv('https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv',parse_dates=['date'])
-google = google.query("country_region_code=='AU'")
-google.rename({'sub_region_1':'state', 'sub_region_2':'Council'}, axis=1, inplace=True) # For clarity
-google = google[['country_region_code', 'country_region', 'state', 'Council', 'date']+variables_to_plot]
-google.to_csv('dashApp/data/google_mobility_australia.csv', index=False)
+google = pd.concat(new_rows) if new_rows else pd.DataFrame(columns=columns)
+google = google.drop_duplicates(key_columns, keep='last')  # Repeated rows within the report itself
+if len(google) == 0:
+    print('No new data since', high_water.strftime('%Y-%m-%d') if high_water is not None else 'the start')
+    sys.exit(0)
 
+google.to_csv(output, index=False, mode='a' if high_water is not None else 'w', header=high_water is None, date_format='%Y-%m-%d')
+print('Added %d rows up to %s' % (len(google), google.date.max().strftime('%Y-%m-%d')))
 
+with open(high_water_file, 'w') as f:
+    f.write(google.date.max().strftime('%Y-%m-%d'))
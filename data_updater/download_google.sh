@@ -1,8 +1,14 @@
 git -C /home/tobin/CovidMobilityApp pull --rebase
 
 python /home/tobin/CovidMobilityApp/data_updater/download_google.py
+# Build and publish what the app serves from the CSV; this needs the app's dependencies, so it runs here and not in the Action
+python /home/tobin/CovidMobilityApp/data_updater/materialise_google.py
 
-git -C /home/tobin/CovidMobilityApp add /home/tobin/CovidMobilityApp/dashApp/data/google_mobility_australia.csv
-git -C /home/tobin/CovidMobilityApp add /home/tobin/CovidMobilityApp/dashApp/data/google_data.txt
-git -C /home/tobin/CovidMobilityApp commit -am "Updating Google Data for App"
-git -C /home/tobin/CovidMobilityApp push
+# Only commit when the updater appended new data
+if ! git -C /home/tobin/CovidMobilityApp diff --quiet -- dashApp/data/google_mobility_australia.csv dashApp/data/google_data.txt
+then
+    git -C /home/tobin/CovidMobilityApp add /home/tobin/CovidMobilityApp/dashApp/data/google_mobility_australia.csv
+    git -C /home/tobin/CovidMobilityApp add /home/tobin/CovidMobilityApp/dashApp/data/google_data.txt
+    git -C /home/tobin/CovidMobilityApp commit -m "Updating Google Data for App"
+    git -C /home/tobin/CovidMobilityApp push
+fi
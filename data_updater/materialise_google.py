@@ -0,0 +1,11 @@
+print('Materialising Google store and views')
+# Run from the repository root on the serving host, after download_google.py: python data_updater/materialise_google.py
+# Rebuilds the indexed store and the map/time series views from dashApp/data/google_mobility_australia.csv and
+# publishes them to the workers (see dashApp/googleStore.py and dashApp/sharedData.py).
+import sys
+sys.path.insert(0, '.')
+from dashApp import googleStore
+from dashApp.googleMobilityFunctions import variables_to_plot
+
+googleStore.materialise(variables_to_plot)
+print('Materialised and published Google store and views')
@@ -0,0 +1,46 @@
+print('Precomputing generalised risk maps')
+# Run from the repository root: python data_updater/precompute_risk.py [end_date] [workers]
+# Computes the risk map with no outbreak centres for every state, time slice and standard window (the last day, the
+# last 7 and 28 days, and the dates the app opens on) so those selections are served without any computation.
+# end_date defaults to the last settled day; windows ending on a day within flowCache.settle_days are skipped, since
+# their flows may still be filling upstream.
+import sys, time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+sys.path.insert(0, '.')
+from dashApp.facebookFunctions import get_fb_data, get_fb_flows, get_fb_risk, state_acronym_map, default_start_date, default_end_date
+from dashApp import flowCache, precomputedRisk
+
+time_options = ['0000', '0800', '1600', '*']
+window_days = [1, 7, 28]
+
+
+def windows(end_date):
+    end = flowCache.to_day(end_date)
+    selections = [(end - timedelta(days - 1), end) for days in window_days] + [(flowCache.to_day(default_start_date), flowCache.to_day(default_end_date))]
+    return [(start, end) for start, end in selections if flowCache.settled(end)]
+
+
+def precompute(state, time_option, start, end):
+    started = time.perf_counter()
+    risk = get_fb_risk(get_fb_flows(time_option, state, start, end), [], state)
+    precomputedRisk.save(state_acronym_map[state], time_option, start, end, list(risk.keys()), list(risk.values()))
+    return state_acronym_map[state], time_option, start, end, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    end_date = sys.argv[1] if len(sys.argv) > 1 else (date.today() - timedelta(flowCache.settle_days + 1)).strftime('%Y-%m-%d')
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    # Fill the local flow cache first, one region at a time, so the workers only read local files
+    selections = windows(end_date)
+    for region in state_acronym_map.values():
+        for start, end in selections:
+            get_fb_data('*', region, start, end)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [executor.submit(precompute, state, time_option, start, end)
+                for state in state_acronym_map for time_option in time_options for start, end in selections]
+        for job in jobs:
+            region, time_option, start, end, seconds = job.result()
+            print('Precomputed %s %s %s to %s in %.2fs' % (region, time_option, start, end, seconds))
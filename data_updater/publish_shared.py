@@ -0,0 +1,28 @@
+print('Publishing shared datasets')
+# Run from the repository root: python data_updater/publish_shared.py
+# Writes the Google store and views, the LGA and SA2 registries and the geometry payloads as new versions of the shared
+# datasets every worker process memory maps (see dashApp/sharedData.py). Running workers switch to them within
+# sharedData.check_interval seconds, and no longer preload the source data these replace.
+# Run data_updater/build_geometry.py first so every payload is on disk.
+import sys
+sys.path.insert(0, '.')
+from dashApp import facebookFunctions, geometry, googleStore, riskEngine, sa2Functions, sharedData
+from dashApp.googleMobilityFunctions import variables_to_plot
+from dashApp.lgaRegistry import LGARegistry
+
+store = googleStore.load_store(variables_to_plot)
+store.publish()
+googleStore.load_views(store).publish()
+print('Published Google store and views')
+
+# Built from the source data rather than lga_indexes, which may come from the previously published registry
+indexes = riskEngine.state_indexes(facebookFunctions.lga_name_map().keys())
+registry = LGARegistry.build(indexes, facebookFunctions.lga_name_map(), facebookFunctions.lga_attributes())
+sharedData.publish('lga_registry', registry.arrays())
+print('Published LGA registry')
+
+sharedData.publish('sa2_registry', sa2Functions.build_sa2_registry().arrays())
+print('Published SA2 registry')
+
+geometry.publish_payloads()
+print('Published geometry payloads')
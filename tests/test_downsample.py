@@ -0,0 +1,22 @@
+import numpy as np
+from dashApp.downsample import lttb
+
+
+def test_short_series_are_kept_whole():
+	assert lttb(np.arange(5), np.ones(5), 5).tolist() == [0, 1, 2, 3, 4]
+	assert lttb(np.arange(5), np.ones(5), 400).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_kept_points_include_the_ends_in_order():
+	x = np.arange(1000)
+	y = np.sin(x / 25) + np.random.default_rng(0).normal(0, 0.1, len(x))
+	kept = lttb(x, y, 100)
+	assert len(kept) == 100 and kept[0] == 0 and kept[-1] == len(x) - 1
+	assert (np.diff(kept) > 0).all()
+
+
+def test_peaks_survive():
+	y = np.zeros(500)
+	y[123], y[377] = 10, -10
+	kept = lttb(np.arange(500), y, 20)
+	assert 123 in kept and 377 in kept
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from dashApp import flowCache
+
+
+class CountingSource:
+	"""A flow source returning one flow per day and recording the days it was asked for."""
+
+	def __init__(self):
+		self.requested = []
+
+	def chunks(self, region, start_date, end_date):
+		days = flowCache.date_range(start_date, end_date)
+		self.requested.extend(days)
+		yield pd.DataFrame({'date': [day.strftime('%Y-%m-%d') for day in days], 'time': '0800',
+			'LGA19_source': 10050, 'LGA19_target': 10050, 'n_trips': 5})
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+	monkeypatch.setattr(flowCache, 'cache_dir', str(tmp_path))
+
+
+def test_recent_day_with_flows_is_fetched_again():
+	source = CountingSource()
+	day = date.today() - timedelta(days=1)
+	flowCache.read_through('NSW', day, day, '*', source)
+	flowCache.read_through('NSW', day, day, '*', source)
+	assert source.requested == [day, day]
+	assert flowCache.missing_days('NSW', day, day) == [day]
+
+
+def test_settled_day_is_fetched_once():
+	source = CountingSource()
+	day = date.today() - timedelta(days=flowCache.settle_days + 1)
+	first = flowCache.read_through('NSW', day, day, '*', source)
+	second = flowCache.read_through('NSW', day, day, '*', source)
+	assert source.requested == [day]
+	assert first['n_trips'].tolist() == second['n_trips'].tolist() == [5]
+
+
+def test_empty_settled_day_is_marked_complete():
+	day = date.today() - timedelta(days=flowCache.settle_days + 1)
+	flowCache.write_day('NSW', day, pd.DataFrame(columns=['date', 'time'] + flowCache.flow_columns))
+	assert flowCache.missing_days('NSW', day, day) == []
@@ -0,0 +1,87 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from dashApp import flowCache, flowCube, riskEngine
+
+index = riskEngine.RegionIndex([10050, 10180, 10250, 10300])
+origin = date(2021, 1, 1)
+
+
+def flows_on(day, extra=0):
+	rng = np.random.default_rng(day.toordinal())
+	codes = index.codes
+	return pd.DataFrame({'LGA19_source': rng.choice(codes, 6), 'LGA19_target': rng.choice(codes, 6),
+		'n_trips': rng.integers(1, 50, 6) + extra})
+
+
+def summed(start, end, read_day=flows_on):
+	days = flowCache.date_range(start, end)
+	return riskEngine.od_matrix(pd.concat([read_day(day) for day in days]), index).toarray()
+
+
+@pytest.fixture(autouse=True)
+def cube_dir(tmp_path, monkeypatch):
+	monkeypatch.setattr(flowCube, 'cube_dir', str(tmp_path))
+	monkeypatch.setattr(flowCube, 'block_days', 4)
+
+
+def build(end, read_day=flows_on, **kwargs):
+	kwargs.setdefault('complete', lambda day: True)
+	return flowCube.build_cube('NSW', '*', index, origin, end, read_day, **kwargs)
+
+
+def test_ranges_match_daily_sums():
+	assert build(origin + timedelta(days=9)) == 10
+	for first, last in [(0, 0), (0, 9), (3, 4), (4, 7), (5, 9)]:
+		start, end = origin + timedelta(days=first), origin + timedelta(days=last)
+		assert np.allclose(flowCube.range_matrix('NSW', '*', index, start, end).toarray(), summed(start, end))
+	assert flowCube.range_matrix('NSW', '*', index, origin, origin + timedelta(days=10)) is None
+
+
+def test_extension_matches_a_full_build():
+	build(origin + timedelta(days=5))
+	build(origin + timedelta(days=10))
+	end = origin + timedelta(days=10)
+	assert np.allclose(flowCube.range_matrix('NSW', '*', index, origin + timedelta(days=2), end).toarray(),
+		summed(origin + timedelta(days=2), end))
+
+
+def test_build_stops_at_the_first_incomplete_day():
+	assert build(origin + timedelta(days=9), complete=lambda day: day < origin + timedelta(days=6)) == 6
+	assert flowCube.range_matrix('NSW', '*', index, origin, origin + timedelta(days=6)) is None
+
+
+def test_refresh_reads_the_trailing_days_again():
+	build(origin + timedelta(days=9))
+	corrected = lambda day: flows_on(day, extra=100 if day == origin + timedelta(days=7) else 0)
+	build(origin + timedelta(days=9), corrected)
+	assert not np.allclose(flowCube.range_matrix('NSW', '*', index, origin, origin + timedelta(days=9)).toarray(),
+		summed(origin, origin + timedelta(days=9), corrected))
+	build(origin + timedelta(days=9), corrected, refresh_days=3)
+	assert np.allclose(flowCube.range_matrix('NSW', '*', index, origin, origin + timedelta(days=9)).toarray(),
+		summed(origin, origin + timedelta(days=9), corrected))
+
+
+def test_default_skips_days_that_are_not_settled(tmp_path, monkeypatch):
+	monkeypatch.setattr(flowCache, 'cache_dir', str(tmp_path / 'cache'))
+	recent = date.today() - timedelta(days=flowCache.settle_days + 1)
+	for day in flowCache.date_range(recent, date.today()):
+		flowCache.write_day('NSW', day, flows_on(day).assign(date=day.strftime('%Y-%m-%d'), time='0800'))
+	days = flowCube.build_cube('NSW', '*', index, recent, date.today(), lambda day: flowCache.read_days('NSW', [day], '*'))
+	assert days == 1
+
+
+def test_cells_beyond_float32_precision_decode_exactly():
+	# With 4097 regions cell 4096 * 4097 + 4095 is odd and above 2**24, so float32 cannot represent it
+	large = riskEngine.RegionIndex(np.arange(4097) + 10000)
+	codes = large.codes
+	read_day = lambda day: pd.DataFrame({'LGA19_source': codes[[4096, 7]], 'LGA19_target': codes[[4095, 4096]], 'n_trips': [5, 7]})
+	flowCube.build_cube('NSW', '*', large, origin, origin, read_day, complete=lambda day: True)
+	flows = flowCube.range_matrix('NSW', '*', large, origin, origin)
+	assert (flows != riskEngine.od_matrix(read_day(origin), large)).nnz == 0
+
+
+def test_index_too_large_for_a_cube_is_refused():
+	with pytest.raises(ValueError):
+		flowCube.build_cube('NSW', '*', riskEngine.RegionIndex(np.arange(46341)), origin, origin, flows_on)
@@ -0,0 +1,60 @@
+import pytest
+from dashApp import flowDatabase
+
+
+class FakeCursor:
+	description = [('n',)]
+
+	def __init__(self, rows):
+		self.rows = rows
+		self.closed = False
+
+	def execute(self, query, params):
+		pass
+
+	def fetchmany(self, size):
+		batch, self.rows = self.rows[:size], self.rows[size:]
+		return batch
+
+	def close(self):
+		self.closed = True
+
+
+class FakeConnection:
+	def __init__(self):
+		self.cursors = []
+		self.closed = False
+
+	def cursor(self):
+		self.cursors.append(FakeCursor([(n,) for n in range(5)]))
+		return self.cursors[-1]
+
+	def close(self):
+		self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+	opened = []
+	def connect():
+		opened.append(FakeConnection())
+		return opened[-1]
+	monkeypatch.setattr(flowDatabase, 'pool', flowDatabase.ConnectionPool(connect, 1))
+	monkeypatch.setattr(flowDatabase, 'batch_size', 2)
+	return opened
+
+
+def test_exhausted_query_returns_connection(connections):
+	assert flowDatabase.run_query('SELECT', [])['n'].tolist() == [0, 1, 2, 3, 4]
+	flowDatabase.run_query('SELECT', [])
+	assert len(connections) == 1
+	assert all(cursor.closed for cursor in connections[0].cursors)
+
+
+def test_abandoned_query_drops_connection(connections):
+	batches = flowDatabase.iter_query('SELECT', [])
+	next(batches)
+	batches.close()
+	assert connections[0].cursors[0].closed and connections[0].closed
+	flowDatabase.run_query('SELECT', [])
+	assert len(connections) == 2
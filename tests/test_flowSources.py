@@ -0,0 +1,18 @@
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from dashApp import flowSources
+
+
+def test_flow_source_must_implement_chunks():
+	with pytest.raises(TypeError):
+		flowSources.FlowSource()
+
+
+def test_synthetic_day_does_not_depend_on_the_range():
+	source = flowSources.SyntheticSource(lambda region: [10050, 10180, 10250], edges_per_day=50)
+	day = date(2021, 2, 3)
+	alone = pd.concat(source.chunks('NSW', day, day), ignore_index=True)
+	in_range = pd.concat(source.chunks('NSW', day - timedelta(days=5), day), ignore_index=True)
+	in_range = in_range[in_range.date == day.isoformat()].reset_index(drop=True)
+	pd.testing.assert_frame_equal(alone, in_range)
@@ -0,0 +1,52 @@
+import gc, os, weakref
+import pytest
+from dashApp import flowDatabase, geometry, lazyData, metrics
+from dashApp.resultCache import ResultCache
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+
+
+def in_child(check):
+	"""Runs check() in a forked child and returns its exit status; a deadlock is ended by an alarm."""
+	pid = os.fork()
+	if pid == 0:
+		import signal
+		signal.alarm(5)
+		try:
+			os._exit(0 if check() else 1)
+		except BaseException:
+			os._exit(2)
+	return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+def test_locks_held_at_fork_are_usable_in_the_child():
+	lazy = lazyData.Lazy('fork test', lambda: 'loaded')
+	cache = ResultCache()
+	with lazy._lock, cache._lock, geometry._lock, metrics.callback_seconds._lock:  # As if other threads held them at the fork
+		status = in_child(lambda: lazy() == 'loaded' and cache.get_or_compute(('key',), lambda: 1) == 1
+			and geometry._lock.acquire(timeout=1) and metrics.callback_seconds._lock.acquire(timeout=1))
+	lazyData.resources.remove(lazy)
+	assert status == 0
+
+
+def test_child_gets_its_own_connection_pool():
+	parent_pool = flowDatabase.pool
+	assert in_child(lambda: flowDatabase.pool is not parent_pool) == 0
+	assert flowDatabase.pool is parent_pool
+
+
+class FakeConnection:
+	"""Stands in for a pyodbc connection, whose finaliser would disconnect the session it shares with the parent."""
+
+
+def test_parent_connections_are_never_finalised_in_the_child(monkeypatch):
+	connections = [FakeConnection()]
+	monkeypatch.setattr(flowDatabase, 'pool', flowDatabase.ConnectionPool(connections.pop, 1))
+	with flowDatabase.pool.connection() as conn:
+		alive = weakref.ref(conn)
+	del conn  # Only the pool holds the idle connection now
+
+	def check():
+		gc.collect()
+		return alive() is not None
+	assert in_child(check) == 0
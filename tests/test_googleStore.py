@@ -0,0 +1,9 @@
+import pytest
+from dashApp import googleStore
+
+
+def test_missing_data_fails_without_fetching(tmp_path, monkeypatch):
+	monkeypatch.setattr(googleStore, 'store_path', str(tmp_path / 'google_store.npz'))
+	monkeypatch.setattr(googleStore, 'csv_path', str(tmp_path / 'google_mobility_australia.csv'))
+	with pytest.raises(FileNotFoundError, match='download_google.py'):
+		googleStore.load_store(['parks_percent_change_from_baseline'])
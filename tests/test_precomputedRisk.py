@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from dashApp import flowCache, precomputedRisk
+
+settled_day = date.today() - timedelta(days=flowCache.settle_days + 1)
+recent_day = date.today() - timedelta(days=1)
+
+
+@pytest.fixture(autouse=True)
+def risk_dir(tmp_path, monkeypatch):
+	monkeypatch.setattr(precomputedRisk, 'risk_dir', str(tmp_path))
+
+
+def test_settled_map_is_served():
+	precomputedRisk.save('NSW', '*', settled_day, settled_day, [10050, 10180], [0.25, 0.75])
+	assert precomputedRisk.lookup('NSW', '*', settled_day, settled_day) == {10050: 0.25, 10180: 0.75}
+
+
+def test_map_of_unsettled_days_is_not_saved():
+	with pytest.raises(ValueError):
+		precomputedRisk.save('NSW', '*', recent_day, recent_day, [10050], [0.5])
+
+
+def test_map_computed_before_its_days_settled_is_ignored():
+	path = precomputedRisk.risk_path('NSW', '*', settled_day, settled_day)
+	precomputedRisk.save('NSW', '*', settled_day, settled_day, [10050], [0.5])
+	np.savez(path, codes=[10050], risk=[0.5], version=precomputedRisk.format_version, created=recent_day.isoformat())
+	assert precomputedRisk.lookup('NSW', '*', settled_day, settled_day) is None
+
+
+def test_map_without_a_version_is_ignored():
+	path = precomputedRisk.risk_path('NSW', '*', settled_day, settled_day)
+	precomputedRisk.save('NSW', '*', settled_day, settled_day, [10050], [0.5])
+	np.savez(path, codes=[10050], risk=[0.5])
+	assert precomputedRisk.lookup('NSW', '*', settled_day, settled_day) is None
@@ -0,0 +1,20 @@
+import os, time
+from dashApp.resultCache import ResultCache
+
+
+def test_directory_is_pruned_across_processes(tmp_path):
+	# Each cache stands in for a process that wrote to the shared directory before a restart
+	for start in range(0, 40, 10):
+		cache = ResultCache(max_size=10, path=str(tmp_path))
+		for n in range(start, start + 10):
+			cache.set(('key', n), n)
+	assert len(os.listdir(tmp_path)) <= 10
+	assert ResultCache(max_size=10, path=str(tmp_path)).get(('key', 39)) == 39
+
+
+def test_expired_files_are_removed(tmp_path):
+	ResultCache(max_size=10, ttl=60, path=str(tmp_path)).set(('old',), 1)
+	old = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+	os.utime(old, (time.time() - 120, time.time() - 120))
+	ResultCache(max_size=10, ttl=60, path=str(tmp_path))
+	assert os.listdir(tmp_path) == []
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+import pytest
+from dashApp.server import server
+from dashApp import riskApi
+
+
+def parse(**fields):
+	body = {'state': 1, 'start_date': '2021-02-01', 'end_date': '2021-02-03', 'scenarios': [{'locations': [10050]}]}
+	return riskApi.parse_scenarios(dict(body, **fields))
+
+
+def test_dates_are_clamped_to_the_flows():
+	scenario, = parse(start_date='2019-01-01', end_date='2020-05-03')
+	assert (scenario['start_date'], scenario['end_date']) == (date(2020, 5, 1), date(2020, 5, 3))
+	scenario, = parse(start_date=(date.today() - timedelta(days=3)).isoformat(), end_date='2999-01-01')
+	assert scenario['end_date'] == date.today() - timedelta(days=1)
+
+
+@pytest.mark.parametrize('fields', [
+	{'start_date': '2020-05-01', 'end_date': '2021-06-01'},
+	{'scenarios': [{'start_date': '2021-01-%02d' % day, 'end_date': '2021-02-01'} for day in range(1, 31)] * 2
+		+ [{'state': 2, 'start_date': '2021-01-%02d' % day, 'end_date': '2021-02-01'} for day in range(1, 31)]},
+	{'state': None},
+	{'state': '1x'},
+	{'scenarios': [{'locations': [None]}]},
+	{'scenarios': [{'locations': 10050}]},
+	{'scenarios': ['Albury']},
+	{'start_date': None},
+	{'end_date': 'yesterday'},
+])
+def test_invalid_or_expensive_requests_are_refused(fields):
+	with pytest.raises(ValueError):
+		parse(**fields)
+
+
+def test_batch_answers_bad_values_with_400():
+	with server.test_request_context('/api/risk/batch', method='POST', json={'state': None, 'start_date': '2021-02-01',
+			'end_date': '2021-02-03', 'scenarios': [{'locations': []}]}):
+		error, status = riskApi.risk_batch()
+	assert status == 400 and 'state' in error['error']
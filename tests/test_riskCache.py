@@ -0,0 +1,28 @@
+import os
+from datetime import date, timedelta
+import pytest
+from dashApp import facebookFunctions
+from dashApp.resultCache import ResultCache
+
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+	monkeypatch.setattr(facebookFunctions, 'risk_cache', ResultCache(path=str(tmp_path)))
+	monkeypatch.setattr(facebookFunctions, 'recent_risk_cache', ResultCache())
+	monkeypatch.setattr(facebookFunctions, 'get_fb_flows', lambda time, state, start_date, end_date: None)
+	monkeypatch.setattr(facebookFunctions, 'get_fb_risk', lambda flows, locations, state: {10050: 0.5})
+
+
+def estimate(end_date):
+	return facebookFunctions.get_fb_risk_estimate('*', 1, [10050], end_date - timedelta(days=6), end_date)
+
+
+def test_settled_estimate_is_persisted(tmp_path):
+	estimate(date.today() - timedelta(days=facebookFunctions.flowCache.settle_days + 1))
+	assert len(os.listdir(tmp_path)) == 1
+
+
+def test_estimate_of_unsettled_days_is_not_persisted(tmp_path):
+	assert estimate(date.today() - timedelta(days=1)) == {10050: 0.5}
+	assert os.listdir(tmp_path) == []
+	assert facebookFunctions.recent_risk_cache.stats()['size'] == 1
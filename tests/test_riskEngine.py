@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dashApp import facebookFunctions, riskEngine
+
+# Three NSW LGAs that all send and receive trips, a fourth with none, and a flow leaving the state
+flows = pd.DataFrame({'LGA19_source': [10050, 10050, 10180, 10180, 10250, 10250, 10050, 20110],
+	'LGA19_target': [10050, 10180, 10180, 10250, 10250, 10050, 20110, 10050],
+	'n_trips': [12, 3, 7, 5, 9, 2, 4, 6]})
+index = riskEngine.RegionIndex([10050, 10180, 10250, 10300])
+
+
+def baseline_risk(ODflows, locations, state):
+	"""The dense computation get_fb_risk made before the sparse engine: a pivot of the flows within the state."""
+	ODflows = ODflows[(ODflows.LGA19_source // 10000 == state) & (ODflows.LGA19_target // 10000 == state)]
+	ODmatrix = ODflows.pivot(values='n_trips', columns='LGA19_target', index='LGA19_source')
+	ODmatrix = ODmatrix.reindex(sorted(ODmatrix.columns), axis=1).sort_index().fillna(0)
+	if len(locations) == 0:
+		risk_vector = ODmatrix.sum(axis=0)
+		risk_vector = risk_vector / risk_vector.sum()
+	else:
+		p = np.array([1 if loc in locations else 0 for loc in ODmatrix.index])
+		risk_vector = np.matmul(ODmatrix.to_numpy(), p)
+		risk_vector = risk_vector / risk_vector.sum()
+	return dict(zip(ODmatrix.index, risk_vector))
+
+
+@pytest.fixture(autouse=True)
+def lga_indexes(monkeypatch):
+	monkeypatch.setattr(facebookFunctions, 'lga_indexes', lambda: {1: index})
+
+
+@pytest.mark.parametrize('locations', [[], [10050], [10180, 10250], [10050, 20110]])
+def test_matches_the_dense_baseline(locations):
+	risk = facebookFunctions.get_fb_risk(flows, locations, 1)
+	expected = baseline_risk(flows, locations, 1)
+	assert set(risk) == set(expected) | {10300}
+	assert np.allclose([risk[code] for code in expected], list(expected.values()))
+
+
+def test_regions_without_flows_have_no_risk():
+	assert facebookFunctions.get_fb_risk(flows, [10050], 1)[10300] == 0
+	assert riskEngine.risk_vector(riskEngine.od_matrix(flows, index), index, [10300]).tolist() == [0, 0, 0, 0]
+
+
+def test_state_without_flows_gives_zeros():
+	empty = riskEngine.od_matrix(flows.iloc[:0], index)
+	for locations in ([], [10050]):
+		assert riskEngine.risk_vector(empty, index, locations).tolist() == [0, 0, 0, 0]
+
+
+def test_prevalence_matrix_stacks_the_location_sets():
+	prevalence = riskEngine.prevalence_matrix(index, [[], [10050], [10180, 10250, 10180], [20110]]).toarray()
+	assert prevalence.tolist() == [[0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 1, 0], [0, 0, 0, 0]]
+
+
+def test_risk_matrix_matches_risk_vector_per_scenario():
+	ODmatrix = riskEngine.od_matrix(flows, index)
+	location_sets = [[], [10050], [10180, 10250], [10300], [20110]]
+	risk = riskEngine.risk_matrix(ODmatrix, index, location_sets)
+	assert risk.shape == (len(index), len(location_sets))
+	for column, locations in enumerate(location_sets):
+		assert np.allclose(risk[:, column], riskEngine.risk_vector(ODmatrix, index, locations))
+	assert riskEngine.risk_matrix(ODmatrix, index, []).shape == (len(index), 0)
@@ -0,0 +1,25 @@
+import json
+import numpy as np
+from dashApp import riskEngine, riskExport
+from dashApp.lgaRegistry import LGARegistry, StateLGAs
+
+codes = [40070, 40220, 40310]
+registry = LGARegistry({4: StateLGAs(riskEngine.RegionIndex(codes), ['Adelaide', 'Airport', 'Burnside'], [15.6, 9.8, 27.5],
+	[25000, np.nan, 46000], [34.5, np.nan, 44])})
+payload = {'ids': codes, 'index': {code: n for n, code in enumerate(codes)}, 'geojson': {'type': 'FeatureCollection',
+	'features': [{'type': 'Feature', 'id': code, 'geometry': {'type': 'Point', 'coordinates': [138.6, -34.9]}} for code in codes]}}
+
+
+def strict(constant):
+	raise ValueError('%s is not valid JSON' % constant)
+
+
+def test_geojson_writes_unknown_attributes_as_null(monkeypatch):
+	monkeypatch.setattr(riskExport, 'region_registry', lambda resolution: registry)
+	monkeypatch.setattr(riskExport, 'region_geometry', lambda resolution, state: payload)
+	text = ''.join(riskExport.export_chunks({40070: 0.5, 40220: 0.25, 40310: np.nan}, 4, 'geojson'))
+	exported = json.loads(text, parse_constant=strict)
+	properties = {feature['id']: feature['properties'] for feature in exported['features']}
+	assert properties[40070]['Population'] == 25000 and properties[40070]['Median Age'] == 34.5
+	assert properties[40220]['Population'] is None and properties[40220]['Median Age'] is None
+	assert properties[40220]['Risk Potential'] == 0.25 and properties[40310]['Risk Potential'] is None
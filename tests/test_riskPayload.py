@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from dashApp import riskEngine, riskPayload
+from dashApp.lgaRegistry import StateLGAs
+
+lgas = StateLGAs(riskEngine.RegionIndex([40070, 40220, 40310]), ['Adelaide', 'Airport', 'Burnside'], [1, 2, 3], [4, 5, 6], [7, 8, 9])
+
+
+def test_etag_depends_on_the_resolution():
+	lga = riskPayload.encode({40070: 0.5}, lgas, state=4, resolution='lga')
+	sa2 = riskPayload.encode({40070: 0.5}, lgas, state=4, resolution='sa2')
+	assert lga['data'] == sa2['data'] and lga['etag'] != sa2['etag']
+
+
+def test_round_trip_follows_the_registry_order():
+	payload = riskPayload.encode({40310: 0.25, 40070: 0.75, 99999: 1.0}, lgas, state=4, resolution='lga', locations=[40070])
+	values = riskPayload.decode(payload, lgas)
+	assert values.dtype == np.float32 and values.tolist() == [0.75, 0, 0.25]
+	assert payload['locations'] == [40070] and payload['state'] == 4
+
+
+def test_etag_follows_the_values():
+	first = riskPayload.encode({40070: 0.5, 40220: 0.5}, lgas, state=4)
+	assert riskPayload.encode({40220: 0.5, 40070: 0.5}, lgas, state=4, time='0800')['etag'] == first['etag']
+	assert riskPayload.encode({40070: 0.5, 40220: 0.25}, lgas, state=4)['etag'] != first['etag']
+	assert riskPayload.encode({40070: 0.5, 40220: 0.5}, lgas, state=1)['etag'] != first['etag']
+
+
+def test_payload_of_another_version_or_length_is_refused():
+	payload = riskPayload.encode({40070: 0.5}, lgas, state=4)
+	with pytest.raises(ValueError):
+		riskPayload.decode(dict(payload, v=0), lgas)
+	with pytest.raises(ValueError):
+		riskPayload.decode(payload, StateLGAs(riskEngine.RegionIndex([40070]), ['Adelaide'], [1], [4], [7]))
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import pytest
+from dashApp import geometry, riskEngine, sharedData
+from dashApp.lgaRegistry import LGARegistry, StateLGAs
+
+
+@pytest.fixture(autouse=True)
+def shared_dir(tmp_path, monkeypatch):
+	monkeypatch.setattr(sharedData, 'shared_dir', str(tmp_path / 'shared'))
+	monkeypatch.setattr(geometry, 'geometry_dir', str(tmp_path / 'geometry'))
+	monkeypatch.setattr(geometry, '_payloads', {})
+	yield
+	geometry.shared_payloads._loaded = False  # Drops what it mapped from tmp_path
+
+
+def test_registry_is_mapped_without_copying_names():
+	registry = LGARegistry({1: StateLGAs(riskEngine.RegionIndex([10050, 10180]), ['Albury', 'Armidale'], [1, 2], [3, 4], [5, 6]),
+		4: StateLGAs(riskEngine.RegionIndex([40070]), ['Adelaide'], [7], [8], [9])})
+	version = sharedData.publish('lga_registry', registry.arrays())
+	arrays, meta = sharedData.open_dataset('lga_registry', version)
+	indexes = LGARegistry.indexes_from_arrays(arrays)
+	assert {state: found.codes.tolist() for state, found in indexes.items()} == {1: [10050, 10180], 4: [40070]}
+	mapped = LGARegistry.from_arrays(arrays, indexes)
+	assert mapped[1].names.dtype.kind == 'U' and np.shares_memory(mapped[1].names, arrays['names'])
+	assert mapped[4].options == ({'label': 'Adelaide', 'value': 40070},)
+
+
+def test_published_payloads_are_used_without_the_files():
+	payload = {'ids': [10050], 'geojson': {'type': 'FeatureCollection', 'features': []}}
+	for level in range(len(geometry.lod_levels)):
+		geometry.write_payload('lga', 1, payload, level)
+	assert geometry.payloads_ready('lga', [1]) and not geometry.payloads_ready('lga', [2])
+	geometry.publish_payloads()
+	geometry.shared_payloads._loaded = False  # Picks up the new version straight away rather than after check_interval
+	for level in range(len(geometry.lod_levels)):
+		os.remove(geometry.payload_path('lga', 1, level))
+	assert geometry.load_payload('lga', 1)['index'] == {10050: 0}
+	assert geometry.payloads_ready('lga', [1])